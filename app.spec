@@ -1,4 +1,5 @@
 # -*- mode: python ; coding: utf-8 -*-
+from PyInstaller.utils.hooks import collect_submodules
 
 block_cipher = None
 
@@ -7,7 +8,8 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=["psycopg2"],
+    # src.adapter and src.service import their modules on first use, which the analysis cannot follow
+    hiddenimports=["psycopg2", *collect_submodules("src")],
     hookspath=[],
     runtime_hooks=[],
     excludes=[],
@@ -0,0 +1,80 @@
+"""Measures how long ppe takes to start, from source and from the frozen executable.
+
+Each measurement reports the median and worst wall time over --runs runs:
+
+    cli          ppe --help, a fresh process importing the entry point
+    job process  a job process started by ppe bench-spawn the way the runners start one, from start to exit, with the
+                 platform's start method and with spawn, which is what Windows uses
+
+With spawn, a job process started from source imports src/main.py from the top again before it runs, and one started
+by the frozen executable goes through multiprocessing.freeze_support, so both builds are measured.  The frozen
+executable is measured when it exists, by default at dist/ppe (dist/ppe.exe on Windows); build it with
+script/win/build-exe.cmd.  Time to the first dispatch depends on the database, and is logged by the scheduler as
+"First queue update took ... seconds."
+
+    python script/bench_startup.py --runs 20
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import pathlib
+import statistics
+import subprocess
+import sys
+import time
+
+_PROJECT_ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+def main() -> None:
+    default_exe = _PROJECT_ROOT / "dist" / ("ppe.exe" if sys.platform == "win32" else "ppe")
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--exe", type=pathlib.Path, default=default_exe, help="The frozen executable.")
+    args = parser.parse_args()
+
+    builds = [("source", [sys.executable, "-m", "src.main"])]
+    if args.exe.exists():
+        builds.append(("frozen", [str(args.exe)]))
+    else:
+        print(f"{args.exe} was not found, skipping the frozen executable.\n")
+
+    start_methods = list(dict.fromkeys([multiprocessing.get_start_method(), "spawn"]))
+
+    rows = []
+    for build, ppe in builds:
+        rows.append((build, "cli", _time(ppe + ["--help"], runs=args.runs)))
+        for start_method in start_methods:
+            rows.append((build, f"job process ({start_method})", _spawn(ppe, start_method=start_method, runs=args.runs)))
+
+    print(f"{'build':<8} {'measurement':<22} {'median ms':>10} {'max ms':>10}")
+    for build, name, seconds in rows:
+        print(f"{build:<8} {name:<22} {statistics.median(seconds) * 1000:>10.0f} {max(seconds) * 1000:>10.0f}")
+
+
+def _spawn(ppe: list[str], /, *, start_method: str, runs: int) -> list[float]:
+    output = subprocess.run(
+        ppe + ["bench-spawn", "--runs", str(runs), "--start-method", start_method],
+        cwd=_PROJECT_ROOT,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        check=True,
+        text=True,
+    ).stdout
+    return list(json.loads(output.splitlines()[-1])["seconds"])
+
+
+def _time(cmd: list[str], /, *, runs: int) -> list[float]:
+    seconds = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=_PROJECT_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+if __name__ == "__main__":
+    main()
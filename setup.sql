@@ -11,8 +11,16 @@ CREATE TABLE ppe.task (
 ,   task_sql TEXT NULL CHECK (task_sql IS NULL OR length(trim(task_sql)) > 0)
 ,   retries INT NOT NULL CHECK (retries >= 0)
 ,   timeout_seconds INT NULL CHECK (timeout_seconds IS NULL OR timeout_seconds > 0)
+,   conda_env TEXT NULL CHECK (conda_env IS NULL OR length(trim(conda_env)) > 0)
+,   project_name TEXT NULL CHECK (project_name IS NULL OR length(trim(project_name)) > 0)
+,   fn TEXT NULL CHECK (fn IS NULL OR length(trim(fn)) > 0)
+,   fn_args JSONB NULL CHECK (fn_args IS NULL OR jsonb_typeof(fn_args) = 'object')
+,   sql_target TEXT NULL CHECK (sql_target IS NULL OR length(trim(sql_target)) > 0)
+,   fingerprint_sql TEXT NULL CHECK (fingerprint_sql IS NULL OR length(trim(fingerprint_sql)) > 0)
 ,   enabled BOOL NOT NULL DEFAULT TRUE
 ,   UNIQUE (task_name)
+,   CHECK ((conda_env IS NULL) = (project_name IS NULL))
+,   CHECK (sql_target IS NULL OR task_sql IS NOT NULL)
 );
 
 CREATE FUNCTION ppe.create_task(
@@ -23,6 +31,12 @@ CREATE FUNCTION ppe.create_task(
 ,   p_retries INT = 0
 ,   p_enabled BOOL = TRUE
 ,   p_timeout_seconds INT = NULL
+,   p_conda_env TEXT = NULL
+,   p_project_name TEXT = NULL
+,   p_fn TEXT = NULL
+,   p_fn_args JSONB = NULL
+,   p_sql_target TEXT = NULL
+,   p_fingerprint_sql TEXT = NULL
 )
 RETURNS INT
 AS $$
@@ -30,8 +44,10 @@ DECLARE
     v_result INT;
     v_tool_args TEXT[];
 BEGIN
-    ASSERT p_tool IS NOT NULL OR p_task_sql IS NOT NULL, 'Either p_tool or p_task_sql must be provided';
+    ASSERT p_tool IS NOT NULL OR p_task_sql IS NOT NULL OR p_conda_env IS NOT NULL, 'Either p_tool, p_task_sql or p_conda_env must be provided';
+    ASSERT (p_conda_env IS NULL) = (p_project_name IS NULL), 'p_conda_env and p_project_name must be provided together.';
     ASSERT p_timeout_seconds IS NULL OR p_timeout_seconds > 0, 'If p_timeout_seconds is provided, then it must be > 0.';
+    ASSERT p_sql_target IS NULL OR p_task_sql IS NOT NULL, 'p_sql_target can only be provided along with p_task_sql.';
 
     IF p_tool IS NULL THEN
         v_tool_args = NULL;
@@ -52,6 +68,12 @@ BEGIN
         ,   task_sql
         ,   retries
         ,   timeout_seconds
+        ,   conda_env
+        ,   project_name
+        ,   fn
+        ,   fn_args
+        ,   sql_target
+        ,   fingerprint_sql
         ,   enabled
         ) VALUES (
             p_task_name
@@ -60,6 +82,12 @@ BEGIN
         ,   p_task_sql
         ,   COALESCE(p_retries, 0)
         ,   p_timeout_seconds
+        ,   p_conda_env
+        ,   p_project_name
+        ,   p_fn
+        ,   p_fn_args
+        ,   p_sql_target
+        ,   p_fingerprint_sql
         ,   COALESCE(p_enabled, TRUE)
         )
         RETURNING task_id
@@ -133,6 +161,32 @@ BEGIN
 END;
 $$;
 
+-- What a running task reserves: its ppe.task_resource rows, plus 1 unit of the resource named after its sql_target
+-- unless it already lists that resource.  A target's resource capacity therefore caps the jobs running against it.
+CREATE VIEW ppe.task_resource_demand AS
+SELECT
+    tr.task_id
+,   tr.resource_id
+,   tr.units
+FROM ppe.task_resource AS tr
+UNION ALL
+SELECT
+    t.task_id
+,   r.resource_id
+,   1 AS units
+FROM ppe.task AS t
+JOIN ppe.resource AS r
+    ON t.sql_target = r.resource_name
+WHERE
+    NOT EXISTS (
+        SELECT 1
+        FROM ppe.task_resource AS tr
+        WHERE
+            t.task_id = tr.task_id
+            AND r.resource_id = tr.resource_id
+    )
+;
+
 CREATE TABLE ppe.schedule (
     schedule_id SERIAL PRIMARY KEY
 ,   schedule_name TEXT NOT NULL
@@ -250,9 +304,437 @@ END;
 $$
 LANGUAGE plpgsql;
 
+-- Creates the session's staging tables for ppe.import_catalog.  They are dropped when the transaction ends.
+CREATE OR REPLACE PROCEDURE ppe.stage_catalog()
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    CREATE TEMPORARY TABLE ppe_catalog_resource (
+        resource_name TEXT
+    ,   capacity INT
+    ,   enabled BOOL
+    ) ON COMMIT DROP;
+
+    CREATE TEMPORARY TABLE ppe_catalog_schedule (
+        schedule_name TEXT
+    ,   min_seconds_between_attempts INT
+    ,   start_ts TIMESTAMPTZ(0)
+    ,   end_ts TIMESTAMPTZ(0)
+    ,   start_month INT
+    ,   end_month INT
+    ,   start_month_day INT
+    ,   end_month_day INT
+    ,   start_week_day INT
+    ,   end_week_day INT
+    ,   start_hour INT
+    ,   end_hour INT
+    ,   start_minute INT
+    ,   end_minute INT
+    ) ON COMMIT DROP;
+
+    CREATE TEMPORARY TABLE ppe_catalog_task (
+        task_name TEXT
+    ,   tool TEXT
+    ,   tool_args JSONB
+    ,   task_sql TEXT
+    ,   retries INT
+    ,   timeout_seconds INT
+    ,   conda_env TEXT
+    ,   project_name TEXT
+    ,   fn TEXT
+    ,   fn_args JSONB
+    ,   sql_target TEXT
+    ,   fingerprint_sql TEXT
+    ,   enabled BOOL
+    ) ON COMMIT DROP;
+
+    CREATE TEMPORARY TABLE ppe_catalog_task_schedule (
+        task_name TEXT
+    ,   schedule_name TEXT
+    ) ON COMMIT DROP;
+
+    CREATE TEMPORARY TABLE ppe_catalog_task_resource (
+        task_name TEXT
+    ,   resource_name TEXT
+    ,   units INT
+    ) ON COMMIT DROP;
+END;
+$$;
+
+-- Validates the staged catalog as a whole, then upserts it.  Rows that did not change are left alone, and the
+-- schedules and resources of each staged task are replaced with the staged ones.  With p_prune, tasks and resources
+-- missing from the manifest are disabled rather than deleted, since their job history refers to them.
+CREATE OR REPLACE FUNCTION ppe.import_catalog(
+    p_prune BOOL = FALSE
+)
+RETURNS TABLE (
+    entity TEXT
+,   inserted INT
+,   updated INT
+,   disabled INT
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_problems TEXT;
+    v_inserted INT;
+    v_updated INT;
+    v_disabled INT;
+BEGIN
+    WITH problem AS (
+        SELECT FORMAT('resource %L is listed %s times', resource_name, COUNT(*)) AS message
+        FROM ppe_catalog_resource
+        GROUP BY resource_name
+        HAVING COUNT(*) > 1
+        UNION ALL
+        SELECT FORMAT('resource %L needs a capacity > 0', resource_name)
+        FROM ppe_catalog_resource
+        WHERE COALESCE(capacity, 0) <= 0
+        UNION ALL
+        SELECT FORMAT('schedule %L is listed %s times', schedule_name, COUNT(*))
+        FROM ppe_catalog_schedule
+        GROUP BY schedule_name
+        HAVING COUNT(*) > 1
+        UNION ALL
+        SELECT FORMAT('schedule %L needs min_seconds_between_attempts > 0', schedule_name)
+        FROM ppe_catalog_schedule
+        WHERE COALESCE(min_seconds_between_attempts, 0) <= 0
+        UNION ALL
+        SELECT FORMAT('schedule %L has a %s range that ends before it starts', s.schedule_name, r.part)
+        FROM ppe_catalog_schedule AS s
+        CROSS JOIN LATERAL (
+            VALUES
+                ('month', COALESCE(s.start_month, 1), COALESCE(s.end_month, 12))
+            ,   ('month day', COALESCE(s.start_month_day, 1), COALESCE(s.end_month_day, 31))
+            ,   ('week day', COALESCE(s.start_week_day, 1), COALESCE(s.end_week_day, 7))
+            ,   ('hour', COALESCE(s.start_hour, 1), COALESCE(s.end_hour, 23))
+            ,   ('minute', COALESCE(s.start_minute, 1), COALESCE(s.end_minute, 59))
+        ) AS r (part, range_start, range_end)
+        WHERE r.range_end < r.range_start
+        UNION ALL
+        SELECT FORMAT('task %L is listed %s times', task_name, COUNT(*))
+        FROM ppe_catalog_task
+        GROUP BY task_name
+        HAVING COUNT(*) > 1
+        UNION ALL
+        SELECT FORMAT('task %L needs a tool, task_sql or conda_env', task_name)
+        FROM ppe_catalog_task
+        WHERE tool IS NULL AND task_sql IS NULL AND conda_env IS NULL
+        UNION ALL
+        SELECT FORMAT('task %L needs conda_env and project_name together', task_name)
+        FROM ppe_catalog_task
+        WHERE (conda_env IS NULL) <> (project_name IS NULL)
+        UNION ALL
+        SELECT FORMAT('task %L has tool_args that are not a list', task_name)
+        FROM ppe_catalog_task
+        WHERE tool_args IS NOT NULL AND jsonb_typeof(tool_args) <> 'array'
+        UNION ALL
+        SELECT FORMAT('task %L has a sql_target but no task_sql', task_name)
+        FROM ppe_catalog_task
+        WHERE sql_target IS NOT NULL AND task_sql IS NULL
+        UNION ALL
+        SELECT FORMAT('task %L refers to unknown schedule %L', ts.task_name, ts.schedule_name)
+        FROM ppe_catalog_task_schedule AS ts
+        WHERE
+            NOT EXISTS (SELECT 1 FROM ppe_catalog_schedule AS s WHERE ts.schedule_name = s.schedule_name)
+            AND NOT EXISTS (SELECT 1 FROM ppe.schedule AS s WHERE ts.schedule_name = s.schedule_name)
+        UNION ALL
+        SELECT FORMAT('task %L refers to unknown resource %L', tr.task_name, tr.resource_name)
+        FROM ppe_catalog_task_resource AS tr
+        WHERE
+            NOT EXISTS (SELECT 1 FROM ppe_catalog_resource AS r WHERE tr.resource_name = r.resource_name)
+            AND NOT EXISTS (SELECT 1 FROM ppe.resource AS r WHERE tr.resource_name = r.resource_name)
+        UNION ALL
+        SELECT FORMAT('%L is assigned to task %L, which is not in the manifest', x.name, x.task_name)
+        FROM (
+            SELECT ts.task_name, ts.schedule_name AS name FROM ppe_catalog_task_schedule AS ts
+            UNION ALL
+            SELECT tr.task_name, tr.resource_name FROM ppe_catalog_task_resource AS tr
+        ) AS x
+        WHERE NOT EXISTS (SELECT 1 FROM ppe_catalog_task AS t WHERE x.task_name = t.task_name)
+        UNION ALL
+        SELECT FORMAT('task %L needs units > 0 of resource %L', task_name, resource_name)
+        FROM ppe_catalog_task_resource
+        WHERE COALESCE(units, 0) <= 0
+    )
+    SELECT string_agg('  - ' || p.message, E'\n' ORDER BY p.message)
+    INTO v_problems
+    FROM problem AS p;
+
+    IF v_problems IS NOT NULL THEN
+        RAISE EXCEPTION E'The catalog manifest is invalid:\n%', v_problems;
+    END IF;
+
+    -- resources
+    WITH upserted AS (
+        INSERT INTO ppe.resource AS r (resource_name, capacity, enable_flag)
+        SELECT s.resource_name, s.capacity, COALESCE(s.enabled, TRUE)
+        FROM ppe_catalog_resource AS s
+        ON CONFLICT (resource_name) DO UPDATE
+        SET
+            capacity = EXCLUDED.capacity
+        ,   enable_flag = EXCLUDED.enable_flag
+        WHERE
+            (r.capacity, r.enable_flag) IS DISTINCT FROM (EXCLUDED.capacity, EXCLUDED.enable_flag)
+        RETURNING (xmax = 0) AS is_new
+    )
+    SELECT COUNT(*) FILTER (WHERE is_new), COUNT(*) FILTER (WHERE NOT is_new)
+    INTO v_inserted, v_updated
+    FROM upserted;
+
+    v_disabled = 0;
+    IF p_prune THEN
+        UPDATE ppe.resource AS r
+        SET enable_flag = FALSE
+        WHERE
+            r.enable_flag
+            AND NOT EXISTS (SELECT 1 FROM ppe_catalog_resource AS s WHERE r.resource_name = s.resource_name);
+        GET DIAGNOSTICS v_disabled = ROW_COUNT;
+    END IF;
+
+    entity := 'resource'; inserted := v_inserted; updated := v_updated; disabled := v_disabled;
+    RETURN NEXT;
+
+    -- schedules
+    WITH upserted AS (
+        INSERT INTO ppe.schedule AS t (
+            schedule_name
+        ,   min_seconds_between_attempts
+        ,   start_ts
+        ,   end_ts
+        ,   start_month
+        ,   end_month
+        ,   start_month_day
+        ,   end_month_day
+        ,   start_week_day
+        ,   end_week_day
+        ,   start_hour
+        ,   end_hour
+        ,   start_minute
+        ,   end_minute
+        )
+        SELECT
+            s.schedule_name
+        ,   s.min_seconds_between_attempts
+        ,   COALESCE(s.start_ts, '1900-01-01 +0')
+        ,   COALESCE(s.end_ts, '9999-12-31 +0')
+        ,   COALESCE(s.start_month, 1)
+        ,   COALESCE(s.end_month, 12)
+        ,   COALESCE(s.start_month_day, 1)
+        ,   COALESCE(s.end_month_day, 31)
+        ,   COALESCE(s.start_week_day, 1)
+        ,   COALESCE(s.end_week_day, 7)
+        ,   COALESCE(s.start_hour, 1)
+        ,   COALESCE(s.end_hour, 23)
+        ,   COALESCE(s.start_minute, 1)
+        ,   COALESCE(s.end_minute, 59)
+        FROM ppe_catalog_schedule AS s
+        ON CONFLICT (schedule_name) DO UPDATE
+        SET
+            min_seconds_between_attempts = EXCLUDED.min_seconds_between_attempts
+        ,   start_ts = EXCLUDED.start_ts
+        ,   end_ts = EXCLUDED.end_ts
+        ,   start_month = EXCLUDED.start_month
+        ,   end_month = EXCLUDED.end_month
+        ,   start_month_day = EXCLUDED.start_month_day
+        ,   end_month_day = EXCLUDED.end_month_day
+        ,   start_week_day = EXCLUDED.start_week_day
+        ,   end_week_day = EXCLUDED.end_week_day
+        ,   start_hour = EXCLUDED.start_hour
+        ,   end_hour = EXCLUDED.end_hour
+        ,   start_minute = EXCLUDED.start_minute
+        ,   end_minute = EXCLUDED.end_minute
+        WHERE
+            (
+                t.min_seconds_between_attempts, t.start_ts, t.end_ts, t.start_month, t.end_month, t.start_month_day
+            ,   t.end_month_day, t.start_week_day, t.end_week_day, t.start_hour, t.end_hour, t.start_minute, t.end_minute
+            ) IS DISTINCT FROM (
+                EXCLUDED.min_seconds_between_attempts, EXCLUDED.start_ts, EXCLUDED.end_ts, EXCLUDED.start_month
+            ,   EXCLUDED.end_month, EXCLUDED.start_month_day, EXCLUDED.end_month_day, EXCLUDED.start_week_day
+            ,   EXCLUDED.end_week_day, EXCLUDED.start_hour, EXCLUDED.end_hour, EXCLUDED.start_minute, EXCLUDED.end_minute
+            )
+        RETURNING (xmax = 0) AS is_new
+    )
+    SELECT COUNT(*) FILTER (WHERE is_new), COUNT(*) FILTER (WHERE NOT is_new)
+    INTO v_inserted, v_updated
+    FROM upserted;
+
+    entity := 'schedule'; inserted := v_inserted; updated := v_updated; disabled := 0;
+    RETURN NEXT;
+
+    -- tasks
+    WITH upserted AS (
+        INSERT INTO ppe.task AS t (
+            task_name
+        ,   tool
+        ,   tool_args
+        ,   task_sql
+        ,   retries
+        ,   timeout_seconds
+        ,   conda_env
+        ,   project_name
+        ,   fn
+        ,   fn_args
+        ,   sql_target
+        ,   fingerprint_sql
+        ,   enabled
+        )
+        SELECT
+            s.task_name
+        ,   s.tool
+        ,   CASE
+                WHEN s.tool IS NULL OR jsonb_array_length(COALESCE(s.tool_args, '[]')) = 0 THEN NULL
+                ELSE ARRAY(SELECT jsonb_array_elements_text(s.tool_args))
+            END
+        ,   s.task_sql
+        ,   COALESCE(s.retries, 0)
+        ,   s.timeout_seconds
+        ,   s.conda_env
+        ,   s.project_name
+        ,   s.fn
+        ,   s.fn_args
+        ,   s.sql_target
+        ,   s.fingerprint_sql
+        ,   COALESCE(s.enabled, TRUE)
+        FROM ppe_catalog_task AS s
+        ON CONFLICT (task_name) DO UPDATE
+        SET
+            tool = EXCLUDED.tool
+        ,   tool_args = EXCLUDED.tool_args
+        ,   task_sql = EXCLUDED.task_sql
+        ,   retries = EXCLUDED.retries
+        ,   timeout_seconds = EXCLUDED.timeout_seconds
+        ,   conda_env = EXCLUDED.conda_env
+        ,   project_name = EXCLUDED.project_name
+        ,   fn = EXCLUDED.fn
+        ,   fn_args = EXCLUDED.fn_args
+        ,   sql_target = EXCLUDED.sql_target
+        ,   fingerprint_sql = EXCLUDED.fingerprint_sql
+        ,   enabled = EXCLUDED.enabled
+        WHERE
+            (
+                t.tool, t.tool_args, t.task_sql, t.retries, t.timeout_seconds, t.conda_env, t.project_name, t.fn
+            ,   t.fn_args, t.sql_target, t.fingerprint_sql, t.enabled
+            ) IS DISTINCT FROM (
+                EXCLUDED.tool, EXCLUDED.tool_args, EXCLUDED.task_sql, EXCLUDED.retries, EXCLUDED.timeout_seconds
+            ,   EXCLUDED.conda_env, EXCLUDED.project_name, EXCLUDED.fn, EXCLUDED.fn_args, EXCLUDED.sql_target
+            ,   EXCLUDED.fingerprint_sql, EXCLUDED.enabled
+            )
+        RETURNING (xmax = 0) AS is_new
+    )
+    SELECT COUNT(*) FILTER (WHERE is_new), COUNT(*) FILTER (WHERE NOT is_new)
+    INTO v_inserted, v_updated
+    FROM upserted;
+
+    v_disabled = 0;
+    IF p_prune THEN
+        UPDATE ppe.task AS t
+        SET enabled = FALSE
+        WHERE
+            t.enabled
+            AND NOT EXISTS (SELECT 1 FROM ppe_catalog_task AS s WHERE t.task_name = s.task_name);
+        GET DIAGNOSTICS v_disabled = ROW_COUNT;
+    END IF;
+
+    entity := 'task'; inserted := v_inserted; updated := v_updated; disabled := v_disabled;
+    RETURN NEXT;
+
+    -- task schedules
+    DELETE FROM ppe.task_schedule AS ts
+    USING ppe.task AS t, ppe.schedule AS s
+    WHERE
+        ts.task_id = t.task_id
+        AND ts.schedule_id = s.schedule_id
+        AND EXISTS (SELECT 1 FROM ppe_catalog_task AS c WHERE t.task_name = c.task_name)
+        AND NOT EXISTS (
+            SELECT 1
+            FROM ppe_catalog_task_schedule AS c
+            WHERE
+                t.task_name = c.task_name
+                AND s.schedule_name = c.schedule_name
+        );
+    GET DIAGNOSTICS v_disabled = ROW_COUNT;
+
+    INSERT INTO ppe.task_schedule (task_id, schedule_id)
+    SELECT DISTINCT t.task_id, s.schedule_id
+    FROM ppe_catalog_task_schedule AS c
+    JOIN ppe.task AS t
+        ON c.task_name = t.task_name
+    JOIN ppe.schedule AS s
+        ON c.schedule_name = s.schedule_name
+    ON CONFLICT DO NOTHING;
+    GET DIAGNOSTICS v_inserted = ROW_COUNT;
+
+    entity := 'task_schedule'; inserted := v_inserted; updated := 0; disabled := v_disabled;
+    RETURN NEXT;
+
+    -- task resources
+    DELETE FROM ppe.task_resource AS tr
+    USING ppe.task AS t, ppe.resource AS r
+    WHERE
+        tr.task_id = t.task_id
+        AND tr.resource_id = r.resource_id
+        AND EXISTS (SELECT 1 FROM ppe_catalog_task AS c WHERE t.task_name = c.task_name)
+        AND NOT EXISTS (
+            SELECT 1
+            FROM ppe_catalog_task_resource AS c
+            WHERE
+                t.task_name = c.task_name
+                AND r.resource_name = c.resource_name
+        );
+    GET DIAGNOSTICS v_disabled = ROW_COUNT;
+
+    WITH upserted AS (
+        INSERT INTO ppe.task_resource AS tr (task_id, resource_id, units)
+        SELECT t.task_id, r.resource_id, MAX(c.units)
+        FROM ppe_catalog_task_resource AS c
+        JOIN ppe.task AS t
+            ON c.task_name = t.task_name
+        JOIN ppe.resource AS r
+            ON c.resource_name = r.resource_name
+        GROUP BY
+            t.task_id
+        ,   r.resource_id
+        ON CONFLICT (task_id, resource_id) DO UPDATE
+        SET units = EXCLUDED.units
+        WHERE tr.units IS DISTINCT FROM EXCLUDED.units
+        RETURNING (xmax = 0) AS is_new
+    )
+    SELECT COUNT(*) FILTER (WHERE is_new), COUNT(*) FILTER (WHERE NOT is_new)
+    INTO v_inserted, v_updated
+    FROM upserted;
+
+    -- checked against the final catalog, since either side of it may have come from the manifest
+    SELECT string_agg(
+        FORMAT('  - task %L needs %s units of resource %L, which only has %s', t.task_name, tr.units, r.resource_name, r.capacity)
+    ,   E'\n'
+        ORDER BY t.task_name, r.resource_name
+    )
+    INTO v_problems
+    FROM ppe.task_resource AS tr
+    JOIN ppe.task AS t
+        ON tr.task_id = t.task_id
+    JOIN ppe.resource AS r
+        ON tr.resource_id = r.resource_id
+    WHERE
+        tr.units > r.capacity;
+
+    IF v_problems IS NOT NULL THEN
+        RAISE EXCEPTION E'The catalog manifest is invalid:\n%', v_problems;
+    END IF;
+
+    entity := 'task_resource'; inserted := v_inserted; updated := v_updated; disabled := v_disabled;
+    RETURN NEXT;
+END;
+$$;
+
+-- heartbeat_ts is refreshed while the batch runs and end_ts is set once it has stopped, so a new batch can tell jobs a
+-- batch is still finishing from jobs that were abandoned.
 CREATE TABLE ppe.batch (
     batch_id SERIAL PRIMARY KEY
 ,   ts TIMESTAMPTZ(0) NOT NULL DEFAULT now()
+,   heartbeat_ts TIMESTAMPTZ(0) NOT NULL DEFAULT now()
+,   end_ts TIMESTAMPTZ(0) NULL
 );
 
 CREATE FUNCTION ppe.create_batch ()
@@ -264,6 +746,28 @@ AS $$
 $$
 LANGUAGE sql;
 
+CREATE PROCEDURE ppe.batch_heartbeat (
+    p_batch_id INT
+)
+AS $$
+    UPDATE ppe.batch
+    SET heartbeat_ts = now()
+    WHERE batch_id = p_batch_id;
+$$
+LANGUAGE sql;
+
+CREATE PROCEDURE ppe.end_batch (
+    p_batch_id INT
+)
+AS $$
+    UPDATE ppe.batch
+    SET end_ts = now()
+    WHERE
+        batch_id = p_batch_id
+        AND end_ts IS NULL;
+$$
+LANGUAGE sql;
+
 CREATE TABLE ppe.job (
     job_id SERIAL PRIMARY KEY
 ,   batch_id INT NOT NULL REFERENCES ppe.batch (batch_id)
@@ -350,66 +854,235 @@ CREATE TABLE ppe.job_success (
 ,   ts TIMESTAMPTZ(0) NOT NULL DEFAULT now()
 );
 
-CREATE PROCEDURE ppe.cancel_running_jobs(
-    p_reason TEXT
-) AS
-$$
-    INSERT INTO ppe.job_cancel (
-        job_id
-    ,   reason
-    )
+-- What the job's process tree used.  Columns other than wall_millis are NULL where the platform does not report them.
+CREATE TABLE ppe.job_resource_usage (
+    job_id INT PRIMARY KEY REFERENCES ppe.job (job_id)
+,   wall_millis BIGINT NOT NULL CHECK (wall_millis >= 0)
+,   user_cpu_millis BIGINT NULL CHECK (user_cpu_millis >= 0)
+,   system_cpu_millis BIGINT NULL CHECK (system_cpu_millis >= 0)
+,   peak_rss_kb BIGINT NULL CHECK (peak_rss_kb >= 0)
+,   block_reads BIGINT NULL CHECK (block_reads >= 0)
+,   block_writes BIGINT NULL CHECK (block_writes >= 0)
+,   voluntary_context_switches BIGINT NULL CHECK (voluntary_context_switches >= 0)
+,   involuntary_context_switches BIGINT NULL CHECK (involuntary_context_switches >= 0)
+,   ts TIMESTAMPTZ(0) NOT NULL DEFAULT now()
+);
+
+-- The fingerprint of a job's inputs as it was dispatched, along with a hash of the task definition it ran.
+CREATE TABLE ppe.job_fingerprint (
+    job_id INT PRIMARY KEY REFERENCES ppe.job (job_id)
+,   fingerprint TEXT NOT NULL
+,   task_md5 TEXT NOT NULL
+,   ts TIMESTAMPTZ(0) NOT NULL DEFAULT now()
+);
+
+-- Whether a job has already been recorded as succeeded, failed, cancelled or skipped.  The procedures that record a
+-- job's result do nothing for a job that has one, so a result replayed from ppe's local journal is only counted once.
+CREATE OR REPLACE FUNCTION ppe.job_has_result(
+    p_job_id INT
+)
+RETURNS BOOL
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        EXISTS (SELECT 1 FROM ppe.job_success AS e WHERE e.job_id = p_job_id)
+        OR EXISTS (SELECT 1 FROM ppe.job_failure AS f WHERE f.job_id = p_job_id)
+        OR EXISTS (SELECT 1 FROM ppe.job_cancel AS c WHERE c.job_id = p_job_id)
+        OR EXISTS (SELECT 1 FROM ppe.job_skip AS s WHERE s.job_id = p_job_id);
+$$;
+
+-- Records the fingerprint of a job's inputs, and skips the job when the task's latest finished job succeeded, or was
+-- itself skipped, with the same fingerprint and the same task definition.  A skipped job carries the fingerprint
+-- forward, so a task whose inputs never change is not rerun when old logs are deleted.  Returns whether it skipped.
+CREATE OR REPLACE FUNCTION ppe.skip_job_if_unchanged(
+    p_job_id INT
+,   p_fingerprint TEXT
+)
+RETURNS BOOL
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_task_id INT = (SELECT j.task_id FROM ppe.job AS j WHERE j.job_id = p_job_id);
+    v_task_md5 TEXT;
+    v_previous_job_id INT;
+    v_previous_succeeded BOOL;
+    v_previous_fingerprint TEXT;
+    v_previous_task_md5 TEXT;
+BEGIN
+    ASSERT v_task_id IS NOT NULL, FORMAT('job_id %s does not exist.', p_job_id);
+
+    IF p_fingerprint IS NULL THEN
+        RETURN FALSE;
+    END IF;
+
+    v_task_md5 = (
+        SELECT
+            md5(jsonb_build_array(
+                t.tool, t.tool_args, t.task_sql, t.conda_env, t.project_name, t.fn, t.fn_args, t.sql_target
+            ,   t.fingerprint_sql
+            )::TEXT)
+        FROM ppe.task AS t
+        WHERE t.task_id = v_task_id
+    );
+
+    INSERT INTO ppe.job_fingerprint (job_id, fingerprint, task_md5)
+    VALUES (p_job_id, p_fingerprint, v_task_md5);
+
     SELECT
         j.job_id
-    ,   p_reason
+    ,   EXISTS (SELECT 1 FROM ppe.job_success AS s WHERE j.job_id = s.job_id)
+        OR EXISTS (SELECT 1 FROM ppe.job_skip AS s WHERE j.job_id = s.job_id)
+    ,   jf.fingerprint
+    ,   jf.task_md5
+    INTO
+        v_previous_job_id
+    ,   v_previous_succeeded
+    ,   v_previous_fingerprint
+    ,   v_previous_task_md5
     FROM ppe.job AS j
+    LEFT JOIN ppe.job_fingerprint AS jf
+        ON j.job_id = jf.job_id
     WHERE
-        NOT EXISTS (
-            SELECT 1
-            FROM ppe.job_cancel AS c
-            WHERE
-                j.job_id = c.job_id
-        )
-        AND NOT EXISTS (
-            SELECT 1
-            FROM ppe.job_failure AS f
-            WHERE
-                j.job_id = f.job_id
-        )
-        AND NOT EXISTS (
-            SELECT 1
-            FROM ppe.job_skip AS s
-            WHERE
-            j.job_id = s.job_id
+        j.task_id = v_task_id
+        AND j.job_id < p_job_id
+        AND (
+            EXISTS (SELECT 1 FROM ppe.job_success AS s WHERE j.job_id = s.job_id)
+            OR EXISTS (SELECT 1 FROM ppe.job_skip AS s WHERE j.job_id = s.job_id)
+            OR EXISTS (SELECT 1 FROM ppe.job_failure AS f WHERE j.job_id = f.job_id)
+            OR EXISTS (SELECT 1 FROM ppe.job_cancel AS c WHERE j.job_id = c.job_id)
         )
-        AND NOT EXISTS (
-            SELECT 1
-            FROM ppe.job_success AS e
-            WHERE
-            j.job_id = e.job_id
+    ORDER BY
+        j.job_id DESC
+    LIMIT 1;
+
+    IF
+        NOT COALESCE(v_previous_succeeded, FALSE)
+        OR v_previous_fingerprint IS DISTINCT FROM p_fingerprint
+        OR v_previous_task_md5 IS DISTINCT FROM v_task_md5
+    THEN
+        RETURN FALSE;
+    END IF;
+
+    INSERT INTO ppe.job_skip (job_id, reason)
+    VALUES (p_job_id, FORMAT('The inputs have not changed since job %s.', v_previous_job_id));
+
+    CALL ppe.update_task_rollups(p_job_id := p_job_id, p_outcome := 'skip');
+
+    RETURN TRUE;
+END;
+$$;
+
+-- Cancels every unfinished job, or with p_current_batch_id, only the unfinished jobs of other batches that have ended
+-- or have not sent a heartbeat for p_seconds_before_abandoned.  Jobs a draining batch is still finishing are left alone.
+CREATE PROCEDURE ppe.cancel_running_jobs(
+    p_reason TEXT
+,   p_current_batch_id INT = NULL
+,   p_seconds_before_abandoned INT = 300
+) AS
+$$
+DECLARE
+    v_job_id INT;
+BEGIN
+    FOR v_job_id IN
+        INSERT INTO ppe.job_cancel (
+            job_id
+        ,   reason
         )
-    ;
+        SELECT
+            j.job_id
+        ,   p_reason
+        FROM ppe.job AS j
+        WHERE
+            NOT EXISTS (
+                SELECT 1
+                FROM ppe.job_cancel AS c
+                WHERE
+                    j.job_id = c.job_id
+            )
+            AND NOT EXISTS (
+                SELECT 1
+                FROM ppe.job_failure AS f
+                WHERE
+                    j.job_id = f.job_id
+            )
+            AND NOT EXISTS (
+                SELECT 1
+                FROM ppe.job_skip AS s
+                WHERE
+                j.job_id = s.job_id
+            )
+            AND NOT EXISTS (
+                SELECT 1
+                FROM ppe.job_success AS e
+                WHERE
+                j.job_id = e.job_id
+            )
+            AND (
+                p_current_batch_id IS NULL
+                OR EXISTS (
+                    SELECT 1
+                    FROM ppe.batch AS b
+                    WHERE
+                        j.batch_id = b.batch_id
+                        AND b.batch_id <> p_current_batch_id
+                        AND (
+                            b.end_ts IS NOT NULL
+                            OR b.heartbeat_ts < now() - make_interval(secs := p_seconds_before_abandoned)
+                        )
+                )
+            )
+        RETURNING job_id
+    LOOP
+        CALL ppe.update_task_rollups(p_job_id := v_job_id, p_outcome := 'cancel');
+    END LOOP;
+END;
 $$
-LANGUAGE sql;
+LANGUAGE plpgsql;
 
+-- p_ts is when the job finished, for a result replayed from ppe's local journal after an outage; it defaults to now().
 CREATE PROCEDURE ppe.job_completed_successfully (
     p_job_id INT
 ,   p_execution_millis BIGINT
+,   p_retries INT = 0
+,   p_ts TIMESTAMPTZ = NULL
 )
 AS $$
-    INSERT INTO ppe.job_success (job_id, execution_millis)
-    VALUES (p_job_id, p_execution_millis);
+BEGIN
+    IF ppe.job_has_result(p_job_id) THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO ppe.job_success (job_id, execution_millis, ts)
+    VALUES (p_job_id, p_execution_millis, COALESCE(p_ts, now()));
+
+    CALL ppe.update_task_stats(
+        p_job_id := p_job_id
+    ,   p_outcome := 'success'
+    ,   p_execution_millis := p_execution_millis
+    ,   p_ts := p_ts
+    );
+    CALL ppe.update_task_rollups(
+        p_job_id := p_job_id
+    ,   p_outcome := 'success'
+    ,   p_execution_millis := p_execution_millis
+    ,   p_retries := p_retries
+    ,   p_ts := p_ts
+    );
+END;
 $$
-LANGUAGE sql;
+LANGUAGE plpgsql;
 
 CREATE PROCEDURE ppe.log_batch_error(
     p_batch_id INT
 ,   p_message TEXT
+,   p_ts TIMESTAMPTZ = NULL
 ) AS $$
 BEGIN
     ASSERT length(trim(p_message)) > 0, 'p_message cannot be blank.';
 
-    INSERT INTO ppe.batch_error (batch_id, message)
-    VALUES (p_batch_id, p_message);
+    INSERT INTO ppe.batch_error (batch_id, message, ts)
+    VALUES (p_batch_id, p_message, COALESCE(p_ts, now()));
 END;
 $$
 LANGUAGE plpgsql;
@@ -417,12 +1090,13 @@ LANGUAGE plpgsql;
 CREATE OR REPLACE PROCEDURE ppe.log_batch_info(
     p_batch_id INT
 ,   p_message TEXT
+,   p_ts TIMESTAMPTZ = NULL
 ) AS $$
 BEGIN
     ASSERT length(trim(p_message)) > 0, 'p_message cannot be blank.';
 
-    INSERT INTO ppe.batch_info (batch_id, message)
-    VALUES (p_batch_id, p_message);
+    INSERT INTO ppe.batch_info (batch_id, message, ts)
+    VALUES (p_batch_id, p_message, COALESCE(p_ts, now()));
 END;
 $$
 LANGUAGE plpgsql;
@@ -430,12 +1104,19 @@ LANGUAGE plpgsql;
 CREATE OR REPLACE PROCEDURE ppe.job_cancelled(
     p_job_id INT
 ,   p_reason TEXT
+,   p_ts TIMESTAMPTZ = NULL
 ) AS $$
 BEGIN
     ASSERT length(trim(p_reason)) > 0, 'p_reason cannot be blank.';
 
-    INSERT INTO ppe.job_cancel (job_id, reason)
-    VALUES (p_job_id, p_reason);
+    IF ppe.job_has_result(p_job_id) THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO ppe.job_cancel (job_id, reason, ts)
+    VALUES (p_job_id, p_reason, COALESCE(p_ts, now()));
+
+    CALL ppe.update_task_rollups(p_job_id := p_job_id, p_outcome := 'cancel', p_ts := p_ts);
 END;
 $$
 LANGUAGE plpgsql;
@@ -443,12 +1124,24 @@ LANGUAGE plpgsql;
 CREATE OR REPLACE PROCEDURE ppe.job_failed(
     p_job_id INT
 ,   p_message TEXT
+,   p_timed_out BOOL = FALSE
+,   p_retries INT = 0
+,   p_ts TIMESTAMPTZ = NULL
 ) AS $$
+DECLARE
+    v_outcome TEXT = CASE WHEN COALESCE(p_timed_out, FALSE) THEN 'timeout' ELSE 'failure' END;
 BEGIN
     ASSERT length(trim(p_message)) > 0, 'p_message cannot be blank.';
 
-    INSERT INTO ppe.job_failure (job_id, message)
-    VALUES (p_job_id, p_message);
+    IF ppe.job_has_result(p_job_id) THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO ppe.job_failure (job_id, message, ts)
+    VALUES (p_job_id, p_message, COALESCE(p_ts, now()));
+
+    CALL ppe.update_task_stats(p_job_id := p_job_id, p_outcome := v_outcome, p_ts := p_ts);
+    CALL ppe.update_task_rollups(p_job_id := p_job_id, p_outcome := v_outcome, p_retries := p_retries, p_ts := p_ts);
 END;
 $$
 LANGUAGE plpgsql;
@@ -456,12 +1149,13 @@ LANGUAGE plpgsql;
 CREATE OR REPLACE PROCEDURE ppe.log_job_info(
     p_job_id INT
 ,   p_message TEXT
+,   p_ts TIMESTAMPTZ = NULL
 ) AS $$
 BEGIN
     ASSERT length(trim(p_message)) > 0, 'p_message cannot be blank.';
 
-    INSERT INTO ppe.job_info (job_id, message)
-    VALUES (p_job_id, p_message);
+    INSERT INTO ppe.job_info (job_id, message, ts)
+    VALUES (p_job_id, p_message, COALESCE(p_ts, now()));
 END;
 $$
 LANGUAGE plpgsql;
@@ -493,6 +1187,12 @@ CREATE TABLE ppe.task_queue (
 ,   retries INT NOT NULL
 ,   timeout_seconds INT NOT NULL
 ,   latest_attempt_ts TIMESTAMPTZ(0) NULL
+,   latest_job_id INT NULL
+,   ready_ts TIMESTAMPTZ(0) NULL
+,   expected_millis BIGINT NULL
+,   p95_millis BIGINT NULL
+,   window_start_ts TIMESTAMPTZ(0) NULL
+,   window_end_ts TIMESTAMPTZ(0) NULL
 ,   ts TIMESTAMPTZ(0) NOT NULL DEFAULT now()
 ,   UNIQUE (task_name)
 );
@@ -504,11 +1204,25 @@ CREATE TABLE ppe.resource_status (
 ,   available INT NOT NULL
 );
 
+-- The time zone the months, days, hours and minutes of ppe.schedule are in.  ppe.update_queue checks the schedules in
+-- it, and the forecast reads it from here to lay out the same calendar.
+CREATE OR REPLACE FUNCTION ppe.schedule_time_zone ()
+RETURNS TEXT
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT 'UTC'::TEXT;
+$$;
+
+-- Rebuilds the queue without blocking claims: the tables are emptied with DELETE rather than TRUNCATE, so claims keep
+-- reading the previous queue until the rebuild commits, and concurrent rebuilds wait on an advisory lock instead.
 CREATE OR REPLACE PROCEDURE ppe.update_queue ()
 LANGUAGE plpgsql
 AS $$
 BEGIN
-    SET TIME ZONE 'UTC';
+    PERFORM set_config('TimeZone', ppe.schedule_time_zone(), FALSE);
+
+    PERFORM pg_advisory_xact_lock(hashtext('ppe.update_queue'));
 
     WITH latest_attempts AS (
         SELECT DISTINCT ON (s.task_id)
@@ -599,7 +1313,7 @@ BEGIN
         ppe.job_complete.ts <> EXCLUDED.ts
     ;
 
-    TRUNCATE ppe.task_running;
+    DELETE FROM ppe.task_running;
     INSERT INTO ppe.task_running (
         task_id
     ,   job_id
@@ -625,13 +1339,13 @@ BEGIN
     ,   lta.start_ts DESC
     ;
 
-    TRUNCATE ppe.resource_status;
+    DELETE FROM ppe.resource_status;
     WITH running_job_resources AS (
         SELECT
             tr.resource_id
         ,   SUM(tr.units) AS units_in_use
         FROM ppe.task_running AS rj
-        JOIN ppe.task_resource AS tr
+        JOIN ppe.task_resource_demand AS tr
             ON rj.task_id = tr.task_id
         GROUP BY
             tr.resource_id
@@ -652,7 +1366,7 @@ BEGIN
         ON r.resource_id = rjr.resource_id
     ;
 
-    TRUNCATE ppe.task_queue;
+    DELETE FROM ppe.task_queue;
     INSERT INTO ppe.task_queue (
         task_id
     ,   task_name
@@ -662,6 +1376,12 @@ BEGIN
     ,   retries
     ,   timeout_seconds
     ,   latest_attempt_ts
+    ,   latest_job_id
+    ,   ready_ts
+    ,   expected_millis
+    ,   p95_millis
+    ,   window_start_ts
+    ,   window_end_ts
     )
     SELECT DISTINCT ON (t.task_id)
         t.task_id
@@ -672,6 +1392,16 @@ BEGIN
     ,   t.retries
     ,   t.timeout_seconds
     ,   lta.start_ts AS latest_attempt_ts
+    ,   lta.job_id AS latest_job_id
+    ,   COALESCE(
+            ltc.ts + make_interval(secs := s.min_seconds_between_attempts)
+        ,   lta.start_ts + make_interval(secs := t.timeout_seconds + 60)
+        ) AS ready_ts
+    ,   round(COALESCE(st.p50_millis, st.ewma_millis))::BIGINT AS expected_millis
+    ,   round(st.p95_millis)::BIGINT AS p95_millis
+        -- minute 0 is never within a schedule, so the current window always closes within the current hour
+    ,   GREATEST(date_trunc('hour', now()) + make_interval(mins := s.start_minute), s.start_ts) AS window_start_ts
+    ,   LEAST(date_trunc('hour', now()) + make_interval(mins := s.end_minute + 1), s.end_ts) AS window_end_ts
     FROM ppe.task AS t
     JOIN ppe.task_schedule AS ts -- 1..m
         ON t.task_id = ts.task_id
@@ -681,6 +1411,8 @@ BEGIN
         ON t.task_id = lta.task_id
     LEFT JOIN ppe.job_complete AS ltc
         ON lta.job_id = ltc.job_id
+    LEFT JOIN ppe.task_stats AS st
+        ON t.task_id = st.task_id
     WHERE
         t.enabled
         AND now() BETWEEN s.start_ts AND s.end_ts
@@ -704,7 +1436,7 @@ BEGIN
         AND NOT EXISTS (
             SELECT 1
             FROM ppe.resource_status AS rs
-            JOIN ppe.task_resource AS tr
+            JOIN ppe.task_resource_demand AS tr
                 ON t.task_id = tr.task_id
             WHERE
                 rs.resource_id = tr.resource_id
@@ -713,6 +1445,7 @@ BEGIN
     ORDER BY
         t.task_id
     ,   lta.start_ts DESC
+    ,   LEAST(date_trunc('hour', now()) + make_interval(mins := s.end_minute + 1), s.end_ts) DESC
     ;
 END;
 $$;
@@ -726,11 +1459,18 @@ RETURNS TABLE (
 ,   task_sql TEXT
 ,   retries INT
 ,   timeout_seconds INT
+,   conda_env TEXT
+,   project_name TEXT
+,   fn TEXT
+,   fn_args JSONB
+,   sql_target TEXT
+,   fingerprint_sql TEXT
 )
 LANGUAGE plpgsql
 AS $$
 DECLARE
     v_task_id INT;
+    v_latest_job_id INT;
 BEGIN
     v_task_id = (
         SELECT
@@ -745,7 +1485,12 @@ BEGIN
 
     IF v_task_id IS NOT NULL THEN
         DELETE FROM ppe.task_queue AS q
-        WHERE q.task_id = v_task_id;
+        WHERE q.task_id = v_task_id
+        RETURNING q.latest_job_id INTO v_latest_job_id;
+
+        IF ppe.task_started_since(p_task_id := v_task_id, p_job_id := v_latest_job_id) THEN
+            RETURN;
+        END IF;
 
         RETURN QUERY
         SELECT
@@ -756,6 +1501,12 @@ BEGIN
         ,   t.task_sql
         ,   t.retries
         ,   t.timeout_seconds
+        ,   t.conda_env
+        ,   t.project_name
+        ,   t.fn
+        ,   t.fn_args
+        ,   t.sql_target
+        ,   t.fingerprint_sql
         FROM ppe.task AS t
         WHERE
             t.task_id = v_task_id;
@@ -763,9 +1514,151 @@ BEGIN
 END;
 $$;
 
+-- Resource reservations as of the last ppe.update_queue.
+CREATE OR REPLACE FUNCTION ppe.get_resource_status ()
+RETURNS TABLE (
+    resource_id INT
+,   resource_name TEXT
+,   capacity INT
+,   reserved INT
+,   available INT
+)
+LANGUAGE sql
+AS $$
+    SELECT
+        rs.resource_id
+    ,   r.resource_name
+    ,   rs.capacity
+    ,   rs.reserved
+    ,   rs.available
+    FROM ppe.resource_status AS rs
+    JOIN ppe.resource AS r
+        ON rs.resource_id = r.resource_id
+    ORDER BY
+        r.resource_name
+$$;
+
+-- Queued tasks along with what the dispatcher needs to rank them.  running_peer_millis is the longest expected runtime
+-- among running tasks that share a resource with the queued task.
+CREATE OR REPLACE FUNCTION ppe.get_dispatch_candidates ()
+RETURNS TABLE (
+    task_id INT
+,   task_name TEXT
+,   latest_attempt_ts TIMESTAMPTZ(0)
+,   ready_ts TIMESTAMPTZ(0)
+,   expected_millis BIGINT
+,   p95_millis BIGINT
+,   window_start_ts TIMESTAMPTZ(0)
+,   window_end_ts TIMESTAMPTZ(0)
+,   running_peer_millis BIGINT
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RETURN QUERY
+    SELECT
+        q.task_id
+    ,   q.task_name
+    ,   q.latest_attempt_ts
+    ,   q.ready_ts
+    ,   q.expected_millis
+    ,   q.p95_millis
+    ,   q.window_start_ts
+    ,   q.window_end_ts
+    ,   (
+            SELECT max(round(COALESCE(st.p50_millis, st.ewma_millis)))::BIGINT
+            FROM ppe.task_resource_demand AS qr
+            JOIN ppe.task_resource_demand AS rr
+                ON qr.resource_id = rr.resource_id
+                AND qr.task_id <> rr.task_id
+            JOIN ppe.task_running AS r
+                ON rr.task_id = r.task_id
+            JOIN ppe.task_stats AS st
+                ON r.task_id = st.task_id
+            WHERE
+                qr.task_id = q.task_id
+        ) AS running_peer_millis
+    FROM ppe.task_queue AS q
+    ORDER BY
+        q.latest_attempt_ts
+    ,   q.ts
+    ;
+END;
+$$;
+
+-- Whether the task has a job newer than p_job_id, its latest job when its queue row was built.  ppe.update_queue does
+-- not block claims, so a claim that commits while the queue is rebuilt leaves a row for a task that is already running.
+CREATE OR REPLACE FUNCTION ppe.task_started_since (
+    p_task_id INT
+,   p_job_id INT
+)
+RETURNS BOOL
+LANGUAGE sql
+AS $$
+    SELECT EXISTS (
+        SELECT 1
+        FROM ppe.job AS j
+        WHERE
+            j.task_id = p_task_id
+            AND j.job_id > COALESCE(p_job_id, 0)
+    )
+$$;
+
+-- Claims a specific queued task.  Returns no rows if the task is no longer in the queue, or its queue row is stale.
+CREATE OR REPLACE FUNCTION ppe.claim_task (
+    p_task_id INT
+)
+RETURNS TABLE (
+    task_id INT
+,   task_name TEXT
+,   tool TEXT
+,   tool_args TEXT[]
+,   task_sql TEXT
+,   retries INT
+,   timeout_seconds INT
+,   conda_env TEXT
+,   project_name TEXT
+,   fn TEXT
+,   fn_args JSONB
+,   sql_target TEXT
+,   fingerprint_sql TEXT
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_latest_job_id INT;
+BEGIN
+    DELETE FROM ppe.task_queue AS q
+    WHERE q.task_id = p_task_id
+    RETURNING q.latest_job_id INTO v_latest_job_id;
+
+    IF FOUND AND NOT ppe.task_started_since(p_task_id := p_task_id, p_job_id := v_latest_job_id) THEN
+        RETURN QUERY
+        SELECT
+            t.task_id
+        ,   t.task_name
+        ,   t.tool
+        ,   t.tool_args
+        ,   t.task_sql
+        ,   t.retries
+        ,   t.timeout_seconds
+        ,   t.conda_env
+        ,   t.project_name
+        ,   t.fn
+        ,   t.fn_args
+        ,   t.sql_target
+        ,   t.fingerprint_sql
+        FROM ppe.task AS t
+        WHERE
+            t.task_id = p_task_id;
+    END IF;
+END;
+$$;
+
 CREATE OR REPLACE PROCEDURE ppe.delete_old_log_entries(
     p_current_batch_id INT
 ,   p_days_to_keep INT = 3
+,   p_days_hourly_rollups_to_keep INT = 90
 )
 AS $$
 DECLARE
@@ -838,6 +1731,20 @@ BEGIN
         WHERE js.job_id = tmp.job_id
     );
 
+    DELETE FROM ppe.job_resource_usage AS jru
+    WHERE EXISTS (
+        SELECT 1
+        FROM tmp_ppe_jobs_to_delete AS tmp
+        WHERE jru.job_id = tmp.job_id
+    );
+
+    DELETE FROM ppe.job_fingerprint AS jf
+    WHERE EXISTS (
+        SELECT 1
+        FROM tmp_ppe_jobs_to_delete AS tmp
+        WHERE jf.job_id = tmp.job_id
+    );
+
     DELETE FROM ppe.task_running AS tr
     WHERE EXISTS (
         SELECT 1
@@ -852,6 +1759,10 @@ BEGIN
         WHERE j.job_id = tmp.job_id
     );
 
+    -- the daily rollups are kept indefinitely
+    DELETE FROM ppe.task_rollup_hourly AS r
+    WHERE r.period_ts < now() - make_interval(days := COALESCE(p_days_hourly_rollups_to_keep, 90));
+
     DROP TABLE IF EXISTS tmp_ppe_batches_to_delete;
     CREATE TEMPORARY TABLE tmp_ppe_batches_to_delete (
         batch_id INT PRIMARY KEY
@@ -900,17 +1811,18 @@ CREATE TABLE ppe.task_issue_type (
     task_issue_type_id INT PRIMARY KEY
 ,   description TEXT NOT NULL
 ,   severity ppe.task_issue_severity_option NOT NULL
+,   threshold NUMERIC NULL
 ,   enabled BOOL NOT NULL DEFAULT TRUE
 );
-INSERT INTO ppe.task_issue_type (task_issue_type_id, description, severity)
+INSERT INTO ppe.task_issue_type (task_issue_type_id, description, severity, threshold)
 VALUES
-    (1, 'The task has no schedule associated with it.', 'HIGH')
-,   (2, 'The task has repeatedly timed out.', 'HIGH')
-,   (3, 'The task has repeatedly failed.', 'MED')
-,   (4, 'Task Tool is not unique.', 'MED')
-,   (5, 'Task SQL is not unique.', 'MED')
-,   (6, 'The task is slow.', 'MED')
-,   (7, 'The task has no resources associated with it.', 'LOW')
+    (1, 'The task has no schedule associated with it.', 'HIGH', NULL)
+,   (2, 'The task has repeatedly timed out.', 'HIGH', 3) -- consecutive timeouts
+,   (3, 'The task has repeatedly failed.', 'MED', 3) -- consecutive failures
+,   (4, 'Task Tool is not unique.', 'MED', NULL)
+,   (5, 'Task SQL is not unique.', 'MED', NULL)
+,   (6, 'The task is slow.', 'MED', 0.8) -- p95 runtime as a fraction of timeout_seconds
+,   (7, 'The task has no resources associated with it.', 'LOW', NULL)
 ;
 
 CREATE TABLE ppe.task_issue (
@@ -922,12 +1834,444 @@ CREATE TABLE ppe.task_issue (
 ,   UNIQUE (task_id, task_issue_type_id)
 );
 
+CREATE TABLE ppe.task_stats (
+    task_id INT PRIMARY KEY REFERENCES ppe.task (task_id)
+,   runs BIGINT NOT NULL DEFAULT 0
+,   successes BIGINT NOT NULL DEFAULT 0
+,   failures BIGINT NOT NULL DEFAULT 0
+,   timeouts BIGINT NOT NULL DEFAULT 0
+,   ewma_millis DOUBLE PRECISION NULL
+,   p50_millis DOUBLE PRECISION NULL
+,   p95_millis DOUBLE PRECISION NULL
+,   max_millis BIGINT NULL
+,   consecutive_failures INT NOT NULL DEFAULT 0
+,   consecutive_timeouts INT NOT NULL DEFAULT 0
+,   last_success_ts TIMESTAMPTZ(0) NULL
+,   ts TIMESTAMPTZ(0) NOT NULL DEFAULT now()
+);
+
+-- Keeps ppe.task_stats current as each job result is written.  The quantiles are streaming estimates: each sample
+-- nudges the estimate towards itself by a step proportional to the task's typical runtime, so no history is rescanned.
+-- consecutive_failures and consecutive_timeouts count errors and timeouts since the last success separately, so a
+-- timeout is only flagged as issue (2), not also as (3).
+CREATE OR REPLACE PROCEDURE ppe.update_task_stats(
+    p_job_id INT
+,   p_outcome TEXT
+,   p_execution_millis BIGINT = NULL
+,   p_ts TIMESTAMPTZ = NULL
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_alpha CONSTANT DOUBLE PRECISION = 0.2;
+    v_step_ratio CONSTANT DOUBLE PRECISION = 0.05;
+    v_task_id INT = (SELECT j.task_id FROM ppe.job AS j WHERE j.job_id = p_job_id);
+BEGIN
+    ASSERT p_outcome IN ('success', 'failure', 'timeout'), FORMAT('p_outcome, %s, is not recognized.', p_outcome);
+    ASSERT p_outcome <> 'success' OR p_execution_millis >= 0, 'p_execution_millis is required for successful jobs.';
+    ASSERT v_task_id IS NOT NULL, FORMAT('job_id %s does not exist.', p_job_id);
+
+    INSERT INTO ppe.task_stats (task_id)
+    VALUES (v_task_id)
+    ON CONFLICT (task_id) DO NOTHING;
+
+    IF p_outcome = 'success' THEN
+        UPDATE ppe.task_stats AS s
+        SET
+            runs = s.runs + 1
+        ,   successes = s.successes + 1
+        ,   ewma_millis = COALESCE(s.ewma_millis + v_alpha * (p_execution_millis - s.ewma_millis), p_execution_millis)
+        ,   p50_millis = CASE
+                WHEN s.p50_millis IS NULL THEN p_execution_millis
+                WHEN p_execution_millis > s.p50_millis
+                    THEN LEAST(s.p50_millis + 0.5 * GREATEST(v_step_ratio * s.ewma_millis, 1), p_execution_millis)
+                ELSE GREATEST(s.p50_millis - 0.5 * GREATEST(v_step_ratio * s.ewma_millis, 1), p_execution_millis)
+            END
+        ,   p95_millis = CASE
+                WHEN s.p95_millis IS NULL THEN p_execution_millis
+                WHEN p_execution_millis > s.p95_millis
+                    THEN LEAST(s.p95_millis + 0.95 * GREATEST(v_step_ratio * s.ewma_millis, 1), p_execution_millis)
+                ELSE GREATEST(s.p95_millis - 0.05 * GREATEST(v_step_ratio * s.ewma_millis, 1), p_execution_millis)
+            END
+        ,   max_millis = GREATEST(s.max_millis, p_execution_millis)
+        ,   consecutive_failures = 0
+        ,   consecutive_timeouts = 0
+        ,   last_success_ts = COALESCE(p_ts, now())
+        ,   ts = now()
+        WHERE
+            s.task_id = v_task_id;
+    ELSE
+        UPDATE ppe.task_stats AS s
+        SET
+            runs = s.runs + 1
+        ,   failures = s.failures + 1
+        ,   timeouts = s.timeouts + CASE WHEN p_outcome = 'timeout' THEN 1 ELSE 0 END
+        ,   consecutive_failures = s.consecutive_failures + CASE WHEN p_outcome = 'failure' THEN 1 ELSE 0 END
+        ,   consecutive_timeouts = s.consecutive_timeouts + CASE WHEN p_outcome = 'timeout' THEN 1 ELSE 0 END
+        ,   ts = now()
+        WHERE
+            s.task_id = v_task_id;
+    END IF;
+
+    CALL ppe.update_task_stats_issues(p_task_id := v_task_id);
+END;
+$$;
+
+-- Per-task profile of what jobs use, for sizing ppe.task_resource.units.  cpu_cores is CPU time over wall time, so a
+-- single-threaded task that never waits sits near 1.
+CREATE TABLE ppe.task_resource_profile (
+    task_id INT PRIMARY KEY REFERENCES ppe.task (task_id)
+,   samples BIGINT NOT NULL DEFAULT 0
+,   ewma_cpu_cores DOUBLE PRECISION NULL
+,   max_cpu_cores DOUBLE PRECISION NULL
+,   ewma_peak_rss_kb DOUBLE PRECISION NULL
+,   p95_peak_rss_kb DOUBLE PRECISION NULL
+,   max_peak_rss_kb BIGINT NULL
+,   ewma_block_ios DOUBLE PRECISION NULL
+,   ewma_context_switches DOUBLE PRECISION NULL
+,   ts TIMESTAMPTZ(0) NOT NULL DEFAULT now()
+);
+
+-- Records a job's resource usage and folds it into ppe.task_resource_profile, using the same streaming estimates as
+-- ppe.update_task_stats.
+CREATE OR REPLACE PROCEDURE ppe.log_job_resource_usage(
+    p_job_id INT
+,   p_wall_millis BIGINT
+,   p_user_cpu_millis BIGINT = NULL
+,   p_system_cpu_millis BIGINT = NULL
+,   p_peak_rss_kb BIGINT = NULL
+,   p_block_reads BIGINT = NULL
+,   p_block_writes BIGINT = NULL
+,   p_voluntary_context_switches BIGINT = NULL
+,   p_involuntary_context_switches BIGINT = NULL
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_alpha CONSTANT DOUBLE PRECISION = 0.2;
+    v_step_ratio CONSTANT DOUBLE PRECISION = 0.05;
+    v_task_id INT = (SELECT j.task_id FROM ppe.job AS j WHERE j.job_id = p_job_id);
+    v_cpu_cores DOUBLE PRECISION = (p_user_cpu_millis + p_system_cpu_millis)::DOUBLE PRECISION / NULLIF(p_wall_millis, 0);
+    v_block_ios BIGINT = p_block_reads + p_block_writes;
+    v_context_switches BIGINT = p_voluntary_context_switches + p_involuntary_context_switches;
+BEGIN
+    ASSERT v_task_id IS NOT NULL, FORMAT('job_id %s does not exist.', p_job_id);
+
+    -- already recorded along with the job's result
+    IF EXISTS (SELECT 1 FROM ppe.job_resource_usage AS u WHERE u.job_id = p_job_id) THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO ppe.job_resource_usage (
+        job_id
+    ,   wall_millis
+    ,   user_cpu_millis
+    ,   system_cpu_millis
+    ,   peak_rss_kb
+    ,   block_reads
+    ,   block_writes
+    ,   voluntary_context_switches
+    ,   involuntary_context_switches
+    )
+    VALUES (
+        p_job_id
+    ,   p_wall_millis
+    ,   p_user_cpu_millis
+    ,   p_system_cpu_millis
+    ,   p_peak_rss_kb
+    ,   p_block_reads
+    ,   p_block_writes
+    ,   p_voluntary_context_switches
+    ,   p_involuntary_context_switches
+    );
+
+    INSERT INTO ppe.task_resource_profile (task_id)
+    VALUES (v_task_id)
+    ON CONFLICT (task_id) DO NOTHING;
+
+    UPDATE ppe.task_resource_profile AS p
+    SET
+        samples = p.samples + 1
+    ,   ewma_cpu_cores = COALESCE(p.ewma_cpu_cores + v_alpha * (v_cpu_cores - p.ewma_cpu_cores), v_cpu_cores, p.ewma_cpu_cores)
+    ,   max_cpu_cores = GREATEST(p.max_cpu_cores, v_cpu_cores)
+    ,   ewma_peak_rss_kb = COALESCE(p.ewma_peak_rss_kb + v_alpha * (p_peak_rss_kb - p.ewma_peak_rss_kb), p_peak_rss_kb, p.ewma_peak_rss_kb)
+    ,   p95_peak_rss_kb = CASE
+            WHEN p_peak_rss_kb IS NULL THEN p.p95_peak_rss_kb
+            WHEN p.p95_peak_rss_kb IS NULL THEN p_peak_rss_kb
+            WHEN p_peak_rss_kb > p.p95_peak_rss_kb
+                THEN LEAST(p.p95_peak_rss_kb + 0.95 * GREATEST(v_step_ratio * p.ewma_peak_rss_kb, 1), p_peak_rss_kb)
+            ELSE GREATEST(p.p95_peak_rss_kb - 0.05 * GREATEST(v_step_ratio * p.ewma_peak_rss_kb, 1), p_peak_rss_kb)
+        END
+    ,   max_peak_rss_kb = GREATEST(p.max_peak_rss_kb, p_peak_rss_kb)
+    ,   ewma_block_ios = COALESCE(p.ewma_block_ios + v_alpha * (v_block_ios - p.ewma_block_ios), v_block_ios, p.ewma_block_ios)
+    ,   ewma_context_switches = COALESCE(
+            p.ewma_context_switches + v_alpha * (v_context_switches - p.ewma_context_switches)
+        ,   v_context_switches
+        ,   p.ewma_context_switches
+        )
+    ,   ts = now()
+    WHERE
+        p.task_id = v_task_id;
+END;
+$$;
+
+-- Job history rolled up per task and hour/day as results are written, so reports read these instead of scanning
+-- ppe.job and its outcome tables, and so trends outlive ppe.delete_old_log_entries.  runtime_sketch counts successful
+-- runs by power of two: element b holds runtimes in [2^(b-1), 2^b) ms, see ppe.rollup_quantile.
+CREATE TABLE ppe.task_rollup_hourly (
+    task_id INT NOT NULL REFERENCES ppe.task (task_id)
+,   period_ts TIMESTAMPTZ(0) NOT NULL
+,   successes INT NOT NULL DEFAULT 0
+,   failures INT NOT NULL DEFAULT 0
+,   timeouts INT NOT NULL DEFAULT 0
+,   cancels INT NOT NULL DEFAULT 0
+,   skips INT NOT NULL DEFAULT 0
+,   retries INT NOT NULL DEFAULT 0
+,   runtime_sum_millis BIGINT NOT NULL DEFAULT 0
+,   runtime_min_millis BIGINT NULL
+,   runtime_max_millis BIGINT NULL
+,   runtime_sketch INT[] NOT NULL DEFAULT array_fill(0, ARRAY[32])
+,   PRIMARY KEY (task_id, period_ts)
+);
+
+CREATE TABLE ppe.task_rollup_daily (
+    task_id INT NOT NULL REFERENCES ppe.task (task_id)
+,   period_ts TIMESTAMPTZ(0) NOT NULL
+,   successes INT NOT NULL DEFAULT 0
+,   failures INT NOT NULL DEFAULT 0
+,   timeouts INT NOT NULL DEFAULT 0
+,   cancels INT NOT NULL DEFAULT 0
+,   skips INT NOT NULL DEFAULT 0
+,   retries INT NOT NULL DEFAULT 0
+,   runtime_sum_millis BIGINT NOT NULL DEFAULT 0
+,   runtime_min_millis BIGINT NULL
+,   runtime_max_millis BIGINT NULL
+,   runtime_sketch INT[] NOT NULL DEFAULT array_fill(0, ARRAY[32])
+,   PRIMARY KEY (task_id, period_ts)
+);
+
+-- Adds one job outcome to the task's hourly and daily rollups.  Periods are UTC.
+CREATE OR REPLACE PROCEDURE ppe.update_task_rollups(
+    p_job_id INT
+,   p_outcome TEXT
+,   p_execution_millis BIGINT = NULL
+,   p_retries INT = 0
+,   p_ts TIMESTAMPTZ = NULL
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_task_id INT = (SELECT j.task_id FROM ppe.job AS j WHERE j.job_id = p_job_id);
+    v_sketch INT[] = array_fill(0, ARRAY[32]);
+    v_grain RECORD;
+BEGIN
+    ASSERT p_outcome IN ('success', 'failure', 'timeout', 'cancel', 'skip'), FORMAT('p_outcome, %s, is not recognized.', p_outcome);
+    ASSERT v_task_id IS NOT NULL, FORMAT('job_id %s does not exist.', p_job_id);
+
+    IF p_execution_millis IS NOT NULL THEN
+        v_sketch[LEAST(floor(ln(GREATEST(p_execution_millis, 1)) / ln(2))::INT, 31) + 1] = 1;
+    END IF;
+
+    FOR v_grain IN
+        SELECT g.table_name, date_trunc(g.grain, COALESCE(p_ts, now()), 'UTC') AS period_ts
+        FROM (VALUES ('ppe.task_rollup_hourly', 'hour'), ('ppe.task_rollup_daily', 'day')) AS g (table_name, grain)
+    LOOP
+        EXECUTE FORMAT(
+            $sql$
+            INSERT INTO %s AS r (
+                task_id
+            ,   period_ts
+            ,   successes
+            ,   failures
+            ,   timeouts
+            ,   cancels
+            ,   skips
+            ,   retries
+            ,   runtime_sum_millis
+            ,   runtime_min_millis
+            ,   runtime_max_millis
+            ,   runtime_sketch
+            )
+            VALUES (
+                $1
+            ,   $2
+            ,   (CASE WHEN $3 = 'success' THEN 1 ELSE 0 END)
+            ,   (CASE WHEN $3 IN ('failure', 'timeout') THEN 1 ELSE 0 END)
+            ,   (CASE WHEN $3 = 'timeout' THEN 1 ELSE 0 END)
+            ,   (CASE WHEN $3 = 'cancel' THEN 1 ELSE 0 END)
+            ,   (CASE WHEN $3 = 'skip' THEN 1 ELSE 0 END)
+            ,   COALESCE($5, 0)
+            ,   COALESCE($4, 0)
+            ,   $4
+            ,   $4
+            ,   $6
+            )
+            ON CONFLICT (task_id, period_ts) DO UPDATE
+            SET
+                successes = r.successes + EXCLUDED.successes
+            ,   failures = r.failures + EXCLUDED.failures
+            ,   timeouts = r.timeouts + EXCLUDED.timeouts
+            ,   cancels = r.cancels + EXCLUDED.cancels
+            ,   skips = r.skips + EXCLUDED.skips
+            ,   retries = r.retries + EXCLUDED.retries
+            ,   runtime_sum_millis = r.runtime_sum_millis + EXCLUDED.runtime_sum_millis
+            ,   runtime_min_millis = LEAST(r.runtime_min_millis, EXCLUDED.runtime_min_millis)
+            ,   runtime_max_millis = GREATEST(r.runtime_max_millis, EXCLUDED.runtime_max_millis)
+            ,   runtime_sketch = (
+                    SELECT array_agg(x.a + x.b ORDER BY x.i)
+                    FROM unnest(r.runtime_sketch, EXCLUDED.runtime_sketch) WITH ORDINALITY AS x (a, b, i)
+                )
+            $sql$
+        ,   v_grain.table_name
+        )
+        USING v_task_id, v_grain.period_ts, p_outcome, p_execution_millis, p_retries, v_sketch;
+    END LOOP;
+END;
+$$;
+
+-- Estimates a runtime quantile from a rollup's runtime_sketch, as the geometric middle of the bucket it falls in.
+CREATE OR REPLACE FUNCTION ppe.rollup_quantile(
+    p_sketch INT[]
+,   p_quantile DOUBLE PRECISION
+)
+RETURNS DOUBLE PRECISION
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT power(2, c.bucket - 0.5)
+    FROM (
+        SELECT
+            s.bucket
+        ,   SUM(s.n) OVER (ORDER BY s.bucket) AS running
+        ,   SUM(s.n) OVER () AS total
+        FROM unnest(p_sketch) WITH ORDINALITY AS s (n, bucket)
+    ) AS c
+    WHERE
+        c.total > 0
+        AND c.running >= p_quantile * c.total
+    ORDER BY c.bucket
+    LIMIT 1
+$$;
+
+CREATE OR REPLACE VIEW ppe.task_history_daily AS
+    SELECT
+        t.task_name
+    ,   r.period_ts AS day
+    ,   r.successes
+    ,   r.failures
+    ,   r.timeouts
+    ,   r.cancels
+    ,   r.skips
+    ,   r.retries
+    ,   r.runtime_sum_millis / NULLIF(r.successes, 0) AS avg_runtime_millis
+    ,   r.runtime_min_millis
+    ,   r.runtime_max_millis
+    ,   ppe.rollup_quantile(r.runtime_sketch, 0.5) AS p50_runtime_millis
+    ,   ppe.rollup_quantile(r.runtime_sketch, 0.95) AS p95_runtime_millis
+    FROM ppe.task_rollup_daily AS r
+    JOIN ppe.task AS t
+        ON r.task_id = t.task_id
+;
+
+-- Maintains issues (2), (3) and (6) from ppe.task_stats, for a single task, or for every task when p_task_id is NULL.
+CREATE OR REPLACE PROCEDURE ppe.update_task_stats_issues(
+    p_task_id INT = NULL
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    WITH issues AS (
+        SELECT
+            s.task_id
+        ,   tit.task_issue_type_id
+        ,   tit.enabled AND COALESCE(
+                CASE tit.task_issue_type_id
+                    WHEN 2 THEN s.consecutive_timeouts >= tit.threshold
+                    WHEN 3 THEN s.consecutive_failures >= tit.threshold
+                    WHEN 6 THEN s.p95_millis >= tit.threshold * t.timeout_seconds * 1000
+                END
+            ,   FALSE
+            ) AS flagged
+        ,   jsonb_build_object(
+                'runs', s.runs
+            ,   'consecutive_failures', s.consecutive_failures
+            ,   'consecutive_timeouts', s.consecutive_timeouts
+            ,   'p50_millis', round(s.p50_millis)
+            ,   'p95_millis', round(s.p95_millis)
+            ,   'timeout_seconds', t.timeout_seconds
+            ,   'last_success_ts', s.last_success_ts
+            ) AS supporting_info
+        FROM ppe.task_stats AS s
+        JOIN ppe.task AS t
+            ON s.task_id = t.task_id
+        JOIN ppe.task_issue_type AS tit
+            ON tit.task_issue_type_id IN (2, 3, 6)
+        WHERE
+            p_task_id IS NULL
+            OR s.task_id = p_task_id
+    )
+    , resolved AS (
+        DELETE FROM ppe.task_issue AS ti
+        USING issues AS i
+        WHERE
+            ti.task_id = i.task_id
+            AND ti.task_issue_type_id = i.task_issue_type_id
+            AND NOT i.flagged
+    )
+    INSERT INTO ppe.task_issue (
+        task_id
+    ,   task_issue_type_id
+    ,   supporting_info
+    )
+    SELECT
+        i.task_id
+    ,   i.task_issue_type_id
+    ,   i.supporting_info
+    FROM issues AS i
+    WHERE
+        i.flagged
+    ON CONFLICT (task_id, task_issue_type_id)
+    DO UPDATE SET
+        supporting_info = EXCLUDED.supporting_info
+    ;
+END;
+$$;
+
+-- Issues (2), (3) and (6) are only recomputed as results come in, so they are refreshed when a threshold, or the
+-- timeout_seconds issue (6) is measured against, changes.
+CREATE OR REPLACE FUNCTION ppe.refresh_task_stats_issues()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'task' THEN
+        CALL ppe.update_task_stats_issues(p_task_id := NEW.task_id);
+    ELSE
+        CALL ppe.update_task_stats_issues();
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER task_issue_type_refresh_task_stats_issues
+AFTER UPDATE OF threshold, enabled ON ppe.task_issue_type
+FOR EACH STATEMENT
+EXECUTE FUNCTION ppe.refresh_task_stats_issues();
+
+CREATE TRIGGER task_refresh_task_stats_issues
+AFTER UPDATE OF timeout_seconds ON ppe.task
+FOR EACH ROW
+WHEN (OLD.timeout_seconds IS DISTINCT FROM NEW.timeout_seconds)
+EXECUTE FUNCTION ppe.refresh_task_stats_issues();
+
 CREATE OR REPLACE PROCEDURE ppe.update_task_issues()
 LANGUAGE plpgsql
 AS $$
 DECLARE
 BEGIN
-    TRUNCATE ppe.task_issue;
+    -- (2), (3) and (6) are maintained by ppe.update_task_stats_issues as results come in
+    DELETE FROM ppe.task_issue AS ti
+    WHERE ti.task_issue_type_id NOT IN (2, 3, 6);
 
 -- (1) task has no schedule associated with it
     INSERT INTO ppe.task_issue (task_id, task_issue_type_id)
@@ -939,9 +2283,9 @@ BEGIN
         WHERE t.task_id = ts.task_id
     );
 
--- (2) task has repeatedly timed out
+-- (2) task has repeatedly timed out: see ppe.update_task_stats_issues
 
--- (3) task has repeatedly errored out
+-- (3) task has repeatedly errored out: see ppe.update_task_stats_issues
 
 -- (4) task tool not unique
     INSERT INTO ppe.task_issue (
@@ -986,7 +2330,7 @@ BEGIN
         COUNT(*) > 1
     ;
 
--- (6) task is slow
+-- (6) task is slow: see ppe.update_task_stats_issues
 
 -- (7) task has no resources associated with it
     INSERT INTO ppe.task_issue (task_id, task_issue_type_id)
@@ -994,7 +2338,7 @@ BEGIN
     FROM ppe.task AS t
     WHERE NOT EXISTS (
         SELECT 1
-        FROM ppe.task_resource AS tr
+        FROM ppe.task_resource_demand AS tr
         WHERE t.task_id = tr.task_id
     );
 END;
@@ -1 +1,14 @@
-from src.adapter import config, db, fs
+import importlib
+import typing
+
+if typing.TYPE_CHECKING:
+    from src.adapter import catalog, circuit_breaker, config, db, fs, journal, log, status_server
+
+_MODULES = ("catalog", "circuit_breaker", "config", "db", "fs", "journal", "log", "status_server")
+
+
+# submodules are imported on first use, so a command or a job process only pays for the ones it touches
+def __getattr__(name: str) -> typing.Any:
+    if name in _MODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
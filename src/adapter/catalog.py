@@ -0,0 +1,365 @@
+from __future__ import annotations
+
+import csv
+import dataclasses
+import io
+import json
+import pathlib
+import typing
+
+import loguru
+import psycopg2
+import psycopg2.extensions
+
+from src import data
+
+__all__ = ("CatalogImportSummary", "export_catalog", "import_catalog", "load_schedule_plan")
+
+
+# The manifest uses these names for both formats.  A JSON manifest nests task_schedule and task_resource rows in their
+# task as "schedules": [name, ...] and "resources": {name: units}; a CSV manifest is a folder with one file per table.
+_COLUMNS: dict[str, tuple[str, ...]] = {
+    "resource": ("resource_name", "capacity", "enabled"),
+    "schedule": (
+        "schedule_name",
+        "min_seconds_between_attempts",
+        "start_ts",
+        "end_ts",
+        "start_month",
+        "end_month",
+        "start_month_day",
+        "end_month_day",
+        "start_week_day",
+        "end_week_day",
+        "start_hour",
+        "end_hour",
+        "start_minute",
+        "end_minute",
+    ),
+    "task": (
+        "task_name",
+        "tool",
+        "tool_args",
+        "task_sql",
+        "retries",
+        "timeout_seconds",
+        "conda_env",
+        "project_name",
+        "fn",
+        "fn_args",
+        "sql_target",
+        "fingerprint_sql",
+        "enabled",
+    ),
+    "task_schedule": ("task_name", "schedule_name"),
+    "task_resource": ("task_name", "resource_name", "units"),
+}
+
+_EXPORT_SQL: dict[str, str] = {
+    "resource": """
+        SELECT r.resource_name, r.capacity, r.enable_flag AS enabled
+        FROM ppe.resource AS r
+        ORDER BY r.resource_name
+    """,
+    "schedule": """
+        SELECT
+            s.schedule_name, s.min_seconds_between_attempts, s.start_ts, s.end_ts, s.start_month, s.end_month
+        ,   s.start_month_day, s.end_month_day, s.start_week_day, s.end_week_day, s.start_hour, s.end_hour
+        ,   s.start_minute, s.end_minute
+        FROM ppe.schedule AS s
+        ORDER BY s.schedule_name
+    """,
+    "task": """
+        SELECT
+            t.task_name, t.tool, to_jsonb(t.tool_args) AS tool_args, t.task_sql, t.retries, t.timeout_seconds
+        ,   t.conda_env, t.project_name, t.fn, t.fn_args, t.sql_target, t.fingerprint_sql, t.enabled
+        FROM ppe.task AS t
+        ORDER BY t.task_name
+    """,
+    "task_schedule": """
+        SELECT t.task_name, s.schedule_name
+        FROM ppe.task_schedule AS ts
+        JOIN ppe.task AS t ON ts.task_id = t.task_id
+        JOIN ppe.schedule AS s ON ts.schedule_id = s.schedule_id
+        ORDER BY t.task_name, s.schedule_name
+    """,
+    "task_resource": """
+        SELECT t.task_name, r.resource_name, tr.units
+        FROM ppe.task_resource AS tr
+        JOIN ppe.task AS t ON tr.task_id = t.task_id
+        JOIN ppe.resource AS r ON tr.resource_id = r.resource_id
+        ORDER BY t.task_name, r.resource_name
+    """,
+}
+
+
+@dataclasses.dataclass(frozen=True, kw_only=True)
+class CatalogImportSummary:
+    entity: str
+    inserted: int
+    updated: int
+    disabled: int
+
+
+def export_catalog(*, connection_str: str, path: pathlib.Path) -> None:
+    """Writes the catalog to a .json file, or to a folder of CSV files for any other path."""
+    with psycopg2.connect(connection_str) as con:
+        con.set_session(readonly=True)
+        if _is_json(path):
+            _export_json(con=con, path=path)
+        else:
+            _export_csv(con=con, folder=path)
+    con.close()
+
+
+def import_catalog(*, connection_str: str, path: pathlib.Path, prune: bool) -> list[CatalogImportSummary]:
+    """Loads a manifest into the catalog in one transaction; nothing is changed if any part of it is invalid."""
+    con = psycopg2.connect(connection_str)
+    try:
+        with con:
+            with con.cursor() as cur:
+                cur.execute("CALL ppe.stage_catalog();")
+                if _is_json(path):
+                    _stage_json(cur=cur, path=path)
+                else:
+                    _stage_csv(cur=cur, folder=path)
+
+                cur.execute("SELECT * FROM ppe.import_catalog(p_prune := %(prune)s);", {"prune": prune})
+                summary = [
+                    CatalogImportSummary(entity=row[0], inserted=row[1], updated=row[2], disabled=row[3])
+                    for row in cur.fetchall()
+                ]
+    finally:
+        con.close()
+
+    for s in summary:
+        loguru.logger.info(f"{s.entity}: {s.inserted} inserted, {s.updated} updated, {s.disabled} disabled or removed.")
+
+    return summary
+
+
+def load_schedule_plan(*, connection_str: str) -> data.SchedulePlan:
+    """Reads the resources, schedules and enabled tasks, with each task's runtime history, for a load forecast."""
+    with psycopg2.connect(connection_str) as con:
+        con.set_session(readonly=True)
+        with con.cursor() as cur:
+            # the session is put in the zone ppe.update_queue checks the schedules in, the same way it does
+            cur.execute("SELECT set_config('TimeZone', ppe.schedule_time_zone(), TRUE);")
+            cur.execute("SELECT current_setting('TimeZone');")
+            time_zone = typing.cast(tuple[str], cur.fetchone())[0]
+
+            cur.execute("""
+                SELECT r.resource_id, r.resource_name, r.capacity
+                FROM ppe.resource AS r
+                WHERE r.enable_flag
+                ORDER BY r.resource_name
+            """)
+            resources = [data.Resource(resource_id=row[0], name=row[1], capacity=row[2]) for row in cur.fetchall()]
+
+            cur.execute("""
+                SELECT
+                    s.schedule_id, s.schedule_name, s.start_ts, s.end_ts, s.start_month, s.end_month
+                ,   s.start_month_day, s.end_month_day, s.start_week_day, s.end_week_day, s.start_hour, s.end_hour
+                ,   s.start_minute, s.end_minute, s.min_seconds_between_attempts
+                FROM ppe.schedule AS s
+                ORDER BY s.schedule_id
+            """)
+            schedules = [
+                data.Schedule(
+                    schedule_id=row[0],
+                    name=row[1],
+                    start_ts=row[2],
+                    end_ts=row[3],
+                    start_month=row[4],
+                    end_month=row[5],
+                    start_month_day=row[6],
+                    end_month_day=row[7],
+                    start_week_day=row[8],
+                    end_week_day=row[9],
+                    start_hour=row[10],
+                    end_hour=row[11],
+                    start_minute=row[12],
+                    end_minute=row[13],
+                    min_seconds_between_attempts=row[14],
+                )
+                for row in cur.fetchall()
+            ]
+
+            # ppe.task_resource_demand includes the unit a task takes of the resource named after its sql_target
+            cur.execute("""
+                SELECT
+                    t.task_id
+                ,   t.task_name
+                ,   ARRAY(SELECT ts.schedule_id FROM ppe.task_schedule AS ts WHERE ts.task_id = t.task_id ORDER BY 1)
+                ,   ARRAY(
+                        SELECT ARRAY[d.resource_id, d.units]
+                        FROM ppe.task_resource_demand AS d
+                        WHERE d.task_id = t.task_id
+                        ORDER BY d.resource_id
+                    )
+                ,   round(COALESCE(st.p50_millis, st.ewma_millis))::BIGINT
+                ,   round(st.p95_millis)::BIGINT
+                ,   lta.start_ts
+                FROM ppe.task AS t
+                LEFT JOIN ppe.task_stats AS st
+                    ON t.task_id = st.task_id
+                LEFT JOIN ppe.latest_task_attempt AS lta
+                    ON t.task_id = lta.task_id
+                WHERE
+                    t.enabled
+                    AND EXISTS (SELECT 1 FROM ppe.task_schedule AS ts WHERE ts.task_id = t.task_id)
+                ORDER BY t.task_id
+            """)
+            tasks = [
+                data.ScheduledTask(
+                    task_id=row[0],
+                    name=row[1],
+                    schedule_ids=tuple(row[2]),
+                    resource_units=tuple((resource_id, units) for resource_id, units in row[3]),
+                    expected_millis=row[4],
+                    p95_millis=row[5],
+                    latest_attempt_ts=row[6],
+                )
+                for row in cur.fetchall()
+            ]
+    con.close()
+
+    return data.SchedulePlan(resources=resources, schedules=schedules, tasks=tasks, time_zone=time_zone)
+
+
+def _copy_in(*, cur: psycopg2.extensions.cursor, table: str, columns: typing.Sequence[str], fh: typing.IO[str]) -> None:
+    cur.copy_expert(
+        f"COPY ppe_catalog_{table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, HEADER true)",
+        fh,
+    )
+
+
+def _csv_value(value: typing.Any, /) -> typing.Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def _export_csv(*, con: psycopg2.extensions.connection, folder: pathlib.Path) -> None:
+    folder.mkdir(parents=True, exist_ok=True)
+    with con.cursor() as cur:
+        for table, sql in _EXPORT_SQL.items():
+            with (folder / f"{table}.csv").open("w", newline="", encoding="utf-8") as fh:
+                cur.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER true)", fh)
+
+
+def _export_json(*, con: psycopg2.extensions.connection, path: pathlib.Path) -> None:
+    # tasks are written as they are fetched, so the whole catalog is never held in memory
+    def write_rows(fh: typing.TextIO, *, key: str, sql: str, last: bool = False) -> None:
+        fh.write(f'  "{key}": [')
+        separator = "\n"
+        with con.cursor(name=f"ppe_export_{key}") as cur:
+            cur.itersize = 1000
+            cur.execute(sql)
+            for (row,) in cur:
+                fh.write(separator + "    " + json.dumps(row, default=str))
+                separator = ",\n"
+        fh.write(("]" if separator == "\n" else "\n  ]") + ("\n" if last else ",\n"))
+
+    with path.open("w", encoding="utf-8") as fh:
+        fh.write("{\n")
+        write_rows(fh, key="resources", sql=f"SELECT jsonb_strip_nulls(to_jsonb(x)) FROM ({_EXPORT_SQL['resource']}) AS x")
+        write_rows(fh, key="schedules", sql=f"SELECT jsonb_strip_nulls(to_jsonb(x)) FROM ({_EXPORT_SQL['schedule']}) AS x")
+        write_rows(
+            fh,
+            key="tasks",
+            sql="""
+                SELECT
+                    jsonb_strip_nulls(jsonb_build_object(
+                        'task_name', t.task_name
+                    ,   'tool', t.tool
+                    ,   'tool_args', to_jsonb(t.tool_args)
+                    ,   'task_sql', t.task_sql
+                    ,   'retries', t.retries
+                    ,   'timeout_seconds', t.timeout_seconds
+                    ,   'conda_env', t.conda_env
+                    ,   'project_name', t.project_name
+                    ,   'fn', t.fn
+                    ,   'fn_args', t.fn_args
+                    ,   'sql_target', t.sql_target
+                    ,   'fingerprint_sql', t.fingerprint_sql
+                    ,   'enabled', t.enabled
+                    ))
+                    || jsonb_build_object(
+                        'schedules'
+                    ,   COALESCE((
+                            SELECT jsonb_agg(s.schedule_name ORDER BY s.schedule_name)
+                            FROM ppe.task_schedule AS ts
+                            JOIN ppe.schedule AS s ON ts.schedule_id = s.schedule_id
+                            WHERE ts.task_id = t.task_id
+                        ), '[]')
+                    ,   'resources'
+                    ,   COALESCE((
+                            SELECT jsonb_object_agg(r.resource_name, tr.units)
+                            FROM ppe.task_resource AS tr
+                            JOIN ppe.resource AS r ON tr.resource_id = r.resource_id
+                            WHERE tr.task_id = t.task_id
+                        ), '{}')
+                    )
+                FROM ppe.task AS t
+                ORDER BY t.task_name
+            """,
+            last=True,
+        )
+        fh.write("}\n")
+
+
+def _is_json(path: pathlib.Path, /) -> bool:
+    return path.suffix.lower() == ".json"
+
+
+def _stage_csv(*, cur: psycopg2.extensions.cursor, folder: pathlib.Path) -> None:
+    assert folder.is_dir(), f"The catalog folder specified, {folder.resolve()!s}, does not exist."
+
+    for table, allowed in _COLUMNS.items():
+        fp = folder / f"{table}.csv"
+        if not fp.exists():
+            continue
+
+        with fp.open("r", newline="", encoding="utf-8") as fh:
+            header = next(csv.reader([fh.readline()]), [])
+            if unknown := [c for c in header if c not in allowed]:
+                raise Exception(
+                    f"{fp.name} has unrecognized columns: {', '.join(unknown)}.  "
+                    f"Expected any of: {', '.join(allowed)}."
+                )
+            fh.seek(0)
+
+            # stream the file as is; COPY skips the header, and the column list follows it
+            _copy_in(cur=cur, table=table, columns=header, fh=fh)
+
+
+def _stage_json(*, cur: psycopg2.extensions.cursor, path: pathlib.Path) -> None:
+    with path.open("r", encoding="utf-8") as fh:
+        manifest = json.load(fh)
+
+    if unknown := set(manifest) - {"resources", "schedules", "tasks"}:
+        raise Exception(f"{path.name} has unrecognized sections: {', '.join(sorted(unknown))}.")
+
+    rows: dict[str, list[tuple[typing.Any, ...]]] = {table: [] for table in _COLUMNS}
+    for section, table in (("resources", "resource"), ("schedules", "schedule"), ("tasks", "task")):
+        for item in manifest.get(section, []):
+            item = dict(item)
+            if table == "task":
+                task_name = item.get("task_name")
+                for schedule_name in item.pop("schedules", []):
+                    rows["task_schedule"].append((task_name, schedule_name))
+                for resource_name, units in item.pop("resources", {}).items():
+                    rows["task_resource"].append((task_name, resource_name, units))
+
+            if unknown := set(item) - set(_COLUMNS[table]):
+                raise Exception(f"A {table} in {path.name} has unrecognized fields: {', '.join(sorted(unknown))}.")
+            rows[table].append(tuple(_csv_value(item.get(c)) for c in _COLUMNS[table]))
+
+    for table, table_rows in rows.items():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(_COLUMNS[table])
+        writer.writerows(table_rows)
+        buffer.seek(0)
+        _copy_in(cur=cur, table=table, columns=_COLUMNS[table], fh=buffer)
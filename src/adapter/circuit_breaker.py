@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import contextlib
+import random
+import threading
+import time
+import typing
+
+import loguru
+import psycopg2
+import psycopg2.pool
+
+from src import data
+
+__all__ = ("CircuitBreaker", "is_connection_error")
+
+
+class CircuitBreaker:
+    """Stops every thread from hammering a database that is down.
+
+    After failure_threshold consecutive connection failures the circuit opens, and calls fail fast with
+    data.DbUnavailableError instead of waiting on a connect or statement timeout.  Once the backoff has passed, a single
+    call is let through as a probe; if it gets an answer the circuit closes, otherwise it opens again for twice as
+    long, up to max_seconds.  Each backoff is jittered so that several ppe instances do not probe in step.
+
+    Only failures that say nothing came back from the server count, see is_connection_error; a query that fails with
+    an error from Postgres shows the database is up.  Waiting too long for a pooled connection says nothing either way,
+    so it neither counts as a failure nor resets the count.
+    """
+
+    def __init__(
+        self,
+        *,
+        name: str = "database",
+        failure_threshold: int = 3,
+        base_seconds: float = 1,
+        max_seconds: float = 60,
+    ):
+        self._name = name
+        self._failure_threshold = failure_threshold
+        self._base_seconds = base_seconds
+        self._max_seconds = max_seconds
+
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opens = 0
+        self._retry_at: float | None = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._retry_at is not None
+
+    @contextlib.contextmanager
+    def call(self) -> typing.Iterator[None]:
+        probe = self._admit()
+        try:
+            yield
+        except psycopg2.pool.PoolError:
+            self._release(probe=probe)
+            raise
+        except Exception as e:
+            if not is_connection_error(e):
+                self._succeeded(probe=probe)
+                raise
+
+            retry_after_seconds = self._failed(probe=probe, error=e)
+            raise data.DbUnavailableError(
+                f"The {self._name} is unavailable: {e!s}".strip(),
+                retry_after_seconds=retry_after_seconds,
+            ) from e
+        except BaseException:
+            self._release(probe=probe)
+            raise
+        else:
+            self._succeeded(probe=probe)
+
+    def _admit(self) -> bool:
+        with self._lock:
+            if self._retry_at is None:
+                return False
+
+            now = time.monotonic()
+            if now < self._retry_at:
+                retry_after_seconds = self._retry_at - now
+            elif self._probing:
+                retry_after_seconds = 1.0
+            else:
+                self._probing = True
+                return True
+
+        raise data.DbUnavailableError(
+            f"The {self._name} circuit is open, retrying in {retry_after_seconds:.0f} seconds.",
+            retry_after_seconds=retry_after_seconds,
+        )
+
+    def _failed(self, *, probe: bool, error: BaseException) -> float:
+        with self._lock:
+            if probe:
+                self._probing = False
+
+            self._failures += 1
+            if not probe and self._retry_at is None and self._failures < self._failure_threshold:
+                return 0
+
+            if probe or self._retry_at is None:
+                self._opens += 1
+                backoff = min(self._base_seconds * 2 ** (self._opens - 1), self._max_seconds)
+                # equal jitter: at least half the backoff, so the delay still grows
+                backoff = backoff / 2 + random.uniform(0, backoff / 2)
+                self._retry_at = time.monotonic() + backoff
+                loguru.logger.warning(
+                    f"The {self._name} circuit is open after {self._failures} failures, "
+                    f"probing again in {backoff:.1f} seconds: {error!s}".strip()
+                )
+            return max(self._retry_at - time.monotonic(), 0)
+
+    def _release(self, *, probe: bool) -> None:
+        if probe:
+            with self._lock:
+                self._probing = False
+
+    def _succeeded(self, *, probe: bool) -> None:
+        with self._lock:
+            if probe:
+                self._probing = False
+
+            if self._retry_at is not None:
+                loguru.logger.info(f"The {self._name} is answering again, closing the circuit.")
+            self._failures = 0
+            self._opens = 0
+            self._retry_at = None
+
+
+def is_connection_error(e: BaseException, /) -> bool:
+    """Whether e says the connection to the server failed, rather than that the server answered with an error.
+
+    An OperationalError with a SQLSTATE, such as a cancelled statement or a lock timeout, came from a server that is up;
+    only connection exceptions (class 08) and the server shutting down (57P01 to 57P03) mean it is not.
+    """
+    if not isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+        return False
+    pgcode: str | None = getattr(e, "pgcode", None)
+    return pgcode is None or pgcode.startswith("08") or pgcode in ("57P01", "57P02", "57P03")
@@ -7,18 +7,41 @@ import typing
 
 import loguru
 
+from src import data
+
 __all__ = (
+    "get_claim_connections",
     "get_conda_project_root",
+    "get_conda_worker_max_calls",
+    "get_conda_worker_max_rss_mb",
+    "get_conda_workers_per_env",
     "get_connection_str",
     "get_days_logs_to_keep",
+    "get_log_rotation_hours",
+    "get_log_rotation_mb",
+    "get_maintenance_connections",
+    "get_max_connection_age_seconds",
     "get_max_connections",
     "get_max_simultaneous_jobs",
+    "get_seconds_before_batch_abandoned",
+    "get_seconds_before_force_kill",
     "get_seconds_between_cleanups",
     "get_seconds_between_retries",
     "get_seconds_between_updates",
+    "get_seconds_to_drain",
+    "get_sql_targets",
+    "get_status_port",
+    "get_trace_enabled",
+    "get_trace_max_events",
+    "get_trace_seconds_between_exports",
 )
 
 
+@functools.lru_cache
+def get_claim_connections(*, config_file: pathlib.Path) -> int:
+    return typing.cast(int, _load(config_file=config_file).get("claim-connections", 2))
+
+
 @functools.lru_cache
 def get_conda_project_root(*, config_file: pathlib.Path) -> pathlib.Path:
     folder = pathlib.Path(str(_load(config_file=config_file)["conda-project-root"]))
@@ -26,6 +49,21 @@ def get_conda_project_root(*, config_file: pathlib.Path) -> pathlib.Path:
     return folder
 
 
+@functools.lru_cache
+def get_conda_worker_max_calls(*, config_file: pathlib.Path) -> int:
+    return typing.cast(int, _load(config_file=config_file).get("conda-worker-max-calls", 100))
+
+
+@functools.lru_cache
+def get_conda_worker_max_rss_mb(*, config_file: pathlib.Path) -> int:
+    return typing.cast(int, _load(config_file=config_file).get("conda-worker-max-rss-mb", 1024))
+
+
+@functools.lru_cache
+def get_conda_workers_per_env(*, config_file: pathlib.Path) -> int:
+    return typing.cast(int, _load(config_file=config_file).get("conda-workers-per-env", 2))
+
+
 @functools.lru_cache
 def get_connection_str(*, config_file: pathlib.Path) -> str:
     return str(_load(config_file=config_file)["connection-string"])
@@ -36,6 +74,26 @@ def get_days_logs_to_keep(*, config_file: pathlib.Path) -> int:
     return typing.cast(int, _load(config_file=config_file)["days-logs-to-keep"])
 
 
+@functools.lru_cache
+def get_log_rotation_hours(*, config_file: pathlib.Path) -> int:
+    return typing.cast(int, _load(config_file=config_file).get("log-rotation-hours", 24))
+
+
+@functools.lru_cache
+def get_log_rotation_mb(*, config_file: pathlib.Path) -> int:
+    return typing.cast(int, _load(config_file=config_file).get("log-rotation-mb", 10))
+
+
+@functools.lru_cache
+def get_maintenance_connections(*, config_file: pathlib.Path) -> int:
+    return typing.cast(int, _load(config_file=config_file).get("maintenance-connections", 2))
+
+
+@functools.lru_cache
+def get_max_connection_age_seconds(*, config_file: pathlib.Path) -> int:
+    return typing.cast(int, _load(config_file=config_file).get("max-connection-age-seconds", 1800))
+
+
 @functools.lru_cache
 def get_max_connections(*, config_file: pathlib.Path) -> int:
     return typing.cast(int, _load(config_file=config_file)["max-connections"])
@@ -46,6 +104,16 @@ def get_max_simultaneous_jobs(*, config_file: pathlib.Path) -> int:
     return typing.cast(int, _load(config_file=config_file)["max-simultaneous-jobs"])
 
 
+@functools.lru_cache
+def get_seconds_before_force_kill(*, config_file: pathlib.Path) -> int:
+    return typing.cast(int, _load(config_file=config_file).get("seconds-before-force-kill", 10))
+
+
+@functools.lru_cache
+def get_seconds_before_batch_abandoned(*, config_file: pathlib.Path) -> int:
+    return typing.cast(int, _load(config_file=config_file).get("seconds-before-batch-abandoned", 300))
+
+
 @functools.lru_cache
 def get_seconds_between_cleanups(*, config_file: pathlib.Path) -> int:
     return typing.cast(int, _load(config_file=config_file)["seconds-between-cleanups"])
@@ -66,6 +134,48 @@ def get_seconds_between_task_issue_updates(*, config_file: pathlib.Path) -> int:
     return typing.cast(int, _load(config_file=config_file)["seconds-between-task-issue-updates"])
 
 
+@functools.lru_cache
+def get_seconds_to_drain(*, config_file: pathlib.Path) -> int:
+    return typing.cast(int, _load(config_file=config_file).get("seconds-to-drain", 300))
+
+
+@functools.lru_cache
+def get_sql_targets(*, config_file: pathlib.Path) -> dict[str, data.SqlTarget]:
+    return {
+        name: data.SqlTarget(
+            name=name,
+            connection_str=str(target["connection-string"]),
+            max_connections=int(target.get("max-connections", 2)),
+            idle_seconds=int(target.get("idle-seconds", 300)),
+            connect_timeout_seconds=int(target.get("connect-timeout-seconds", 10)),
+        )
+        for name, target in typing.cast(
+            dict[str, dict[str, typing.Any]],
+            _load(config_file=config_file).get("sql-targets", {}),
+        ).items()
+    }
+
+
+@functools.lru_cache
+def get_status_port(*, config_file: pathlib.Path) -> int:
+    return typing.cast(int, _load(config_file=config_file).get("status-port", 8765))
+
+
+@functools.lru_cache
+def get_trace_enabled(*, config_file: pathlib.Path) -> bool:
+    return typing.cast(bool, _load(config_file=config_file).get("trace-enabled", False))
+
+
+@functools.lru_cache
+def get_trace_max_events(*, config_file: pathlib.Path) -> int:
+    return typing.cast(int, _load(config_file=config_file).get("trace-max-events", 100_000))
+
+
+@functools.lru_cache
+def get_trace_seconds_between_exports(*, config_file: pathlib.Path) -> int:
+    return typing.cast(int, _load(config_file=config_file).get("trace-seconds-between-exports", 300))
+
+
 @functools.lru_cache
 def _load(*, config_file: pathlib.Path) -> dict[str, typing.Hashable]:
     loguru.logger.info(f"Loading config file at {config_file.resolve()!s}...")
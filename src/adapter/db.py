@@ -1,189 +1,581 @@
 from __future__ import annotations
 
 import contextlib
+import dataclasses
+import datetime
 import threading
+import time
+import typing
 
 import loguru
+import psycopg2.extensions
 import psycopg2.pool
 # noinspection PyProtectedMember
 from psycopg2._psycopg import connection
 
 from src import data
+from src.adapter.circuit_breaker import CircuitBreaker, is_connection_error
 
-__all__ = ("create_batch", "create_pool", "Pg", "open_db")
+__all__ = ("create_batch", "create_pools", "Pg", "Pools", "open_db", "SessionConnection", "SessionPool")
+
+
+class SessionConnection(psycopg2.extensions.connection):
+    """A connection that remembers its age and which statements have been PREPAREd on it."""
+
+    def __init__(self, *args: typing.Any, **kwargs: typing.Any):
+        super().__init__(*args, **kwargs)
+
+        self.opened = time.monotonic()
+        self.last_used = self.opened
+        self.prepared: set[str] = set()
+
+
+class SessionPool(psycopg2.pool.ThreadedConnectionPool):
+    """A ThreadedConnectionPool whose connections have their timeouts set once per session, are checked before being
+    handed out if they have been idle for a while, and are replaced once they reach max_age_seconds.
+
+    Unlike ThreadedConnectionPool, getconn() waits up to wait_seconds for a connection to be returned when all maxconn
+    are in use, rather than raising PoolError straight away, so more threads can share a pool than it has connections.
+    """
+
+    def __init__(
+        self,
+        minconn: int,
+        maxconn: int,
+        *,
+        dsn: str,
+        name: str,
+        statement_timeout: str = "5min",
+        lock_timeout: str = "1min",
+        max_age_seconds: int = 1800,
+        idle_seconds_before_check: int = 30,
+        wait_seconds: float = 60,
+    ):
+        self._name = name
+        self._statement_timeout = statement_timeout
+        self._lock_timeout = lock_timeout
+        self._max_age_seconds = max_age_seconds
+        self._idle_seconds_before_check = idle_seconds_before_check
+        self._wait_seconds = wait_seconds
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+        super().__init__(minconn, maxconn, dsn=dsn, connection_factory=SessionConnection)
+
+    def getconn(self, key: typing.Hashable | None = None) -> SessionConnection:
+        if not self._slots.acquire(timeout=self._wait_seconds):
+            raise psycopg2.pool.PoolError(
+                f"Waited {self._wait_seconds} seconds for a {self._name} connection, but all {self.maxconn} were in use."
+            )
+
+        try:
+            while True:
+                con: SessionConnection = super().getconn(key)
+                if self._is_healthy(con):
+                    return con
+
+                loguru.logger.info(f"Replacing {self._name} connection.")
+                super().putconn(con, close=True)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn: SessionConnection | None = None, key: typing.Hashable | None = None, close: bool = False) -> None:
+        if conn is not None:
+            conn.last_used = time.monotonic()
+        try:
+            super().putconn(conn, key=key, close=close)
+        finally:
+            self._slots.release()
+
+    def _connect(self, key: typing.Hashable | None = None) -> SessionConnection:
+        con: SessionConnection = super()._connect(key)
+        with con.cursor() as cur:
+            cur.execute(
+                "SET statement_timeout = %(statement_timeout)s; SET lock_timeout = %(lock_timeout)s;",
+                {"statement_timeout": self._statement_timeout, "lock_timeout": self._lock_timeout},
+            )
+        con.commit()
+        return con
+
+    def _is_healthy(self, con: SessionConnection, /) -> bool:
+        if con.closed:
+            return False
+
+        now = time.monotonic()
+        if now - con.opened > self._max_age_seconds:
+            return False
+
+        if now - con.last_used > self._idle_seconds_before_check:
+            try:
+                with con.cursor() as cur:
+                    cur.execute("SELECT 1;")
+                con.rollback()
+            except psycopg2.Error:
+                return False
+
+        return True
+
+
+@dataclasses.dataclass(frozen=True, kw_only=True)
+class Pools:
+    """Separate pools so that slow maintenance work cannot starve claims or result writes."""
+
+    claim: SessionPool
+    result: SessionPool
+    maintenance: SessionPool
+
+    @staticmethod
+    def shared(pool: SessionPool, /) -> Pools:
+        return Pools(claim=pool, result=pool, maintenance=pool)
+
+    def closeall(self) -> None:
+        for pool in {id(p): p for p in (self.claim, self.result, self.maintenance)}.values():
+            if not pool.closed:
+                pool.closeall()
 
 
 @contextlib.contextmanager
-def create_pool(
+def create_pools(
     *,
     connection_str: str,
-    max_size: int,
-) -> psycopg2.pool.ThreadedConnectionPool:
-    pool = psycopg2.pool.ThreadedConnectionPool(3, max_size, dsn=connection_str)
+    claim_connections: int,
+    result_connections: int,
+    maintenance_connections: int,
+    max_connection_age_seconds: int,
+) -> typing.Iterator[Pools]:
+    pools = Pools(
+        claim=SessionPool(
+            1,
+            claim_connections,
+            dsn=connection_str,
+            name="claim",
+            statement_timeout="1min",
+            lock_timeout="30s",
+            max_age_seconds=max_connection_age_seconds,
+        ),
+        result=SessionPool(
+            1,
+            result_connections,
+            dsn=connection_str,
+            name="result",
+            statement_timeout="1min",
+            lock_timeout="30s",
+            max_age_seconds=max_connection_age_seconds,
+        ),
+        maintenance=SessionPool(
+            1,
+            maintenance_connections,
+            dsn=connection_str,
+            name="maintenance",
+            statement_timeout="5min",
+            lock_timeout="1min",
+            max_age_seconds=max_connection_age_seconds,
+        ),
+    )
     try:
-        yield pool
+        yield pools
     finally:
-        pool.closeall()
+        pools.closeall()
 
 
 # noinspection PyBroadException
 @contextlib.contextmanager
-def _connect(*, pool: psycopg2.pool.ThreadedConnectionPool) -> connection:
-    con: connection = pool.getconn()
-    try:
-        yield con
-    except BaseException:
-        con.rollback()
-        raise
-    else:
-        con.commit()
-    finally:
-        pool.putconn(con)
+def _connect(
+    *,
+    pool: psycopg2.pool.ThreadedConnectionPool,
+    breaker: CircuitBreaker | None = None,
+    read_only: bool = False,
+) -> typing.Iterator[connection]:
+    """A read_only transaction is always rolled back."""
+    with breaker.call() if breaker is not None else contextlib.nullcontext():
+        con: connection = pool.getconn()
+        broken = False
+        try:
+            if read_only:
+                with con.cursor() as cur:
+                    cur.execute("SET TRANSACTION READ ONLY;")
+            yield con
+        except BaseException as e:
+            if is_connection_error(e):
+                # the connection may be unusable, so don't hand it out again
+                broken = True
+            else:
+                try:
+                    con.rollback()
+                except psycopg2.Error:
+                    broken = True
+            raise
+        else:
+            if read_only:
+                con.rollback()
+            else:
+                con.commit()
+        finally:
+            pool.putconn(con, close=broken or bool(con.closed))
 
 
-def open_db(*, batch_id: int, pool: psycopg2.pool.ThreadedConnectionPool, days_logs_to_keep: int) -> data.Db:
+def open_db(*, batch_id: int, pools: Pools, days_logs_to_keep: int) -> data.Db:
     loguru.logger.info("Opening database...")
 
-    return Pg(batch_id=batch_id, pool=pool, days_logs_to_keep=days_logs_to_keep)
+    return Pg(batch_id=batch_id, pools=pools, days_logs_to_keep=days_logs_to_keep)
 
 
 # noinspection SqlDialectInspection
 def create_batch(*, pool: psycopg2.pool.ThreadedConnectionPool) -> int:
     with _connect(pool=pool) as con:
         with con.cursor() as cur:
-            cur.execute("SET LOCAL statement_timeout = '5min';SET LOCAL lock_timeout = '1min';")
             cur.execute("SELECT * FROM ppe.create_batch();")
             if row := cur.fetchone():
                 return row[0]
             raise Exception(f"ppe.create_batch should have returned an int, but returned {row!r}.")
 
 
+_TASK_COLUMNS = """
+    t.task_id
+,   t.task_name
+,   t.tool
+,   t.tool_args
+,   t.task_sql
+,   t.retries
+,   t.timeout_seconds
+,   t.conda_env
+,   t.project_name
+,   t.fn
+,   t.fn_args
+,   t.sql_target
+,   t.fingerprint_sql
+"""
+
+# name -> (parameter types, statement)
+_PREPARED_STATEMENTS: dict[str, tuple[str, str]] = {
+    "ppe_claim_task": ("(INT)", f"SELECT {_TASK_COLUMNS} FROM ppe.claim_task(p_task_id := $1) AS t"),
+    "ppe_create_job": ("(INT, INT)", "SELECT * FROM ppe.create_job(p_batch_id := $1, p_task_id := $2)"),
+    "ppe_get_dispatch_candidates": ("", """
+        SELECT
+            c.task_id
+        ,   c.task_name
+        ,   c.latest_attempt_ts
+        ,   c.ready_ts
+        ,   c.expected_millis
+        ,   c.p95_millis
+        ,   c.window_start_ts
+        ,   c.window_end_ts
+        ,   c.running_peer_millis
+        FROM ppe.get_dispatch_candidates() AS c
+    """),
+    "ppe_get_ready_task": ("", f"SELECT {_TASK_COLUMNS} FROM ppe.get_ready_task() AS t"),
+}
+
+
+def _execute_prepared(*, cur: psycopg2.extensions.cursor, name: str, params: tuple[typing.Any, ...] = ()) -> None:
+    con = typing.cast(SessionConnection, cur.connection)
+    if name not in con.prepared:
+        param_types, sql = _PREPARED_STATEMENTS[name]
+        cur.execute(f"PREPARE {name} {param_types} AS {sql};")
+        con.prepared.add(name)
+
+    if params:
+        cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))});", params)
+    else:
+        cur.execute(f"EXECUTE {name};")
+
+
 # noinspection SqlDialectInspection
 class Pg(data.Db):
     def __init__(
         self,
         *,
         batch_id: int,
-        pool: psycopg2.pool.ThreadedConnectionPool,
+        pools: Pools,
         days_logs_to_keep: int,
+        breaker: CircuitBreaker | None = None,
     ):
         self._batch_id = batch_id
-        self._pool = pool
+        self._pools = pools
         self._days_logs_to_keep = days_logs_to_keep
+        # shared by every call, so that an outage seen by one thread stops the others from waiting on it too
+        self._breaker = breaker or CircuitBreaker()
 
-        self._lock = threading.Lock()
+        self._claim_lock = threading.Lock()
+        self._maintenance_lock = threading.Lock()
+
+    def cancel_abandoned_jobs(self, *, reason: str, seconds_before_abandoned: int) -> None:
+        with self._maintenance_lock:
+            with _connect(pool=self._pools.maintenance, breaker=self._breaker) as con:
+                with con.cursor() as cur:
+                    cur.execute(
+                        """
+                        CALL ppe.cancel_running_jobs(
+                            p_reason := %(reason)s
+                        ,   p_current_batch_id := %(batch_id)s
+                        ,   p_seconds_before_abandoned := %(seconds_before_abandoned)s
+                        );
+                        """,
+                        {"reason": reason, "batch_id": self._batch_id, "seconds_before_abandoned": seconds_before_abandoned},
+                    )
 
     def cancel_running_jobs(self, *, reason: str) -> None:
-        with self._lock:
-            with self._pool.getconn() as con:
+        with self._maintenance_lock:
+            with _connect(pool=self._pools.maintenance, breaker=self._breaker) as con:
                 with con.cursor() as cur:
-                    cur.execute("SET LOCAL statement_timeout = '5min';SET LOCAL lock_timeout = '1min';")
                     cur.execute(
                         "CALL ppe.cancel_running_jobs(p_reason := %(reason)s);",
                         {"reason": reason},
                     )
 
+    def claim_job(self, *, task_id: int) -> data.Job | None:
+        with self._claim_lock:
+            with _connect(pool=self._pools.claim, breaker=self._breaker) as con:
+                with con.cursor() as cur:
+                    _execute_prepared(cur=cur, name="ppe_claim_task", params=(task_id,))
+                    if row := cur.fetchone():
+                        return self._create_job(cur=cur, task=_task_from_row(row))
+        return None
+
     def delete_old_logs(self) -> None:
         loguru.logger.debug("Deleting old logs...")
-        with self._lock:
-            with _connect(pool=self._pool) as con:
+        with self._maintenance_lock:
+            with _connect(pool=self._pools.maintenance, breaker=self._breaker) as con:
                 with con.cursor() as cur:
-                    cur.execute("SET LOCAL statement_timeout = '5min';SET LOCAL lock_timeout = '1min';")
                     cur.execute(
                         "CALL ppe.delete_old_log_entries(p_current_batch_id := %(batch_id)s, p_days_to_keep := %(days_to_keep)s)",
                         {"batch_id": self._batch_id, "days_to_keep": self._days_logs_to_keep},
                     )
         loguru.logger.debug("Finished deleting old logs.")
 
+    def end_batch(self) -> None:
+        with _connect(pool=self._pools.result, breaker=self._breaker) as con:
+            with con.cursor() as cur:
+                cur.execute("CALL ppe.end_batch(p_batch_id := %(batch_id)s);", {"batch_id": self._batch_id})
+
+    def fetch_fingerprint(self, *, sql: str) -> tuple[typing.Any, ...] | None:
+        # a task's own query, so it cannot write, and its errors and timeouts say nothing about whether the database is
+        # up; it also stays off the result pool, where it would hold up result writes
+        with _connect(pool=self._pools.maintenance, read_only=True) as con:
+            with con.cursor() as cur:
+                cur.execute(sql)
+                return cur.fetchone()
+
     def get_ready_job(self) -> data.Job | None:
-        with self._lock:
-            with _connect(pool=self._pool) as con:
+        with self._claim_lock:
+            with _connect(pool=self._pools.claim, breaker=self._breaker) as con:
                 with con.cursor() as cur:
-                    cur.execute("SET LOCAL statement_timeout = '5min';SET LOCAL lock_timeout = '1min';")
-                    cur.execute("""
-                        SELECT
-                            t.task_id
-                        ,   t.task_name
-                        ,   t.tool
-                        ,   t.tool_args
-                        ,   t.task_sql
-                        ,   t.retries
-                        ,   t.timeout_seconds
-                        FROM ppe.get_ready_task() AS t;
-                    """)
+                    _execute_prepared(cur=cur, name="ppe_get_ready_task")
                     if row := cur.fetchone():
-                        task = data.Task(
-                            task_id=row[0],
-                            name=row[1],
-                            tool=row[2],
-                            tool_args=row[3],
-                            sql=row[4],
-                            retries=row[5],
-                            timeout_seconds=row[6],
-                        )
-                        cur.execute(
-                            "SELECT * FROM ppe.create_job(p_batch_id := %(batch_id)s, p_task_id := %(task_id)s);",
-                            {"batch_id": self._batch_id, "task_id": task.task_id},
-                        )
-                        if row := cur.fetchone():
-                            job_id = row[0]
-                        else:
-                            raise Exception(f"ppe.create_job should have returned an int, but returned {row!r}.")
-                        return data.Job(job_id=job_id, batch_id=self._batch_id, task=task)
+                        return self._create_job(cur=cur, task=_task_from_row(row))
         return None
 
-    def log_batch_info(self, *, message: str) -> None:
-        with _connect(pool=self._pool) as con:
+    def get_queued_tasks(self) -> list[data.QueuedTask]:
+        with _connect(pool=self._pools.claim, breaker=self._breaker) as con:
+            with con.cursor() as cur:
+                _execute_prepared(cur=cur, name="ppe_get_dispatch_candidates")
+                return [
+                    data.QueuedTask(
+                        task_id=row[0],
+                        name=row[1],
+                        latest_attempt_ts=row[2],
+                        ready_ts=row[3],
+                        expected_millis=row[4],
+                        p95_millis=row[5],
+                        window_start_ts=row[6],
+                        window_end_ts=row[7],
+                        running_peer_millis=row[8],
+                    )
+                    for row in cur.fetchall()
+                ]
+
+    def get_resource_status(self) -> list[data.ResourceStatus]:
+        with _connect(pool=self._pools.maintenance, breaker=self._breaker) as con:
+            with con.cursor() as cur:
+                cur.execute("SELECT * FROM ppe.get_resource_status();")
+                return [
+                    data.ResourceStatus(resource_id=row[0], name=row[1], capacity=row[2], reserved=row[3], available=row[4])
+                    for row in cur.fetchall()
+                ]
+
+    def heartbeat(self) -> None:
+        with _connect(pool=self._pools.maintenance, breaker=self._breaker) as con:
+            with con.cursor() as cur:
+                cur.execute("CALL ppe.batch_heartbeat(p_batch_id := %(batch_id)s);", {"batch_id": self._batch_id})
+
+    def log_batch_info(self, *, message: str, ts: datetime.datetime | None = None) -> None:
+        with _connect(pool=self._pools.result, breaker=self._breaker) as con:
             with con.cursor() as cur:
-                cur.execute("SET LOCAL statement_timeout = '5min';SET LOCAL lock_timeout = '1min';")
                 cur.execute(
-                    "CALL ppe.log_batch_info(p_batch_id := %(batch_id)s, p_message := %(message)s);",
-                    {"batch_id": self._batch_id, "message": message},
+                    "CALL ppe.log_batch_info(p_batch_id := %(batch_id)s, p_message := %(message)s, p_ts := %(ts)s);",
+                    {"batch_id": self._batch_id, "message": message, "ts": ts},
                 )
 
-    def log_batch_error(self, *, error_message: str) -> None:
-        with _connect(pool=self._pool) as con:
+    def log_batch_error(self, *, error_message: str, ts: datetime.datetime | None = None) -> None:
+        with _connect(pool=self._pools.result, breaker=self._breaker) as con:
             with con.cursor() as cur:
-                cur.execute("SET LOCAL statement_timeout = '5min';SET LOCAL lock_timeout = '1min';")
                 cur.execute(
-                    "CALL ppe.log_batch_error(p_batch_id := %(batch_id)s, p_message := %(error_message)s);",
-                    {"batch_id": self._batch_id, "error_message": error_message},
+                    "CALL ppe.log_batch_error(p_batch_id := %(batch_id)s, p_message := %(error_message)s, p_ts := %(ts)s);",
+                    {"batch_id": self._batch_id, "error_message": error_message, "ts": ts},
                 )
 
-    def log_job_error(self, *, job_id: int, return_code: int, error_message: str) -> None:
-        with _connect(pool=self._pool) as con:
+    def log_job_cancelled(self, *, job_id: int, reason: str, ts: datetime.datetime | None = None) -> None:
+        with _connect(pool=self._pools.result, breaker=self._breaker) as con:
             with con.cursor() as cur:
-                cur.execute("SET LOCAL statement_timeout = '5min';SET LOCAL lock_timeout = '1min';")
                 cur.execute(
-                    "CALL ppe.job_failed(p_job_id := %(job_id)s, p_message := %(error_message)s);",
-                    {"job_id": job_id, "error_message": error_message},
+                    "CALL ppe.job_cancelled(p_job_id := %(job_id)s, p_reason := %(reason)s, p_ts := %(ts)s);",
+                    {"job_id": job_id, "reason": reason, "ts": ts},
                 )
 
-    def log_job_success(self, *, job_id: int, execution_millis: int) -> None:
-        with _connect(pool=self._pool) as con:
+    def log_job_error(
+        self,
+        *,
+        job_id: int,
+        return_code: int,
+        error_message: str,
+        timed_out: bool,
+        retries: int = 0,
+        resource_usage: data.ResourceUsage | None = None,
+        ts: datetime.datetime | None = None,
+    ) -> None:
+        with _connect(pool=self._pools.result, breaker=self._breaker) as con:
             with con.cursor() as cur:
-                cur.execute("SET LOCAL statement_timeout = '5min';SET LOCAL lock_timeout = '1min';")
                 cur.execute(
-                    "CALL ppe.job_completed_successfully(p_job_id := %(job_id)s, p_execution_millis := %(execution_millis)s);",
-                    {"job_id": job_id, "execution_millis": execution_millis},
+                    """
+                    CALL ppe.job_failed(
+                        p_job_id := %(job_id)s
+                    ,   p_message := %(error_message)s
+                    ,   p_timed_out := %(timed_out)s
+                    ,   p_retries := %(retries)s
+                    ,   p_ts := %(ts)s
+                    );
+                    """,
+                    {
+                        "job_id": job_id,
+                        "error_message": error_message,
+                        "timed_out": timed_out,
+                        "retries": retries,
+                        "ts": ts,
+                    },
                 )
+                _log_resource_usage(cur=cur, job_id=job_id, resource_usage=resource_usage)
+
+    def log_job_info(self, *, job_id: int, message: str, ts: datetime.datetime | None = None) -> None:
+        with _connect(pool=self._pools.result, breaker=self._breaker) as con:
+            with con.cursor() as cur:
+                cur.execute(
+                    "CALL ppe.log_job_info(p_job_id := %(job_id)s, p_message := %(message)s, p_ts := %(ts)s);",
+                    {"job_id": job_id, "message": message, "ts": ts},
+                )
+
+    def log_job_success(
+        self,
+        *,
+        job_id: int,
+        execution_millis: int,
+        retries: int = 0,
+        resource_usage: data.ResourceUsage | None = None,
+        ts: datetime.datetime | None = None,
+    ) -> None:
+        with _connect(pool=self._pools.result, breaker=self._breaker) as con:
+            with con.cursor() as cur:
+                cur.execute(
+                    """
+                    CALL ppe.job_completed_successfully(
+                        p_job_id := %(job_id)s
+                    ,   p_execution_millis := %(execution_millis)s
+                    ,   p_retries := %(retries)s
+                    ,   p_ts := %(ts)s
+                    );
+                    """,
+                    {"job_id": job_id, "execution_millis": execution_millis, "retries": retries, "ts": ts},
+                )
+                _log_resource_usage(cur=cur, job_id=job_id, resource_usage=resource_usage)
+
+    def skip_job_if_unchanged(self, *, job_id: int, fingerprint: str | None) -> bool:
+        with _connect(pool=self._pools.result, breaker=self._breaker) as con:
+            with con.cursor() as cur:
+                cur.execute(
+                    "SELECT ppe.skip_job_if_unchanged(p_job_id := %(job_id)s, p_fingerprint := %(fingerprint)s);",
+                    {"job_id": job_id, "fingerprint": fingerprint},
+                )
+                return bool(typing.cast(tuple[bool], cur.fetchone())[0])
 
     def update_queue(self) -> None:
         loguru.logger.debug("Updating queue...")
-        with self._lock:
-            with _connect(pool=self._pool) as con:
-                cur: psycopg2.cursor
-                with con.cursor() as cur:
-                    cur.execute("SET LOCAL statement_timeout = '5min';SET LOCAL lock_timeout = '1min';")
-                    cur.execute("CALL ppe.update_queue();")
+        # claims are not held up by the rebuild; ppe.claim_task turns down queue rows that a concurrent claim made stale
+        with _connect(pool=self._pools.maintenance, breaker=self._breaker) as con:
+            with con.cursor() as cur:
+                cur.execute("CALL ppe.update_queue();")
         loguru.logger.debug("Finished updating queue.")
 
     def update_task_issues(self) -> None:
         loguru.logger.debug("Updating task issues...")
-        with self._lock:
-            with _connect(pool=self._pool) as con:
-                cur: psycopg2.cursor
+        with self._maintenance_lock:
+            with _connect(pool=self._pools.maintenance, breaker=self._breaker) as con:
                 with con.cursor() as cur:
-                    cur.execute("SET LOCAL statement_timeout = '5min';SET LOCAL lock_timeout = '1min';")
                     cur.execute("CALL ppe.update_task_issues();")
         loguru.logger.debug("Finished updating task issues.")
+
+    def _create_job(self, *, cur: psycopg2.extensions.cursor, task: data.Task) -> data.Job:
+        _execute_prepared(cur=cur, name="ppe_create_job", params=(self._batch_id, task.task_id))
+        if row := cur.fetchone():
+            return data.Job(job_id=row[0], batch_id=self._batch_id, task=task)
+        raise Exception(f"ppe.create_job should have returned an int, but returned {row!r}.")
+
+
+def _log_resource_usage(
+    *,
+    cur: psycopg2.extensions.cursor,
+    job_id: int,
+    resource_usage: data.ResourceUsage | None,
+) -> None:
+    if resource_usage is None:
+        return
+
+    cur.execute(
+        """
+        CALL ppe.log_job_resource_usage(
+            p_job_id := %(job_id)s
+        ,   p_wall_millis := %(wall_millis)s
+        ,   p_user_cpu_millis := %(user_cpu_millis)s
+        ,   p_system_cpu_millis := %(system_cpu_millis)s
+        ,   p_peak_rss_kb := %(peak_rss_kb)s
+        ,   p_block_reads := %(block_reads)s
+        ,   p_block_writes := %(block_writes)s
+        ,   p_voluntary_context_switches := %(voluntary_context_switches)s
+        ,   p_involuntary_context_switches := %(involuntary_context_switches)s
+        );
+        """,
+        {"job_id": job_id, **dataclasses.asdict(resource_usage)},
+    )
+
+
+def _task_from_row(row: tuple[typing.Any, ...], /) -> data.Task:
+    task_id, name, tool, tool_args, sql, retries, timeout_seconds, conda_env, project_name, fn, fn_args, sql_target, fingerprint_sql = row
+    if conda_env:
+        return data.CondaProjectTask(
+            task_id=task_id,
+            name=name,
+            timeout_seconds=timeout_seconds,
+            retries=retries,
+            env=conda_env,
+            project_name=project_name,
+            fn=fn or "src.main",
+            fn_args=data.freeze_fn_args(fn_args),
+            fingerprint_sql=fingerprint_sql,
+        )
+    if tool:
+        return data.CmdLineUtilityTask(
+            task_id=task_id,
+            name=name,
+            timeout_seconds=timeout_seconds,
+            retries=retries,
+            tool=tool,
+            tool_args=tool_args,
+            fingerprint_sql=fingerprint_sql,
+        )
+    return data.SQLTask(
+        task_id=task_id,
+        name=name,
+        timeout_seconds=timeout_seconds,
+        retries=retries,
+        sql=sql,
+        target=sql_target,
+        fingerprint_sql=fingerprint_sql,
+    )
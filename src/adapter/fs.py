@@ -3,7 +3,7 @@ import os
 import pathlib
 import sys
 
-__all__ = ("get_config_path", "get_log_folder", "get_tool_dir")
+__all__ = ("get_config_path", "get_journal_folder", "get_log_folder", "get_tool_dir")
 
 
 @functools.lru_cache(maxsize=1)
@@ -24,6 +24,13 @@ def get_config_path() -> pathlib.Path:
     return _root_dir() / "assets" / "config.json"
 
 
+@functools.lru_cache
+def get_journal_folder() -> pathlib.Path:
+    d = _root_dir() / "journal"
+    d.mkdir(exist_ok=True)
+    return d
+
+
 @functools.lru_cache
 def get_log_folder() -> pathlib.Path:
     d = _root_dir() / "logs"
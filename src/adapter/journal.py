@@ -0,0 +1,350 @@
+from __future__ import annotations
+
+import dataclasses
+import datetime
+import json
+import os
+import pathlib
+import threading
+import typing
+
+import loguru
+import psycopg2.extensions
+import psycopg2.pool
+
+from src import data
+from src.adapter.circuit_breaker import is_connection_error
+
+__all__ = ("Journal", "JournaledDb")
+
+
+@dataclasses.dataclass(frozen=True, kw_only=True)
+class _Entry:
+    seq: int
+    batch_id: int
+    op: str
+    args: dict[str, typing.Any]
+
+
+class Journal:
+    """An append-only file of writes that have to reach the database eventually.
+
+    append() returns once the entry is on disk.  Threads appending at the same time share an fsync: the first one to
+    need it syncs everything written so far while the others wait, so a burst of results costs one fsync, not one
+    each.  pending() hands entries out in the order they were appended, and mark_replayed() records how far they have
+    been written to the database in a checkpoint file next to the journal, so whatever is left when ppe stops is
+    replayed when it starts again.  Once everything has been replayed, the journal is truncated.
+    """
+
+    def __init__(self, *, folder: pathlib.Path, file_name: str = "journal.jsonl"):
+        self._path = folder / file_name
+        self._checkpoint_path = self._path.with_suffix(".checkpoint")
+
+        self._changed = threading.Condition()
+        self._replayed = self._read_checkpoint()
+        self._pending = [e for e in self._read() if e.seq > self._replayed]
+        self._seq = max([self._replayed] + [e.seq for e in self._pending])
+        self._synced = self._seq
+        self._syncing = False
+
+        self._fh = self._path.open("a", encoding="utf-8")
+
+    def append(self, *, batch_id: int, op: str, args: dict[str, typing.Any]) -> None:
+        with self._changed:
+            self._seq += 1
+            entry = _Entry(seq=self._seq, batch_id=batch_id, op=op, args=args)
+            self._fh.write(json.dumps(dataclasses.asdict(entry), default=str) + "\n")
+            self._fh.flush()
+            self._pending.append(entry)
+            self._changed.notify_all()
+
+            while self._synced < entry.seq:
+                if self._syncing:
+                    self._changed.wait()
+                    continue
+
+                self._syncing = True
+                seq = self._seq
+                self._changed.release()
+                try:
+                    os.fsync(self._fh.fileno())
+                finally:
+                    self._changed.acquire()
+                    self._syncing = False
+                    self._changed.notify_all()
+                self._synced = max(self._synced, seq)
+
+    def close(self) -> None:
+        with self._changed:
+            self._fh.close()
+
+    def mark_replayed(self, *, seq: int) -> None:
+        with self._changed:
+            if seq <= self._replayed:
+                return
+
+            self._replayed = seq
+            self._pending = [e for e in self._pending if e.seq > seq]
+            self._write_checkpoint(seq)
+
+            # the checkpoint says everything up to seq is in the database, so the entries can go
+            if not self._pending and not self._syncing:
+                self._fh.truncate(0)
+
+    def pending(self, *, timeout_seconds: float) -> list[_Entry]:
+        """The entries not yet replayed, waiting up to timeout_seconds for one to be appended."""
+        with self._changed:
+            if not self._pending:
+                self._changed.wait(timeout=timeout_seconds)
+            return list(self._pending)
+
+    def _read(self) -> list[_Entry]:
+        if not self._path.exists():
+            return []
+
+        content = self._path.read_bytes()
+        if not content.endswith(b"\n"):
+            # ppe stopped partway through an append; that entry was never acknowledged, so it is dropped
+            content = content[: content.rfind(b"\n") + 1]
+            with self._path.open("r+b") as fh:
+                fh.truncate(len(content))
+
+        return [_Entry(**json.loads(line)) for line in content.decode("utf-8").splitlines() if line]
+
+    def _read_checkpoint(self) -> int:
+        try:
+            return int(self._checkpoint_path.read_text().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_checkpoint(self, seq: int, /) -> None:
+        tmp = self._checkpoint_path.with_suffix(".tmp")
+        with tmp.open("w") as fh:
+            fh.write(str(seq))
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self._checkpoint_path)
+
+
+class JournaledDb(data.Db):
+    """A Db whose job results, job info and batch events go to a Journal first and reach the database from a
+    background thread, in order, once it is reachable.
+
+    A job that has finished is never lost or rerun because the database is unavailable when its result is written.
+    Each entry keeps the time it was journaled, so a result that is replayed late is recorded as finishing when it did.
+    The procedures that record a job's result do nothing for a job that already has one, so an entry that is replayed
+    twice, because ppe stopped between writing it and the checkpoint, is only counted once.  An entry is only retried
+    when it could not reach the database, see _is_transient; one the database refused is logged and dropped, so it does
+    not hold up the entries behind it.  Everything else goes straight to db.  Entries left by an earlier batch are written with a Db for that batch from open_batch_db.
+    """
+
+    _JOURNALED = (
+        "log_batch_error",
+        "log_batch_info",
+        "log_job_cancelled",
+        "log_job_error",
+        "log_job_info",
+        "log_job_success",
+    )
+
+    def __init__(
+        self,
+        *,
+        db: data.Db,
+        batch_id: int,
+        journal: Journal,
+        open_batch_db: typing.Callable[[int], data.Db],
+    ):
+        self._db = db
+        self._batch_id = batch_id
+        self._journal = journal
+        self._open_batch_db = open_batch_db
+
+        self._batch_dbs: dict[int, data.Db] = {batch_id: db}
+        self._closing = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._replay_forever, name="journal-replay", daemon=True)
+
+    def close(self, *, timeout_seconds: float = 10) -> None:
+        """Waits up to timeout_seconds for the journal to be replayed; what is left is replayed on the next start.
+
+        The replay thread has stopped by the time this returns, so the pools can be closed after it.
+        """
+        self._closing.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=timeout_seconds)
+        if self._thread.is_alive():
+            # only the write in flight is waited on
+            self._stopping.set()
+            self._thread.join()
+        self._journal.close()
+
+    def replay(self) -> None:
+        """Replays what an earlier batch left in the journal; raises DbUnavailableError if the database is down, or the
+        error that stopped an entry from being written when replaying it again could succeed."""
+        entries = self._journal.pending(timeout_seconds=0)
+        if entries:
+            loguru.logger.info(f"Replaying {len(entries)} journaled writes...")
+            self._replay(entries)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def cancel_abandoned_jobs(self, *, reason: str, seconds_before_abandoned: int) -> None:
+        self._db.cancel_abandoned_jobs(reason=reason, seconds_before_abandoned=seconds_before_abandoned)
+
+    def cancel_running_jobs(self, *, reason: str) -> None:
+        self._db.cancel_running_jobs(reason=reason)
+
+    def claim_job(self, *, task_id: int) -> data.Job | None:
+        return self._db.claim_job(task_id=task_id)
+
+    def delete_old_logs(self) -> None:
+        self._db.delete_old_logs()
+
+    def end_batch(self) -> None:
+        self._db.end_batch()
+
+    def fetch_fingerprint(self, *, sql: str) -> tuple[typing.Any, ...] | None:
+        return self._db.fetch_fingerprint(sql=sql)
+
+    def get_ready_job(self) -> data.Job | None:
+        return self._db.get_ready_job()
+
+    def get_queued_tasks(self) -> list[data.QueuedTask]:
+        return self._db.get_queued_tasks()
+
+    def get_resource_status(self) -> list[data.ResourceStatus]:
+        return self._db.get_resource_status()
+
+    def heartbeat(self) -> None:
+        self._db.heartbeat()
+
+    def log_batch_info(self, *, message: str, ts: datetime.datetime | None = None) -> None:
+        self._append("log_batch_info", ts=ts, message=message)
+
+    def log_batch_error(self, *, error_message: str, ts: datetime.datetime | None = None) -> None:
+        # the database refuses a blank message
+        self._append("log_batch_error", ts=ts, error_message=error_message.strip() or "No error message was provided.")
+
+    def log_job_cancelled(self, *, job_id: int, reason: str, ts: datetime.datetime | None = None) -> None:
+        self._append("log_job_cancelled", ts=ts, job_id=job_id, reason=reason)
+
+    def log_job_error(
+        self,
+        *,
+        job_id: int,
+        return_code: int,
+        error_message: str,
+        timed_out: bool,
+        retries: int = 0,
+        resource_usage: data.ResourceUsage | None = None,
+        ts: datetime.datetime | None = None,
+    ) -> None:
+        self._append(
+            "log_job_error",
+            ts=ts,
+            job_id=job_id,
+            return_code=return_code,
+            error_message=error_message,
+            timed_out=timed_out,
+            retries=retries,
+            resource_usage=None if resource_usage is None else dataclasses.asdict(resource_usage),
+        )
+
+    def log_job_info(self, *, job_id: int, message: str, ts: datetime.datetime | None = None) -> None:
+        self._append("log_job_info", ts=ts, job_id=job_id, message=message)
+
+    def log_job_success(
+        self,
+        *,
+        job_id: int,
+        execution_millis: int,
+        retries: int = 0,
+        resource_usage: data.ResourceUsage | None = None,
+        ts: datetime.datetime | None = None,
+    ) -> None:
+        self._append(
+            "log_job_success",
+            ts=ts,
+            job_id=job_id,
+            execution_millis=execution_millis,
+            retries=retries,
+            resource_usage=None if resource_usage is None else dataclasses.asdict(resource_usage),
+        )
+
+    def skip_job_if_unchanged(self, *, job_id: int, fingerprint: str | None) -> bool:
+        return self._db.skip_job_if_unchanged(job_id=job_id, fingerprint=fingerprint)
+
+    def update_queue(self) -> None:
+        self._db.update_queue()
+
+    def update_task_issues(self) -> None:
+        self._db.update_task_issues()
+
+    def _append(self, op: str, /, *, ts: datetime.datetime | None, **args: typing.Any) -> None:
+        ts = ts or datetime.datetime.now(datetime.timezone.utc)
+        self._journal.append(batch_id=self._batch_id, op=op, args={**args, "ts": ts.isoformat()})
+
+    def _apply(self, entry: _Entry, /) -> None:
+        if (db := self._batch_dbs.get(entry.batch_id)) is None:
+            db = self._batch_dbs[entry.batch_id] = self._open_batch_db(entry.batch_id)
+
+        args = dict(entry.args)
+        if args.get("resource_usage") is not None:
+            args["resource_usage"] = data.ResourceUsage(**args["resource_usage"])
+        # entries journaled before the time was kept are recorded as happening now
+        if args.get("ts") is not None:
+            args["ts"] = datetime.datetime.fromisoformat(args["ts"])
+        getattr(db, entry.op)(**args)
+
+    def _replay(self, entries: list[_Entry], /) -> None:
+        replayed = 0
+        try:
+            for entry in entries:
+                if self._stopping.is_set():
+                    return
+
+                if entry.op not in self._JOURNALED:
+                    loguru.logger.error(f"Dropping journaled {entry.op} {entry.args!r}, the operation is not recognized.")
+                else:
+                    try:
+                        self._apply(entry)
+                    except Exception as e:
+                        if _is_transient(e):
+                            raise
+                        loguru.logger.error(f"Dropping journaled {entry.op} {entry.args!r}, it could not be written: {e!s}")
+                replayed = entry.seq
+        finally:
+            if replayed:
+                self._journal.mark_replayed(seq=replayed)
+
+    def _replay_forever(self) -> None:
+        while not self._stopping.is_set():
+            closing = self._closing.is_set()
+            entries = self._journal.pending(timeout_seconds=0 if closing else 1)
+            if not entries and closing:
+                return
+
+            try:
+                self._replay(entries)
+            except data.DbUnavailableError as e:
+                if closing:
+                    loguru.logger.warning(f"{len(entries)} journaled writes will be replayed on the next start: {e!s}")
+                    return
+                loguru.logger.debug(f"Waiting to replay journaled writes: {e!s}")
+                self._closing.wait(max(e.retry_after_seconds, 1))
+            except Exception as e:
+                # a lost connection, an exhausted pool or a conflict with another transaction; the entry is retried
+                loguru.logger.warning(f"Unable to replay journaled writes yet: {e!s}")
+                self._stopping.wait(1)
+
+
+def _is_transient(e: Exception, /) -> bool:
+    """Whether a write that raised e could succeed if it is replayed again: the database could not be reached, no
+    pooled connection was free, or the write lost a deadlock or serialization conflict.  Anything else the database
+    answered with, such as a failed ASSERT, would go the same way every time."""
+    return (
+        isinstance(e, (data.DbUnavailableError, psycopg2.pool.PoolError, psycopg2.extensions.TransactionRollbackError))
+        or is_connection_error(e)
+    )
@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import datetime
+import gzip
+import json
+import os
+import pathlib
+import queue
+import shutil
+import sys
+import threading
+import time
+import traceback
+import typing
+
+if typing.TYPE_CHECKING:
+    import loguru
+
+__all__ = ("LogPipeline",)
+
+
+_Entry = tuple[str, dict[str, typing.Any]]
+
+
+class LogPipeline:
+    """A loguru sink that never blocks the thread that logs.
+
+    sink() only applies the repeat limit and puts the record on a bounded queue; a background thread writes the queued
+    records in batches, as text to the console and as one JSON object per line to <folder>/<file_name>.  The file is
+    rotated when it reaches rotation_bytes or is rotation_seconds old, and rotated files are gzipped and kept for
+    days_to_keep days.  When the queue is full, records are dropped and counted rather than waited on, so a slow disk
+    or a log storm costs log lines, not dispatch time.
+
+    The same message logged from the same line more than max_repeats times within repeat_window_seconds is suppressed,
+    and a count of what was suppressed is written when the window ends or the pipeline is closed.  Messages that differ,
+    such as the errors of different tasks, are counted apart, so only a storm of one message is cut short.
+    """
+
+    def __init__(
+        self,
+        *,
+        folder: pathlib.Path,
+        file_name: str = "ppe.jsonl",
+        console: typing.TextIO | None = sys.stderr,
+        max_queued_records: int = 10_000,
+        batch_size: int = 500,
+        flush_seconds: float = 0.5,
+        rotation_bytes: int = 10 * 1024 * 1024,
+        rotation_seconds: int = 24 * 60 * 60,
+        days_to_keep: int = 7,
+        max_repeats: int = 10,
+        repeat_window_seconds: int = 60,
+    ):
+        self._path = folder / file_name
+        self._console = console
+        self._batch_size = batch_size
+        self._flush_seconds = flush_seconds
+        self._rotation_bytes = rotation_bytes
+        self._rotation_seconds = rotation_seconds
+        self._days_to_keep = days_to_keep
+        self._max_repeats = max_repeats
+        self._repeat_window_seconds = repeat_window_seconds
+
+        # records logged by a forked job process are written directly, since the writer thread only exists here
+        self._pid = os.getpid()
+
+        self._queue: queue.Queue[_Entry | None] = queue.Queue(maxsize=max_queued_records)
+        self._lock = threading.Lock()
+        self._dropped = 0
+        # keyed by the call site and the formatted message
+        self._repeats: dict[tuple[str, int, str], int] = {}
+        self._suppressed: dict[tuple[str, int, str], tuple[int, str]] = {}
+        self._window_start = time.monotonic()
+
+        self._fh: typing.TextIO | None = None
+        self._file_bytes = 0
+        self._file_opened = 0.0
+
+        self._thread = threading.Thread(target=self._write_forever, name="log-writer", daemon=True)
+
+    def close(self, *, timeout_seconds: float = 5) -> None:
+        """Writes what is queued and the counts of what was suppressed or dropped, waiting at most timeout_seconds, and
+        closes the file."""
+        if not self._thread.is_alive():
+            return
+
+        try:
+            self._queue.put(None, timeout=timeout_seconds)
+        except queue.Full:
+            pass
+        self._thread.join(timeout=timeout_seconds)
+
+    def sink(self, message: loguru.Message) -> None:
+        record = message.record
+        if os.getpid() != self._pid:
+            self._write_direct((str(message), _to_json_record(record)))
+            return
+
+        key = (record["name"] or "", record["line"], record["message"])
+        with self._lock:
+            if len(self._repeats) >= 10_000:
+                self._repeats.clear()
+            repeats = self._repeats.get(key, 0) + 1
+            self._repeats[key] = repeats
+            if repeats > self._max_repeats:
+                count, _ = self._suppressed.get(key, (0, ""))
+                self._suppressed[key] = (count + 1, record["level"].name)
+                return
+
+        try:
+            self._queue.put_nowait((str(message), _to_json_record(record)))
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def _end_repeat_window(self, *, force: bool = False) -> list[_Entry]:
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._window_start < self._repeat_window_seconds:
+                return []
+
+            suppressed, self._suppressed = self._suppressed, {}
+            dropped, self._dropped = self._dropped, 0
+            self._repeats.clear()
+            self._window_start = now
+
+        entries = [
+            _summary(
+                level=level,
+                message=f"{message} (repeated {count} more times, suppressed)",
+                name=name,
+                line=line,
+            )
+            for (name, line, message), (count, level) in suppressed.items()
+        ]
+        if dropped:
+            entries.append(
+                _summary(level="WARNING", message=f"{dropped} log records were dropped because the log queue was full.")
+            )
+        return entries
+
+    def _open(self) -> typing.TextIO:
+        fh = self._path.open("a", encoding="utf-8")
+        self._file_bytes = self._path.stat().st_size
+        self._file_opened = time.monotonic()
+        return fh
+
+    def _remove_old_archives(self) -> None:
+        cutoff = time.time() - self._days_to_keep * 24 * 60 * 60
+        for fp in self._path.parent.glob(f"{self._path.stem}.*{self._path.suffix}.gz"):
+            try:
+                if fp.stat().st_mtime < cutoff:
+                    fp.unlink()
+            except OSError:
+                pass
+
+    def _rotate(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+        if self._path.exists() and self._path.stat().st_size > 0:
+            suffix = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+            archive = self._path.with_name(f"{self._path.stem}.{suffix}{self._path.suffix}")
+            self._path.rename(archive)
+            with archive.open("rb") as src, gzip.open(archive.with_name(archive.name + ".gz"), "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            archive.unlink()
+
+        self._remove_old_archives()
+
+    def _write(self, entries: list[_Entry]) -> None:
+        if self._fh is not None and (
+            self._file_bytes >= self._rotation_bytes
+            or time.monotonic() - self._file_opened >= self._rotation_seconds
+        ):
+            self._rotate()
+        if self._fh is None:
+            self._fh = self._open()
+
+        lines = "".join(json.dumps(record, default=str) + "\n" for _, record in entries)
+        self._fh.write(lines)
+        self._fh.flush()
+        self._file_bytes += len(lines.encode("utf-8"))
+
+        if self._console is not None:
+            self._console.write("".join(text for text, _ in entries))
+            self._console.flush()
+
+    def _write_direct(self, entry: _Entry, /) -> None:
+        text, record = entry
+        try:
+            with self._path.open("a", encoding="utf-8") as fh:
+                fh.write(json.dumps(record, default=str) + "\n")
+            if self._console is not None:
+                self._console.write(text)
+                self._console.flush()
+        except OSError:
+            pass
+
+    def _write_forever(self) -> None:
+        stopping = False
+        while not stopping:
+            entries: list[_Entry] = []
+            try:
+                entry = self._queue.get(timeout=self._flush_seconds)
+                while True:
+                    if entry is None:
+                        stopping = True
+                        break
+                    entries.append(entry)
+                    if len(entries) >= self._batch_size:
+                        break
+                    entry = self._queue.get_nowait()
+            except queue.Empty:
+                pass
+
+            entries += self._end_repeat_window(force=stopping)
+            if entries:
+                try:
+                    self._write(entries)
+                except Exception:
+                    # nowhere left to log to; the records are lost, but the writer keeps going
+                    traceback.print_exc(file=sys.__stderr__)
+                    self._fh = None
+
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+def _summary(*, level: str, message: str, name: str | None = None, line: int | None = None) -> _Entry:
+    ts = datetime.datetime.now(datetime.timezone.utc)
+    record = {
+        "ts": ts.isoformat(),
+        "level": level,
+        "message": message,
+        "module": name,
+        "line": line,
+    }
+    return f"{ts:%Y-%m-%d %H:%M:%S.%f} | {level:<8} | {message}\n", record
+
+
+def _to_json_record(record: loguru.Record, /) -> dict[str, typing.Any]:
+    json_record: dict[str, typing.Any] = {
+        "ts": record["time"].isoformat(),
+        "level": record["level"].name,
+        "message": record["message"],
+        "batch_id": None,
+        "job_id": None,
+        **record["extra"],
+        "module": record["name"],
+        "function": record["function"],
+        "line": record["line"],
+        "thread": record["thread"].name,
+        "process": record["process"].id,
+    }
+    if (exception := record["exception"]) is not None:
+        json_record["exception"] = "".join(
+            traceback.format_exception(exception.type, exception.value, exception.traceback)
+        )
+    return json_record
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import http.server
+import json
+import threading
+import typing
+import urllib.request
+
+import loguru
+
+__all__ = ("fetch_status", "StatusServer")
+
+
+class StatusServer:
+    """Serves a status snapshot as JSON at http://127.0.0.1:<port>/status.  Port 0 picks a free port."""
+
+    def __init__(self, *, port: int, snapshot: typing.Callable[[], dict[str, typing.Any]]):
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self) -> None:  # noqa: N802
+                if self.path.rstrip("/") not in ("", "/status"):
+                    self.send_error(404)
+                    return
+
+                body = json.dumps(snapshot()).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: typing.Any) -> None:  # noqa: A002
+                loguru.logger.debug(f"status request from {self.address_string()}: {format % args}")
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="status-server", daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._server.shutdown()
+        self._server.server_close()
+
+    def start(self) -> None:
+        self._thread.start()
+        loguru.logger.info(f"Serving status at http://127.0.0.1:{self.port}/status")
+
+
+def fetch_status(*, port: int, timeout_seconds: int = 5) -> dict[str, typing.Any]:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/status", timeout=timeout_seconds) as response:
+        return typing.cast(dict[str, typing.Any], json.load(response))
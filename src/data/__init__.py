@@ -1,4 +1,9 @@
 from src.data.db import *
 from src.data.job import *
 from src.data.job_result import *
+from src.data.queued_task import *
+from src.data.resource_status import *
+from src.data.resource_usage import *
+from src.data.schedule_plan import *
+from src.data.sql_target import *
 from src.data.task import *
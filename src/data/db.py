@@ -1,39 +1,115 @@
 from __future__ import annotations
 
 import abc
+import datetime
+import typing
 
 from src.data.job import Job
+from src.data.queued_task import QueuedTask
+from src.data.resource_status import ResourceStatus
+from src.data.resource_usage import ResourceUsage
 
-__all__ = ("Db",)
+__all__ = ("Db", "DbUnavailableError")
+
+
+class DbUnavailableError(Exception):
+    """The database is not answering; the caller should leave it alone for retry_after_seconds and then try again."""
+
+    def __init__(self, message: str, *, retry_after_seconds: float):
+        super().__init__(message)
+
+        self.retry_after_seconds = retry_after_seconds
 
 
 class Db(abc.ABC):
+    @abc.abstractmethod
+    def cancel_abandoned_jobs(self, *, reason: str, seconds_before_abandoned: int) -> None:
+        """Cancel unfinished jobs of other batches that have stopped, or have not sent a heartbeat in a while."""
+        raise NotImplementedError
+
     @abc.abstractmethod
     def cancel_running_jobs(self, *, reason: str) -> None:
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def claim_job(self, *, task_id: int) -> Job | None:
+        raise NotImplementedError
+
     @abc.abstractmethod
     def delete_old_logs(self) -> None:
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def end_batch(self) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def fetch_fingerprint(self, *, sql: str) -> tuple[typing.Any, ...] | None:
+        """Runs a task's fingerprint query against ppe's own database and returns its first row."""
+        raise NotImplementedError
+
     @abc.abstractmethod
     def get_ready_job(self) -> Job | None:
         raise NotImplementedError
 
     @abc.abstractmethod
-    def log_batch_info(self, *, message: str) -> None:
+    def get_queued_tasks(self) -> list[QueuedTask]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_resource_status(self) -> list[ResourceStatus]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def heartbeat(self) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def log_batch_info(self, *, message: str, ts: datetime.datetime | None = None) -> None:
+        """ts is when it happened, for a write that reaches the database late; it defaults to now."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def log_batch_error(self, *, error_message: str, ts: datetime.datetime | None = None) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def log_job_cancelled(self, *, job_id: int, reason: str, ts: datetime.datetime | None = None) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def log_job_error(
+        self,
+        *,
+        job_id: int,
+        return_code: int,
+        error_message: str,
+        timed_out: bool,
+        retries: int = 0,
+        resource_usage: ResourceUsage | None = None,
+        ts: datetime.datetime | None = None,
+    ) -> None:
         raise NotImplementedError
 
     @abc.abstractmethod
-    def log_batch_error(self, *, error_message: str) -> None:
+    def log_job_info(self, *, job_id: int, message: str, ts: datetime.datetime | None = None) -> None:
         raise NotImplementedError
 
     @abc.abstractmethod
-    def log_job_error(self, *, job_id: int, return_code: int, error_message: str) -> None:
+    def log_job_success(
+        self,
+        *,
+        job_id: int,
+        execution_millis: int,
+        retries: int = 0,
+        resource_usage: ResourceUsage | None = None,
+        ts: datetime.datetime | None = None,
+    ) -> None:
         raise NotImplementedError
 
     @abc.abstractmethod
-    def log_job_success(self, *, job_id: int, execution_millis: int) -> None:
+    def skip_job_if_unchanged(self, *, job_id: int, fingerprint: str | None) -> bool:
+        """Records the job as skipped if its task's last successful run had the same fingerprint."""
         raise NotImplementedError
 
     @abc.abstractmethod
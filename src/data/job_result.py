@@ -3,7 +3,8 @@ from __future__ import annotations
 import dataclasses
 import typing
 
-from src.data import Job
+from src.data.job import Job
+from src.data.resource_usage import ResourceUsage
 
 __all__ = ("JobResult",)
 
@@ -16,19 +17,46 @@ class JobResult:
     error_message: str | None
     execution_millis: int | None
     retries: int | None
+    timed_out: bool = False
+    resource_usage: ResourceUsage | None = None
 
     @property
     def is_err(self) -> bool:
         return self.status == "error"
 
     @staticmethod
-    def error(*, job: Job, code: int, message: str, retries: int) -> JobResult:
-        return JobResult(job=job, status="error", return_code=code, error_message=message, execution_millis=None, retries=retries)
+    def error(*, job: Job, code: int, message: str, retries: int, resource_usage: ResourceUsage | None = None) -> JobResult:
+        return JobResult(
+            job=job,
+            status="error",
+            return_code=code,
+            error_message=message,
+            execution_millis=None,
+            retries=retries,
+            resource_usage=resource_usage,
+        )
 
     @staticmethod
-    def success(*, job: Job, execution_millis: int, retries: int) -> JobResult:
-        return JobResult(job=job, status="success", return_code=0, error_message=None, execution_millis=execution_millis, retries=retries)
+    def success(*, job: Job, execution_millis: int, retries: int, resource_usage: ResourceUsage | None = None) -> JobResult:
+        return JobResult(
+            job=job,
+            status="success",
+            return_code=0,
+            error_message=None,
+            execution_millis=execution_millis,
+            retries=retries,
+            resource_usage=resource_usage,
+        )
 
     @staticmethod
-    def timeout(*, job: Job, retries: int) -> JobResult:
-        return JobResult(job=job, status="error", return_code=-1, error_message="Job timed out.", execution_millis=None, retries=retries)
+    def timeout(*, job: Job, retries: int, resource_usage: ResourceUsage | None = None) -> JobResult:
+        return JobResult(
+            job=job,
+            status="error",
+            return_code=-1,
+            error_message=f"[{job.task.name}] timed out after {job.task.timeout_seconds} seconds.",
+            execution_millis=None,
+            retries=retries,
+            timed_out=True,
+            resource_usage=resource_usage,
+        )
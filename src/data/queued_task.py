@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import dataclasses
+import datetime
+import textwrap
+
+__all__ = ("QueuedTask",)
+
+
+@dataclasses.dataclass(frozen=True, kw_only=True)
+class QueuedTask:
+    task_id: int
+    name: str
+    latest_attempt_ts: datetime.datetime | None
+    ready_ts: datetime.datetime | None
+    expected_millis: int | None
+    p95_millis: int | None
+    window_start_ts: datetime.datetime | None
+    window_end_ts: datetime.datetime | None
+    running_peer_millis: int | None
+
+    def __repr__(self) -> str:
+        return textwrap.dedent(f"""
+            QueuedTask [
+                task_id:             {self.task_id}
+                name:                {self.name}
+                latest_attempt_ts:   {self.latest_attempt_ts}
+                ready_ts:            {self.ready_ts}
+                expected_millis:     {self.expected_millis}
+                p95_millis:          {self.p95_millis}
+                window_start_ts:     {self.window_start_ts}
+                window_end_ts:       {self.window_end_ts}
+                running_peer_millis: {self.running_peer_millis}
+            ]
+        """).strip()
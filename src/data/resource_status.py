@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+import dataclasses
+import textwrap
+
+__all__ = ("ResourceStatus",)
+
+
+@dataclasses.dataclass(frozen=True, kw_only=True)
+class ResourceStatus:
+    resource_id: int
+    name: str
+    capacity: int
+    reserved: int
+    available: int
+
+    def __repr__(self) -> str:
+        return textwrap.dedent(f"""
+            ResourceStatus [
+                resource_id: {self.resource_id}
+                name:        {self.name}
+                capacity:    {self.capacity}
+                reserved:    {self.reserved}
+                available:   {self.available}
+            ]
+        """).strip()
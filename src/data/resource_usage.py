@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import dataclasses
+import textwrap
+
+__all__ = ("ResourceUsage",)
+
+
+@dataclasses.dataclass(frozen=True, kw_only=True)
+class ResourceUsage:
+    """What a job's process tree used.  Everything but wall_millis is None where the platform does not report it."""
+
+    wall_millis: int
+    user_cpu_millis: int | None = None
+    system_cpu_millis: int | None = None
+    peak_rss_kb: int | None = None
+    block_reads: int | None = None
+    block_writes: int | None = None
+    voluntary_context_switches: int | None = None
+    involuntary_context_switches: int | None = None
+
+    def __repr__(self) -> str:
+        return textwrap.dedent(f"""
+            ResourceUsage [
+                wall_millis:                  {self.wall_millis}
+                user_cpu_millis:              {self.user_cpu_millis}
+                system_cpu_millis:            {self.system_cpu_millis}
+                peak_rss_kb:                  {self.peak_rss_kb}
+                block_reads:                  {self.block_reads}
+                block_writes:                 {self.block_writes}
+                voluntary_context_switches:   {self.voluntary_context_switches}
+                involuntary_context_switches: {self.involuntary_context_switches}
+            ]
+        """).strip()
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import dataclasses
+import datetime
+import textwrap
+
+__all__ = ("Resource", "Schedule", "ScheduledTask", "SchedulePlan")
+
+
+@dataclasses.dataclass(frozen=True, kw_only=True)
+class Resource:
+    resource_id: int
+    name: str
+    capacity: int
+
+    def __repr__(self) -> str:
+        return textwrap.dedent(f"""
+            Resource [
+                resource_id: {self.resource_id}
+                name:        {self.name}
+                capacity:    {self.capacity}
+            ]
+        """).strip()
+
+
+@dataclasses.dataclass(frozen=True, kw_only=True)
+class Schedule:
+    """A row of ppe.schedule.  A task is due in a minute that falls within every range, in the plan's time_zone, as in
+    ppe.update_queue."""
+
+    schedule_id: int
+    name: str
+    start_ts: datetime.datetime
+    end_ts: datetime.datetime
+    start_month: int
+    end_month: int
+    start_month_day: int
+    end_month_day: int
+    start_week_day: int
+    end_week_day: int
+    start_hour: int
+    end_hour: int
+    start_minute: int
+    end_minute: int
+    min_seconds_between_attempts: int
+
+    def __repr__(self) -> str:
+        return textwrap.dedent(f"""
+            Schedule [
+                schedule_id:                  {self.schedule_id}
+                name:                         {self.name}
+                start_ts:                     {self.start_ts}
+                end_ts:                       {self.end_ts}
+                months:                       {self.start_month}-{self.end_month}
+                month_days:                   {self.start_month_day}-{self.end_month_day}
+                week_days:                    {self.start_week_day}-{self.end_week_day}
+                hours:                        {self.start_hour}-{self.end_hour}
+                minutes:                      {self.start_minute}-{self.end_minute}
+                min_seconds_between_attempts: {self.min_seconds_between_attempts}
+            ]
+        """).strip()
+
+
+@dataclasses.dataclass(frozen=True, kw_only=True)
+class ScheduledTask:
+    """An enabled task with its schedules, the units it takes of each resource, and its runtime history."""
+
+    task_id: int
+    name: str
+    schedule_ids: tuple[int, ...]
+    resource_units: tuple[tuple[int, int], ...]  # (resource_id, units)
+    expected_millis: int | None = None
+    p95_millis: int | None = None
+    latest_attempt_ts: datetime.datetime | None = None
+
+    def __repr__(self) -> str:
+        return textwrap.dedent(f"""
+            ScheduledTask [
+                task_id:           {self.task_id}
+                name:              {self.name}
+                schedule_ids:      {self.schedule_ids}
+                resource_units:    {self.resource_units}
+                expected_millis:   {self.expected_millis}
+                p95_millis:        {self.p95_millis}
+                latest_attempt_ts: {self.latest_attempt_ts}
+            ]
+        """).strip()
+
+
+@dataclasses.dataclass(frozen=True, kw_only=True)
+class SchedulePlan:
+    """What ppe will be asked to run: the resources, schedules and enabled tasks in the catalog.  time_zone is the IANA
+    name of the zone the schedules are in, see ppe.schedule_time_zone."""
+
+    resources: list[Resource]
+    schedules: list[Schedule]
+    tasks: list[ScheduledTask]
+    time_zone: str = "UTC"
+
+    def __repr__(self) -> str:
+        return textwrap.dedent(f"""
+            SchedulePlan [
+                resources: {len(self.resources)}
+                schedules: {len(self.schedules)}
+                tasks:     {len(self.tasks)}
+                time_zone: {self.time_zone}
+            ]
+        """).strip()
@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import dataclasses
+import textwrap
+
+__all__ = ("SqlTarget",)
+
+
+@dataclasses.dataclass(frozen=True, kw_only=True)
+class SqlTarget:
+    name: str
+    connection_str: str
+    max_connections: int
+    idle_seconds: int
+    connect_timeout_seconds: int
+
+    def __post_init__(self) -> None:
+        assert len(self.name) > 0, "name cannot be blank."
+        assert len(self.connection_str) > 0, "connection_str cannot be blank."
+        assert self.max_connections > 0, "max_connections must be > 0."
+        assert self.idle_seconds > 0, "idle_seconds must be > 0."
+        assert self.connect_timeout_seconds > 0, "connect_timeout_seconds must be > 0."
+
+    def __repr__(self) -> str:
+        # the connection string is left out, since it usually holds a password
+        return textwrap.dedent(f"""
+            SqlTarget [
+                name:                    {self.name}
+                max_connections:         {self.max_connections}
+                idle_seconds:            {self.idle_seconds}
+                connect_timeout_seconds: {self.connect_timeout_seconds}
+            ]
+        """).strip()
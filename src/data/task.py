@@ -4,15 +4,26 @@ import dataclasses
 import textwrap
 import typing
 
-__all__ = ("CmdLineUtilityTask", "CondaProjectTask", "SQLTask", "Task")
+__all__ = ("CmdLineUtilityTask", "CondaProjectTask", "freeze_fn_args", "SQLTask", "Task")
 
 
 @typing.runtime_checkable
 class Task(typing.Protocol):
-    task_id: int
-    name: str
-    timeout_seconds: int | None
-    retries: int
+    # read-only, as the tasks are frozen dataclasses
+    @property
+    def task_id(self) -> int: ...
+
+    @property
+    def name(self) -> str: ...
+
+    @property
+    def timeout_seconds(self) -> int | None: ...
+
+    @property
+    def retries(self) -> int: ...
+
+    @property
+    def fingerprint_sql(self) -> str | None: ...
 
 
 @dataclasses.dataclass(frozen=True, eq=True, kw_only=True)
@@ -23,6 +34,7 @@ class CmdLineUtilityTask:
     retries: int
     tool: str
     tool_args: list[str] | None
+    fingerprint_sql: str | None = None
 
     def __post_init__(self) -> None:
         assert self.task_id > 0, "task_id must be > 0."
@@ -33,6 +45,8 @@ class CmdLineUtilityTask:
         assert self.timeout_seconds is None or self.timeout_seconds >= 0, \
             "If timeout_seconds is provided, then it must be positive."
         assert self.retries >= 0, "retries must be positive."
+        assert self.fingerprint_sql is None or len(self.fingerprint_sql) > 0, \
+            "If fingerprint_sql is provided, then it cannot be blank."
 
     def __repr__(self) -> str:
         return textwrap.dedent(
@@ -44,6 +58,7 @@ class CmdLineUtilityTask:
                 tool_args:       [{', '.join(repr(arg) for arg in self.tool_args or [])}]
                 timeout_seconds: {self.timeout_seconds}
                 retries:         {self.retries}
+                fingerprint_sql: {self.fingerprint_sql!r}
             ]
             """
         ).strip()
@@ -59,6 +74,7 @@ class CondaProjectTask:
     project_name: str
     fn: str = "src.main"
     fn_args: frozenset[tuple[str, typing.Hashable]] = frozenset()
+    fingerprint_sql: str | None = None
 
     def __post_init__(self) -> None:
         assert self.task_id > 0, "task_id must be > 0."
@@ -66,10 +82,16 @@ class CondaProjectTask:
         assert self.timeout_seconds is None or self.timeout_seconds >= 0, \
             "If timeout_seconds is provided, then it must be positive."
         assert self.retries >= 0, "retries must be positive."
+        assert self.fingerprint_sql is None or len(self.fingerprint_sql) > 0, \
+            "If fingerprint_sql is provided, then it cannot be blank."
         assert len(self.env) > 0, "env cannot be blank."
         assert len(self.project_name) > 0, "project_name cannot be blank."
         assert len(self.fn) > 0, "fn cannot be blank."
 
+    def fn_kwargs(self) -> dict[str, typing.Any]:
+        """fn_args as the JSON-compatible keyword arguments fn is called with."""
+        return {key: _thaw(value) for key, value in self.fn_args}
+
     def __repr__(self) -> str:
         return textwrap.dedent(
             f"""
@@ -82,6 +104,7 @@ class CondaProjectTask:
                 project:         {self.project_name!r}
                 fn:              {self.fn!r}
                 fn_args:         {self.fn_args!r}
+                fingerprint_sql: {self.fingerprint_sql!r}
             ]
             """
         ).strip()
@@ -94,6 +117,8 @@ class SQLTask:
     timeout_seconds: int | None
     retries: int
     sql: str
+    target: str | None = None
+    fingerprint_sql: str | None = None
 
     def __post_init__(self) -> None:
         assert self.task_id > 0, "task_id must be > 0."
@@ -101,7 +126,10 @@ class SQLTask:
         assert self.timeout_seconds is None or self.timeout_seconds >= 0, \
             "If timeout_seconds is provided, then it must be positive."
         assert self.retries >= 0, "retries must be positive."
+        assert self.fingerprint_sql is None or len(self.fingerprint_sql) > 0, \
+            "If fingerprint_sql is provided, then it cannot be blank."
         assert len(self.sql) > 0, "sql cannot be blank."
+        assert self.target is None or len(self.target) > 0, "If target is provided, then it cannot be blank."
 
     def __repr__(self) -> str:
         return textwrap.dedent(
@@ -112,6 +140,33 @@ class SQLTask:
                 timeout_seconds: {self.timeout_seconds}
                 retries:         {self.retries}
                 sql:             {self.sql!r}
+                target:          {self.target!r}
+                fingerprint_sql: {self.fingerprint_sql!r}
             ]
             """
         ).strip()
+
+
+def freeze_fn_args(fn_args: dict[str, typing.Any] | None, /) -> frozenset[tuple[str, typing.Hashable]]:
+    """A task's fn_args JSON object as a frozenset, with the lists and objects nested in it frozen too."""
+    return frozenset((key, _freeze(value)) for key, value in (fn_args or {}).items())
+
+
+class _FrozenObject(tuple):  # type: ignore[type-arg]
+    """A JSON object nested in fn_args, as its (key, value) pairs sorted by key."""
+
+
+def _freeze(value: typing.Any, /) -> typing.Hashable:
+    if isinstance(value, dict):
+        return _FrozenObject(sorted(((key, _freeze(v)) for key, v in value.items()), key=lambda pair: pair[0]))
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value: typing.Any, /) -> typing.Any:
+    if isinstance(value, _FrozenObject):
+        return {key: _thaw(v) for key, v in value}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
@@ -1,11 +1,24 @@
+from __future__ import annotations
+
 import multiprocessing
+import multiprocessing.context
+
+if __name__ == "__main__":
+    # a job process started by the frozen executable runs this file from the top, so it is handed over to
+    # multiprocessing before anything only the service needs is imported
+    multiprocessing.freeze_support()
+
+import argparse
+import datetime
+import json
 import os
+import pathlib
+import signal
 import sys
 import threading
 import time
 import traceback
-
-import loguru
+import typing
 
 from src import adapter, service
 
@@ -17,16 +30,159 @@ def run() -> None:
 
     seconds_between_retries = adapter.config.get_seconds_between_retries(config_file=config_file)
 
+    supervisor = service.supervisor.Supervisor(
+        grace_seconds=adapter.config.get_seconds_before_force_kill(config_file=config_file),
+    )
+    supervisor.start()
+
+    # kept across restarts of _run so the conda workers stay warm
+    interpreter_pool = service.interpreter_pool.InterpreterPool(
+        supervisor=supervisor,
+        project_root=adapter.config.get_conda_project_root(config_file=config_file),
+        workers_per_env=adapter.config.get_conda_workers_per_env(config_file=config_file),
+        max_rss_mb=adapter.config.get_conda_worker_max_rss_mb(config_file=config_file),
+        max_calls_per_worker=adapter.config.get_conda_worker_max_calls(config_file=config_file),
+    )
+    sql_target_pool = service.sql_target_pool.SqlTargetPool(
+        targets=adapter.config.get_sql_targets(config_file=config_file),
+    )
+
+    try:
+        _retry_forever(
+            config_file=config_file,
+            interpreter_pool=interpreter_pool,
+            sql_target_pool=sql_target_pool,
+            supervisor=supervisor,
+            seconds_between_retries=seconds_between_retries,
+        )
+    finally:
+        sql_target_pool.close()
+        interpreter_pool.close()
+        supervisor.stop()
+
+
+def bench_spawn(*, runs: int, start_method: str | None) -> None:
+    """Starts runs job processes the way the runners do, each one only moving itself into a new process group, and
+    prints the seconds from start to exit of each as JSON, for script/bench_startup.py."""
+    # typeshed types get_context(str) as BaseContext, which has no Process, though every context it returns does
+    context = typing.cast(multiprocessing.context.DefaultContext, multiprocessing.get_context(start_method))
+    seconds = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        p = context.Process(target=service.job_process.new_process_group)
+        p.start()
+        p.join()
+        seconds.append(time.perf_counter() - start)
+        if p.exitcode != 0:
+            raise Exception(f"The job process exited with code {p.exitcode}.")
+    print(json.dumps({"start_method": context.get_start_method(), "seconds": seconds}))
+
+
+def catalog(*, command: str, path: pathlib.Path, prune: bool) -> None:
+    connection_str = adapter.config.get_connection_str(config_file=adapter.fs.get_config_path())
+    if command == "import":
+        adapter.catalog.import_catalog(connection_str=connection_str, path=path, prune=prune)
+    else:
+        adapter.catalog.export_catalog(connection_str=connection_str, path=path)
+        loguru.logger.info(f"Catalog exported to {path.resolve()!s}.")
+
+
+def forecast(*, days: int, use_p95: bool, as_json: bool) -> None:
+    config_file = adapter.fs.get_config_path()
+    plan = adapter.catalog.load_schedule_plan(connection_str=adapter.config.get_connection_str(config_file=config_file))
+    f = service.forecast.forecast(
+        plan=plan,
+        runners=adapter.config.get_max_simultaneous_jobs(config_file=config_file),
+        start_ts=datetime.datetime.now(datetime.timezone.utc),
+        days=days,
+        use_p95=use_p95,
+    )
+    print(json.dumps(f.to_json(), indent=2) if as_json else service.forecast.render(f))
+
+
+def status(*, as_json: bool) -> None:
+    port = adapter.config.get_status_port(config_file=adapter.fs.get_config_path())
+    try:
+        snapshot = adapter.status_server.fetch_status(port=port)
+    except OSError as e:
+        raise Exception(f"ppe does not appear to be running, no status was served on port {port}: {e!s}") from e
+
+    print(json.dumps(snapshot, indent=2) if as_json else service.status.render(snapshot))
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="ppe", description="Runs the ppe service when no command is given.")
+    commands = parser.add_subparsers(dest="command")
+
+    bench_spawn_parser = commands.add_parser(
+        "bench-spawn",
+        help="Time how long job processes take to start, for script/bench_startup.py.",
+    )
+    bench_spawn_parser.add_argument("--runs", type=int, default=10)
+    bench_spawn_parser.add_argument(
+        "--start-method",
+        choices=multiprocessing.get_all_start_methods(),
+        help="How to start the job processes (default: the platform's, as the runners use).",
+    )
+
+    catalog_parser = commands.add_parser("catalog", help="Import or export tasks, schedules and resources.")
+    catalog_parser.add_argument("catalog_command", choices=("import", "export"))
+    catalog_parser.add_argument(
+        "path",
+        type=pathlib.Path,
+        help="A .json manifest, or a folder with resource.csv, schedule.csv, task.csv, task_schedule.csv and "
+        "task_resource.csv.",
+    )
+    catalog_parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="On import, disable tasks and resources that are not in the manifest.",
+    )
+
+    forecast_parser = commands.add_parser(
+        "forecast",
+        help="Project the load the schedules put on each resource and on the runners, and where it exceeds capacity.",
+    )
+    forecast_parser.add_argument("--days", type=int, default=7, help="How many days ahead to project (default 7).")
+    forecast_parser.add_argument("--p95", action="store_true", help="Use each task's p95 runtime, not its median.")
+    forecast_parser.add_argument("--json", action="store_true", help="Print the forecast as JSON.")
+
+    status_parser = commands.add_parser("status", help="Show what the running ppe service is doing.")
+    status_parser.add_argument("--json", action="store_true", help="Print the raw JSON snapshot.")
+
+    return parser.parse_args()
+
+
+def _retry_forever(
+    *,
+    config_file: pathlib.Path,
+    interpreter_pool: service.interpreter_pool.InterpreterPool,
+    sql_target_pool: service.sql_target_pool.SqlTargetPool,
+    supervisor: service.supervisor.Supervisor,
+    seconds_between_retries: int,
+) -> None:
     while True:
         try:
             _run(
+                interpreter_pool=interpreter_pool,
+                sql_target_pool=sql_target_pool,
+                supervisor=supervisor,
                 connection_str=adapter.config.get_connection_str(config_file=config_file),
                 max_connections=adapter.config.get_max_connections(config_file=config_file),
+                claim_connections=adapter.config.get_claim_connections(config_file=config_file),
+                maintenance_connections=adapter.config.get_maintenance_connections(config_file=config_file),
+                max_connection_age_seconds=adapter.config.get_max_connection_age_seconds(config_file=config_file),
                 max_jobs=adapter.config.get_max_simultaneous_jobs(config_file=config_file),
                 seconds_between_updates=adapter.config.get_seconds_between_updates(config_file=config_file),
                 seconds_between_cleanups=adapter.config.get_seconds_between_cleanups(config_file=config_file),
                 seconds_between_task_issue_updates=adapter.config.get_seconds_between_task_issue_updates(config_file=config_file),
                 days_logs_to_keep=adapter.config.get_days_logs_to_keep(config_file=config_file),
+                status_port=adapter.config.get_status_port(config_file=config_file),
+                seconds_to_drain=adapter.config.get_seconds_to_drain(config_file=config_file),
+                seconds_before_batch_abandoned=adapter.config.get_seconds_before_batch_abandoned(config_file=config_file),
+                trace_enabled=adapter.config.get_trace_enabled(config_file=config_file),
+                trace_max_events=adapter.config.get_trace_max_events(config_file=config_file),
+                trace_seconds_between_exports=adapter.config.get_trace_seconds_between_exports(config_file=config_file),
             )
         except Exception:  # noqa
             loguru.logger.error(f"ppe exited abnormally, restarting in {seconds_between_retries} seconds...")
@@ -35,41 +191,116 @@ def run() -> None:
 
 def _run(
     *,
+    interpreter_pool: service.interpreter_pool.InterpreterPool,
+    sql_target_pool: service.sql_target_pool.SqlTargetPool,
+    supervisor: service.supervisor.Supervisor,
     connection_str: str,
     max_connections: int,
+    claim_connections: int,
+    maintenance_connections: int,
+    max_connection_age_seconds: int,
     max_jobs: int,
     seconds_between_updates: int,
     seconds_between_cleanups: int,
     seconds_between_task_issue_updates: int,
     days_logs_to_keep: int,
+    status_port: int,
+    seconds_to_drain: int,
+    seconds_before_batch_abandoned: int,
+    trace_enabled: bool,
+    trace_max_events: int,
+    trace_seconds_between_exports: int,
 ) -> None:
 
-    with adapter.db.create_pool(connection_str=connection_str, max_size=max_connections) as pool:
-        batch_id = adapter.db.create_batch(pool=pool)
+    with adapter.db.create_pools(
+        connection_str=connection_str,
+        claim_connections=claim_connections,
+        result_connections=max_connections,
+        maintenance_connections=maintenance_connections,
+        max_connection_age_seconds=max_connection_age_seconds,
+    ) as pools:
+        batch_id = adapter.db.create_batch(pool=pools.maintenance)
+
+        # every record logged from here on carries the batch_id; runners add the job_id while they run a job
+        loguru.logger.configure(extra={"batch_id": batch_id})
 
         loguru.logger.info(f"Starting batch {batch_id}...")
 
-        db = adapter.db.open_db(batch_id=batch_id, pool=pool, days_logs_to_keep=days_logs_to_keep)
+        # results and batch events are journaled locally first, so a database outage does not lose finished work
+        db = adapter.journal.JournaledDb(
+            db=adapter.db.open_db(batch_id=batch_id, pools=pools, days_logs_to_keep=days_logs_to_keep),
+            batch_id=batch_id,
+            journal=adapter.journal.Journal(folder=adapter.fs.get_journal_folder()),
+            open_batch_db=lambda b: adapter.db.open_db(batch_id=b, pools=pools, days_logs_to_keep=days_logs_to_keep),
+        )
 
         loguru.logger.info("Database connection open.")
 
         cancel = threading.Event()
+        drain = threading.Event()
+        abandon = threading.Event()
+        previous_sigterm_handler = _drain_on_sigterm(drain)
+        status_board = service.status.StatusBoard(batch_id=batch_id, max_jobs=max_jobs)
+        tracer = service.trace.Tracer(enabled=trace_enabled, max_events=trace_max_events)
+        status_server: adapter.status_server.StatusServer | None = None
+        job_runners: list[service.runner.Runner] = []
         try:
+            # what an earlier batch could not write goes first, so none of its finished jobs look abandoned
+            db.replay()
+            db.start()
+
+            if tracer.enabled:
+                tracer.start(
+                    folder=adapter.fs.get_log_folder(),
+                    batch_id=batch_id,
+                    days_to_keep=days_logs_to_keep,
+                    seconds_between_exports=trace_seconds_between_exports,
+                )
+
+            # the status page is only for watching the batch, so a port that is taken does not stop it
+            try:
+                status_server = adapter.status_server.StatusServer(port=status_port, snapshot=status_board.snapshot)
+                status_server.start()
+            except OSError as e1:
+                loguru.logger.warning(f"Unable to serve status on port {status_port}, continuing without it: {e1!s}")
+
             db.log_batch_info(message="batch started")
 
-            db.cancel_running_jobs(reason="A new batch was started.")
+            db.cancel_abandoned_jobs(
+                reason="The batch running the job stopped before it finished.",
+                seconds_before_abandoned=seconds_before_batch_abandoned,
+            )
 
             scheduler = service.scheduler.Scheduler(
                 db=db,
                 seconds_between_updates=seconds_between_updates,
                 seconds_between_cleanups=seconds_between_cleanups,
                 seconds_between_task_issue_updates=seconds_between_task_issue_updates,
+                seconds_before_batch_abandoned=seconds_before_batch_abandoned,
+                status=status_board,
                 cancel=cancel,
+                tracer=tracer,
             )
 
+            dispatcher = service.dispatch.Dispatcher(db=db, max_jobs=max_jobs, status=status_board, tracer=tracer)
+
             job_runners = [
-                service.runner.Runner(db=db, connection_str=connection_str, tool_dir=adapter.fs.get_tool_dir(), cancel=cancel)
-                for _ in range(max_jobs)
+                service.runner.Runner(
+                    db=db,
+                    dispatcher=dispatcher,
+                    interpreter_pool=interpreter_pool,
+                    sql_target_pool=sql_target_pool,
+                    supervisor=supervisor,
+                    status=status_board,
+                    connection_str=connection_str,
+                    tool_dir=adapter.fs.get_tool_dir(),
+                    drain=drain,
+                    abandon=abandon,
+                    cancel=cancel,
+                    tracer=tracer,
+                    name=f"runner-{i + 1}",
+                )
+                for i in range(max_jobs)
             ]
 
             scheduler.start()
@@ -79,12 +310,28 @@ def _run(
 
             loguru.logger.info(f"{max_jobs} job runners started.")
 
-            while not cancel.is_set():
-                time.sleep(1)
+            while not cancel.is_set() and not drain.is_set():
+                try:
+                    time.sleep(1)
+                except KeyboardInterrupt:
+                    drain.set()
+
+            if not cancel.is_set():
+                _drain(
+                    job_runners=job_runners,
+                    supervisor=supervisor,
+                    sql_target_pool=sql_target_pool,
+                    abandon=abandon,
+                    seconds_to_drain=seconds_to_drain,
+                )
+                cancel.set()
 
             scheduler.join()
             for job_runner in job_runners:
                 job_runner.join()
+
+            if drain.is_set():
+                raise SystemExit
         except (KeyboardInterrupt, SystemExit):
             loguru.logger.info(f"Service shutdown triggered.")
             db.log_batch_info(message=f"ppe exited at the request of the user, {os.environ.get('USERNAME', 'Unknown')}.")
@@ -95,20 +342,96 @@ def _run(
             raise
         finally:
             cancel.set()
+            db.close()
+            if any(r.is_alive() for r in job_runners):
+                # their jobs may still finish and record results, so the batch is left for its heartbeat to expire
+                loguru.logger.warning(f"Job runners are still running, batch {batch_id} is left to be abandoned.")
+            else:
+                try:
+                    db.end_batch()
+                except Exception as e3:
+                    loguru.logger.error(f"Unable to mark batch {batch_id} as ended: {e3!s}")
+            if status_server is not None:
+                status_server.close()
+            if (trace_path := tracer.close()) is not None:
+                loguru.logger.info(f"Last part of the trace written to {trace_path.resolve()!s}.")
+            loguru.logger.configure(extra={})
+            if previous_sigterm_handler is not None:
+                signal.signal(signal.SIGTERM, previous_sigterm_handler)
+
+
+def _drain(
+    *,
+    job_runners: list[service.runner.Runner],
+    supervisor: service.supervisor.Supervisor,
+    sql_target_pool: service.sql_target_pool.SqlTargetPool,
+    abandon: threading.Event,
+    seconds_to_drain: int,
+) -> None:
+    """Wait for the runners to finish the jobs they have; whatever is still running after seconds_to_drain is killed
+    and cancelled."""
+    loguru.logger.info(
+        f"Draining, no new jobs will be started.  Waiting up to {seconds_to_drain} seconds for running jobs to finish..."
+    )
+
+    deadline = time.monotonic() + seconds_to_drain
+    try:
+        while any(r.is_alive() for r in job_runners) and time.monotonic() < deadline:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        loguru.logger.info("Interrupted again, stopping the running jobs now...")
+
+    if any(r.is_alive() for r in job_runners):
+        abandon.set()
+        supervisor.kill_all()
+        sql_target_pool.cancel_all()
+
+
+def _drain_on_sigterm(drain: threading.Event, /) -> typing.Any:
+    # signal handlers can only be installed from the main thread
+    if threading.current_thread() is not threading.main_thread():
+        return None
+    return signal.signal(signal.SIGTERM, lambda signum, frame: drain.set())
 
 
 if __name__ == '__main__':
-    multiprocessing.freeze_support()
+    # imported here rather than at the top, since a spawned job process imports this file again as __mp_main__ and
+    # needs none of it; the annotations above are not evaluated, and adapter and service import their modules on use
+    import loguru
+
+    args = _parse_args()
+
+    # needs no config or log folder, so it can be timed from a fresh checkout or build
+    if args.command == "bench-spawn":
+        bench_spawn(runs=args.runs, start_method=args.start_method)
+        sys.exit(0)
 
     adapter.fs.get_log_folder().mkdir(exist_ok=True)
 
+    config_file = adapter.fs.get_config_path()
+    log_pipeline = adapter.log.LogPipeline(
+        folder=adapter.fs.get_log_folder(),
+        rotation_bytes=adapter.config.get_log_rotation_mb(config_file=config_file) * 1024 * 1024,
+        rotation_seconds=adapter.config.get_log_rotation_hours(config_file=config_file) * 60 * 60,
+        days_to_keep=adapter.config.get_days_logs_to_keep(config_file=config_file),
+    )
+    log_pipeline.start()
+
     loguru.logger.remove()
-    loguru.logger.add(adapter.fs.get_log_folder() / "error.log", rotation="5 MB", retention="7 days", level="ERROR")
-    loguru.logger.add(sys.stderr, level="INFO")
+    loguru.logger.add(log_pipeline.sink, level="INFO")
 
     try:
-        run()
+        if args.command == "catalog":
+            catalog(command=args.catalog_command, path=args.path, prune=args.prune)
+        elif args.command == "forecast":
+            forecast(days=args.days, use_p95=args.p95, as_json=args.json)
+        elif args.command == "status":
+            status(as_json=args.json)
+        else:
+            run()
         sys.exit(0)
     except Exception as e:
         loguru.logger.exception(e)
         sys.exit(1)
+    finally:
+        log_pipeline.close()
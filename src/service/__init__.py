@@ -1 +1,36 @@
-from src.service import runner, scheduler
+import importlib
+import typing
+
+if typing.TYPE_CHECKING:
+    from src.service import (
+        dispatch,
+        forecast,
+        interpreter_pool,
+        job_process,
+        runner,
+        scheduler,
+        sql_target_pool,
+        status,
+        supervisor,
+        trace,
+    )
+
+_MODULES = (
+    "dispatch",
+    "forecast",
+    "interpreter_pool",
+    "job_process",
+    "runner",
+    "scheduler",
+    "sql_target_pool",
+    "status",
+    "supervisor",
+    "trace",
+)
+
+
+# submodules are imported on first use, so a command or a job process only pays for the ones it touches
+def __getattr__(name: str) -> typing.Any:
+    if name in _MODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
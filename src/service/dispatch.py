@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import dataclasses
+import datetime
+import math
+import threading
+
+from src import data
+from src.service.status import StatusBoard
+from src.service.trace import Tracer
+
+__all__ = ("Dispatcher", "DispatchPolicy", "rank")
+
+
+@dataclasses.dataclass(frozen=True, kw_only=True)
+class DispatchPolicy:
+    long_job_millis: int = 10 * 60 * 1000
+
+    def __post_init__(self) -> None:
+        assert self.long_job_millis > 0, "long_job_millis must be > 0."
+
+
+class Dispatcher:
+    """Picks which queued task each idle runner should claim next, based on each task's runtime history."""
+
+    def __init__(
+        self,
+        *,
+        db: data.Db,
+        max_jobs: int,
+        policy: DispatchPolicy = DispatchPolicy(),
+        status: StatusBoard | None = None,
+        tracer: Tracer | None = None,
+    ):
+        self._db = db
+        self._max_jobs = max_jobs
+        self._policy = policy
+        self._status = status
+        self._tracer = tracer or Tracer()
+
+        self._claim_lock = threading.Lock()
+        self._busy_lock = threading.Lock()
+        self._busy = 0
+
+    def job_finished(self) -> None:
+        with self._busy_lock:
+            self._busy -= 1
+
+    def next_job(self) -> data.Job | None:
+        with self._tracer.span("claim lock wait", cat="dispatch"):
+            self._claim_lock.acquire()
+        try:
+            with self._tracer.span("claim", cat="dispatch"):
+                return self._claim_next_job()
+        finally:
+            self._claim_lock.release()
+
+    def _claim_next_job(self) -> data.Job | None:
+        with self._busy_lock:
+            free_runners = self._max_jobs - self._busy
+
+        queued_tasks = self._db.get_queued_tasks()
+        if self._status is not None:
+            self._status.queue_updated(queued_tasks=queued_tasks)
+
+        candidates = rank(
+            candidates=queued_tasks,
+            free_runners=free_runners,
+            now=datetime.datetime.now(datetime.timezone.utc),
+            policy=self._policy,
+        )
+        for candidate in candidates:
+            if job := self._db.claim_job(task_id=candidate.task_id):
+                with self._busy_lock:
+                    self._busy += 1
+                return job
+        return None
+
+
+def rank(
+    *,
+    candidates: list[data.QueuedTask],
+    free_runners: int,
+    now: datetime.datetime,
+    policy: DispatchPolicy,
+) -> list[data.QueuedTask]:
+    """Order candidates by dispatch preference, dropping those that should wait for their next schedule window.
+
+    Candidates are expected in queue order (oldest attempt first), which is kept as-is while there are enough runners
+    for everyone.  When runners are scarce, the task with the highest response ratio, (wait + expected) / expected,
+    goes first, which favors short jobs without starving long ones.  Long jobs that share a resource with a long job
+    that is already running are moved to the back so they do not pile onto the same resource.
+    """
+    fits = [c for c in candidates if _fits_window(candidate=c, now=now)]
+
+    if len(fits) > free_runners:
+        fits = sorted(fits, key=lambda c: -_response_ratio(candidate=c, now=now))
+
+    return sorted(fits, key=lambda c: _crowds_long_peer(candidate=c, policy=policy))
+
+
+def _crowds_long_peer(*, candidate: data.QueuedTask, policy: DispatchPolicy) -> bool:
+    return (
+        (candidate.expected_millis or 0) >= policy.long_job_millis
+        and (candidate.running_peer_millis or 0) >= policy.long_job_millis
+    )
+
+
+def _fits_window(*, candidate: data.QueuedTask, now: datetime.datetime) -> bool:
+    runtime_millis = candidate.p95_millis or candidate.expected_millis
+    if runtime_millis is None or candidate.window_start_ts is None or candidate.window_end_ts is None:
+        return True
+
+    window_millis = (candidate.window_end_ts - candidate.window_start_ts).total_seconds() * 1000
+    remaining_millis = (candidate.window_end_ts - now).total_seconds() * 1000
+
+    # a job that can never fit in its window may as well start now
+    return runtime_millis <= remaining_millis or runtime_millis > window_millis
+
+
+def _response_ratio(*, candidate: data.QueuedTask, now: datetime.datetime) -> float:
+    if candidate.ready_ts is None or not candidate.expected_millis:
+        return math.inf
+
+    wait_millis = max((now - candidate.ready_ts).total_seconds() * 1000, 0)
+    return (wait_millis + candidate.expected_millis) / candidate.expected_millis
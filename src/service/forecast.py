@@ -0,0 +1,336 @@
+from __future__ import annotations
+
+import dataclasses
+import datetime
+import typing
+import zoneinfo
+
+import numpy as np
+
+from src import data
+
+__all__ = ("Forecast", "forecast", "Overload", "render")
+
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_MINUTE = datetime.timedelta(minutes=1)
+_NEVER = np.iinfo(np.int64).max // 4
+
+
+@dataclasses.dataclass(frozen=True, kw_only=True)
+class Overload:
+    """A stretch of minutes in which the forecast demand for a resource, or for the runners when runners is set,
+    exceeds its capacity."""
+
+    name: str
+    runners: bool = False
+    capacity: int
+    start_ts: datetime.datetime
+    end_ts: datetime.datetime
+    peak: int
+
+
+@dataclasses.dataclass(frozen=True, kw_only=True)
+class Forecast:
+    """Projected concurrent load at minute resolution from start_ts.  load maps each resource name to the number of
+    units in use in each minute, and runner_load is the number of runner slots in use."""
+
+    start_ts: datetime.datetime
+    runners: int
+    runner_load: np.ndarray
+    capacity: dict[str, int]
+    load: dict[str, np.ndarray]
+    overloads: list[Overload]
+    tasks_without_history: int
+
+    def to_json(self) -> dict[str, typing.Any]:
+        return {
+            "start_ts": self.start_ts.isoformat(),
+            "minutes": len(self.runner_load),
+            "tasks_without_history": self.tasks_without_history,
+            "runners": {
+                "capacity": self.runners,
+                "peak": int(self.runner_load.max(initial=0)),
+                "minutes_over_capacity": int((self.runner_load > self.runners).sum()),
+            },
+            "resources": [
+                {
+                    "name": name,
+                    "capacity": self.capacity[name],
+                    "peak": int(load.max(initial=0)),
+                    "minutes_over_capacity": int((load > self.capacity[name]).sum()),
+                }
+                for name, load in self.load.items()
+            ],
+            "overloads": [
+                {
+                    "name": o.name,
+                    "runners": o.runners,
+                    "capacity": o.capacity,
+                    "start_ts": o.start_ts.isoformat(),
+                    "end_ts": o.end_ts.isoformat(),
+                    "peak": o.peak,
+                }
+                for o in self.overloads
+            ],
+        }
+
+
+def forecast(
+    *,
+    plan: data.SchedulePlan,
+    runners: int,
+    start_ts: datetime.datetime,
+    days: int,
+    use_p95: bool = False,
+) -> Forecast:
+    """Projects when each task will run over the next days, the way ppe.update_queue makes them ready, and adds up what
+    they take of each resource and of the runners.
+
+    A task is started in the first minute that one of its schedules is open and it is ready, runs for its expected
+    runtime (p95 with use_p95, and a minute for a task without history), and is ready again min_seconds_between_attempts
+    after it finishes.  Demand is not held back by capacity, so the load shows what the schedules ask for, and where it
+    would be queued.  Each minute is one vectorized step over all tasks; the load is summed from the start and end
+    minute of every run at the end.  The schedules are read in plan.time_zone, so the forecast follows its daylight
+    saving changes as ppe.update_queue does.
+    """
+    try:
+        time_zone = zoneinfo.ZoneInfo(plan.time_zone)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError) as e:
+        raise ValueError(f"The schedules are in {plan.time_zone!r}, which is not a known time zone name.") from e
+
+    start_minute = (start_ts - _EPOCH) // _MINUTE
+    start_ts = _EPOCH + start_minute * _MINUTE
+    minutes = days * 24 * 60
+
+    open_schedules = _open_schedules(
+        schedules=plan.schedules,
+        start_minute=start_minute,
+        minutes=minutes,
+        time_zone=time_zone,
+    )
+    gap_minutes = np.array(
+        [-(-s.min_seconds_between_attempts // 60) for s in plan.schedules] + [_NEVER],
+        dtype=np.int64,
+    )
+
+    schedule_index = {s.schedule_id: i for i, s in enumerate(plan.schedules)}
+    tasks = [t for t in plan.tasks if any(schedule_id in schedule_index for schedule_id in t.schedule_ids)]
+
+    # each task's schedules as a row of indexes, padded with the extra never-open schedule at the end
+    width = max((len(t.schedule_ids) for t in tasks), default=1)
+    task_schedules = np.full((len(tasks), width), len(plan.schedules), dtype=np.int64)
+    for i, t in enumerate(tasks):
+        indexes = [schedule_index[schedule_id] for schedule_id in t.schedule_ids if schedule_id in schedule_index]
+        task_schedules[i, : len(indexes)] = indexes
+
+    millis = [(t.p95_millis or t.expected_millis) if use_p95 else t.expected_millis for t in tasks]
+    durations = np.array([max(-(-(m or 0) // 60_000), 1) for m in millis], dtype=np.int64)
+
+    # a task that ran recently is not ready until its gap has passed
+    shortest_gaps = gap_minutes[task_schedules].min(axis=1)
+    latest_attempts = np.array(
+        [-_NEVER if t.latest_attempt_ts is None else (t.latest_attempt_ts - start_ts) // _MINUTE for t in tasks],
+        dtype=np.int64,
+    )
+    ready = np.where(latest_attempts == -_NEVER, 0, latest_attempts + durations + shortest_gaps)
+
+    started_tasks: list[np.ndarray] = []
+    started_minutes: list[np.ndarray] = []
+    for minute in np.flatnonzero(open_schedules.any(axis=1)):
+        is_open = open_schedules[minute]
+        due = is_open[task_schedules].any(axis=1) & (ready <= minute)
+        if not due.any():
+            continue
+
+        started = np.flatnonzero(due)
+        schedules = task_schedules[started]
+        gaps = np.where(is_open[schedules], gap_minutes[schedules], _NEVER).min(axis=1)
+        ready[started] = minute + durations[started] + gaps
+
+        started_tasks.append(started)
+        started_minutes.append(np.full(len(started), minute, dtype=np.int64))
+
+    run_tasks = np.concatenate(started_tasks) if started_tasks else np.zeros(0, dtype=np.int64)
+    run_starts = np.concatenate(started_minutes) if started_minutes else np.zeros(0, dtype=np.int64)
+    run_ends = np.minimum(run_starts + durations[run_tasks], minutes)
+
+    runner_load = _load(
+        rows=np.zeros(len(run_tasks), dtype=np.int64),
+        units=np.ones(len(run_tasks), dtype=np.int64),
+        starts=run_starts,
+        ends=run_ends,
+        row_count=1,
+        minutes=minutes,
+    )[0]
+
+    # the (task, resource, units) the tasks take, grouped by task, so each task's are pair_offsets[i]:pair_offsets[i+1]
+    resource_index = {r.resource_id: i for i, r in enumerate(plan.resources)}
+    pairs = np.array(
+        [
+            (i, resource_index[resource_id], units)
+            for i, t in enumerate(tasks)
+            for resource_id, units in t.resource_units
+            if resource_id in resource_index
+        ],
+        dtype=np.int64,
+    ).reshape(-1, 3)
+    pair_offsets = np.concatenate([[0], np.cumsum(np.bincount(pairs[:, 0], minlength=len(tasks)))])
+
+    # one entry per run and resource the run's task takes
+    counts = pair_offsets[run_tasks + 1] - pair_offsets[run_tasks]
+    runs = np.repeat(np.arange(len(run_tasks)), counts)
+    expanded = np.repeat(pair_offsets[run_tasks] - (np.cumsum(counts) - counts), counts) + np.arange(len(runs))
+    resource_load = _load(
+        rows=pairs[expanded, 1],
+        units=pairs[expanded, 2],
+        starts=run_starts[runs],
+        ends=run_ends[runs],
+        row_count=len(plan.resources),
+        minutes=minutes,
+    )
+    load = {r.name: row for r, row in zip(plan.resources, resource_load)}
+    capacity = {r.name: r.capacity for r in plan.resources}
+
+    return Forecast(
+        start_ts=start_ts,
+        runners=runners,
+        runner_load=runner_load,
+        capacity=capacity,
+        load=load,
+        overloads=[
+            *_overloads(name="runners", load=runner_load, capacity=runners, start_ts=start_ts, runners=True),
+            *(
+                overload
+                for name, row in load.items()
+                for overload in _overloads(name=name, load=row, capacity=capacity[name], start_ts=start_ts)
+            ),
+        ],
+        tasks_without_history=sum(1 for m in millis if m is None),
+    )
+
+
+def render(f: Forecast, /, *, max_rows: int = 50) -> str:
+    """Formats a forecast for the terminal."""
+    minutes = len(f.runner_load)
+    lines = [f"forecast for {minutes // (24 * 60)} days from {f.start_ts.isoformat()}", ""]
+    if f.tasks_without_history:
+        lines += [f"{f.tasks_without_history} tasks have no runtime history and are counted as 1 minute.", ""]
+
+    lines.append(f"  {'resource':<40} {'capacity':>8} {'peak':>6} {'minutes over':>12}")
+    over = int((f.runner_load > f.runners).sum())
+    lines.append(f"  {'(runners)':<40} {f.runners:>8} {int(f.runner_load.max(initial=0)):>6} {over:>12}")
+    for name, load in f.load.items():
+        over = int((load > f.capacity[name]).sum())
+        lines.append(f"  {name:<40} {f.capacity[name]:>8} {int(load.max(initial=0)):>6} {over:>12}")
+
+    lines += ["", f"over capacity ({len(f.overloads)}):"]
+    for o in sorted(f.overloads, key=lambda o: o.start_ts)[:max_rows]:
+        name = "(runners)" if o.runners else o.name
+        lines.append(f"  {name:<40} {o.start_ts:%Y-%m-%d %H:%M} to {o.end_ts:%H:%M}  peak {o.peak} of {o.capacity}")
+    return "\n".join(lines)
+
+
+def _load(
+    *,
+    rows: np.ndarray,
+    units: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    row_count: int,
+    minutes: int,
+) -> np.ndarray:
+    # +units where a run starts and -units where it ends, so a running sum over the minutes is the load
+    delta = np.zeros((row_count, minutes + 1), dtype=np.int64)
+    np.add.at(delta, (rows, starts), units)
+    np.add.at(delta, (rows, ends), -units)
+    return np.cumsum(delta, axis=1)[:, :minutes]
+
+
+def _open_schedules(
+    *,
+    schedules: list[data.Schedule],
+    start_minute: int,
+    minutes: int,
+    time_zone: datetime.tzinfo,
+) -> np.ndarray:
+    """A (minutes, schedules + 1) array of whether each schedule is open in each minute, with the calendar fields in
+    time_zone and start_ts and end_ts compared as instants.  The extra last column is never open, for padding."""
+    epoch_minutes = start_minute + np.arange(minutes, dtype=np.int64)
+    offsets = _utc_offset_minutes(start_minute=start_minute, minutes=minutes, time_zone=time_zone)
+    local_minutes = epoch_minutes + offsets
+    local_days = local_minutes // (24 * 60)
+    days = local_days.astype("datetime64[D]")
+    months = days.astype("datetime64[M]")
+
+    month = (months.astype(np.int64) % 12 + 1)[:, None]
+    month_day = ((days - months.astype("datetime64[D]")).astype(np.int64) + 1)[:, None]
+    week_day = ((local_days + 3) % 7 + 1)[:, None]  # 1970-01-01 was a Thursday; 1 = Monday, as ISODOW
+    hour = (local_minutes // 60 % 24)[:, None]
+    minute = (local_minutes % 60)[:, None]
+    epoch_minutes = epoch_minutes[:, None]
+
+    def column(field: str) -> np.ndarray:
+        return np.array([getattr(s, field) for s in schedules], dtype=np.int64)[None, :]
+
+    def ts_column(field: str) -> np.ndarray:
+        return np.array(
+            [(getattr(s, field) - _EPOCH) // _MINUTE for s in schedules],
+            dtype=np.int64,
+        )[None, :]
+
+    is_open = (
+        (epoch_minutes >= ts_column("start_ts"))
+        & (epoch_minutes <= ts_column("end_ts"))
+        & (month >= column("start_month"))
+        & (month <= column("end_month"))
+        & (month_day >= column("start_month_day"))
+        & (month_day <= column("end_month_day"))
+        & (week_day >= column("start_week_day"))
+        & (week_day <= column("end_week_day"))
+        & (hour >= column("start_hour"))
+        & (hour <= column("end_hour"))
+        & (minute >= column("start_minute"))
+        & (minute <= column("end_minute"))
+    )
+    return np.concatenate([is_open, np.zeros((minutes, 1), dtype=bool)], axis=1)
+
+
+def _utc_offset_minutes(*, start_minute: int, minutes: int, time_zone: datetime.tzinfo) -> np.ndarray:
+    """The offset of time_zone from UTC in each minute.  It is looked up once an hour, and minute by minute only in the
+    hours it changes in."""
+
+    def offset(epoch_minute: int) -> int:
+        utc_offset = (_EPOCH + epoch_minute * _MINUTE).astimezone(time_zone).utcoffset()
+        return typing.cast(datetime.timedelta, utc_offset) // _MINUTE
+
+    hours = -(-minutes // 60)
+    hourly = np.array([offset(start_minute + h * 60) for h in range(hours + 1)], dtype=np.int64)
+    offsets = np.repeat(hourly[:-1], 60)[:minutes]
+    for h in map(int, np.flatnonzero(hourly[1:] != hourly[:-1])):
+        for m in range(h * 60 + 1, min((h + 1) * 60, minutes)):
+            offsets[m] = offset(start_minute + m)
+    return offsets
+
+
+def _overloads(
+    *,
+    name: str,
+    load: np.ndarray,
+    capacity: int,
+    start_ts: datetime.datetime,
+    runners: bool = False,
+) -> list[Overload]:
+    over = np.concatenate([[False], load > capacity, [False]])
+    edges = np.flatnonzero(over[1:] != over[:-1])
+    return [
+        Overload(
+            name=name,
+            runners=runners,
+            capacity=capacity,
+            start_ts=start_ts + datetime.timedelta(minutes=int(first)),
+            end_ts=start_ts + datetime.timedelta(minutes=int(last)),
+            peak=int(load[first:last].max()),
+        )
+        for first, last in zip(edges[::2], edges[1::2])
+    ]
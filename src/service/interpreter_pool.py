@@ -0,0 +1,502 @@
+from __future__ import annotations
+
+import collections
+import functools
+import json
+import os
+import pathlib
+import queue
+import shutil
+import subprocess
+import threading
+import time
+import typing
+
+from loguru import logger
+
+from src import data
+from src.service.supervisor import Supervisor, popen_process_group_kwargs
+
+__all__ = ("InterpreterPool",)
+
+
+# Runs inside the conda env's own interpreter, so it may only use the standard library.  It is passed with -c rather
+# than as a file so that it also works from the frozen executable.
+_WORKER_SOURCE = r'''
+import importlib, json, os, signal, sys, time, traceback, types
+
+project_dir, preload_fn = sys.argv[1], sys.argv[2]
+
+# keep stdout for the protocol and send anything the project prints to stderr
+protocol = os.fdopen(os.dup(1), "w", buffering=1)
+os.dup2(2, 1)
+sys.stdout = sys.stderr
+
+sys.path.insert(0, project_dir)
+os.chdir(project_dir)
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+if sys.platform == "win32":
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    ctypes.windll.kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    ctypes.windll.psapi.GetProcessMemoryInfo.argtypes = [
+        wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD,
+    ]
+
+
+def proc_status_kb(field):
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Resets the worker's RSS high-water mark, so that VmHWM is the peak of the call that follows.  Linux only."""
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+    except OSError:
+        return False
+    return proc_status_kb("VmHWM") is not None
+
+
+def rss_kb():
+    """The worker's resident set size now, which decides when it is recycled."""
+    if sys.platform == "win32":
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize // 1024
+        return None
+    if (rss := proc_status_kb("VmRSS")) is not None:
+        return rss
+    if resource is None:
+        return None
+    # macOS has no current RSS in the standard library, so fall back to the lifetime peak
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss // 1024 if sys.platform == "darwin" else maxrss
+
+
+def rusage():
+    if resource is None:
+        return None
+    own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        field: getattr(own, field) + getattr(children, field)
+        for field in ("ru_utime", "ru_stime", "ru_inblock", "ru_oublock", "ru_nvcsw", "ru_nivcsw")
+    }
+
+
+def usage_since(before):
+    after = rusage()
+    if before is None or after is None:
+        return None
+    delta = {field: after[field] - before[field] for field in after}
+    return {
+        "user_cpu_millis": int(delta["ru_utime"] * 1000),
+        "system_cpu_millis": int(delta["ru_stime"] * 1000),
+        "block_reads": delta["ru_inblock"],
+        "block_writes": delta["ru_oublock"],
+        "voluntary_context_switches": delta["ru_nvcsw"],
+        "involuntary_context_switches": delta["ru_nivcsw"],
+    }
+
+
+def resolve(fn):
+    try:
+        target = importlib.import_module(fn)
+    except ImportError:
+        module_name, _, attr = fn.rpartition(".")
+        target = getattr(importlib.import_module(module_name), attr)
+    if isinstance(target, types.ModuleType):
+        target = getattr(target, "main")
+    return target
+
+
+def respond(call, response):
+    start, before, peak_reset = call
+    response["millis"] = int((time.monotonic() - start) * 1000)
+    response["usage"] = usage_since(before)
+    # only where the high-water mark was reset for this call, otherwise it would include every call before it
+    response["peak_rss_kb"] = proc_status_kb("VmHWM") if peak_reset else None
+    response["rss_kb"] = rss_kb()
+    protocol.write(json.dumps(response) + "\n")
+
+
+current = None
+
+
+def on_sigterm(signum, frame):
+    # the supervisor is stopping a call that ran past its timeout, so report what it used before going
+    if current is not None:
+        respond(current, {"ok": False, "error": "The call was terminated.", "terminated": True})
+    os._exit(1)
+
+
+signal.signal(signal.SIGTERM, on_sigterm)
+
+resolve(preload_fn)
+protocol.write(json.dumps({"ready": True, "pid": os.getpid()}) + "\n")
+
+for line in sys.stdin:
+    request = json.loads(line)
+    current = (time.monotonic(), rusage(), reset_peak_rss())
+    try:
+        resolve(request["fn"])(**request["fn_args"])
+        response = {"ok": True}
+    except BaseException:
+        response = {"ok": False, "error": traceback.format_exc()}
+    call, current = current, None
+    respond(call, response)
+'''
+
+
+class InterpreterPool:
+    """Keeps pre-started interpreters for each conda env/project, with the project's modules already imported, so that
+    CondaProjectTask jobs do not pay for starting Python and importing the project on every run.
+
+    Workers are replaced when their RSS after a call passes max_rss_mb, after max_calls_per_worker calls, after the
+    supervisor kills them for running past a job's timeout, or when a .py file in the project changes.  RSS is read
+    from /proc on Linux and with GetProcessMemoryInfo on Windows.
+    """
+
+    def __init__(
+        self,
+        *,
+        supervisor: Supervisor,
+        project_root: pathlib.Path,
+        workers_per_env: int,
+        max_rss_mb: int,
+        max_calls_per_worker: int,
+        seconds_between_code_checks: int = 10,
+    ):
+        self._supervisor = supervisor
+        self._project_root = project_root
+        self._workers_per_env = workers_per_env
+        self._max_rss_mb = max_rss_mb
+        self._max_calls_per_worker = max_calls_per_worker
+        self._seconds_between_code_checks = seconds_between_code_checks
+
+        self._lock = threading.Lock()
+        self._envs: dict[tuple[str, str], _EnvPool] = {}
+
+    def close(self) -> None:
+        with self._lock:
+            for env_pool in self._envs.values():
+                env_pool.close()
+            self._envs.clear()
+
+    def run(self, *, job: data.Job, retries: int) -> data.JobResult:
+        task = job.task
+        assert isinstance(task, data.CondaProjectTask)
+
+        key = (task.env, task.project_name)
+        with self._lock:
+            env_pool = self._envs.get(key)
+
+        if env_pool is None:
+            # conda run can take a while to resolve an env, so other envs' jobs are not kept waiting on the lock
+            python = _env_python(task.env)
+            with self._lock:
+                if (env_pool := self._envs.get(key)) is None:
+                    env_pool = self._envs[key] = _EnvPool(
+                        python=python,
+                        project_dir=self._project_root / task.project_name,
+                        preload_fn=task.fn,
+                        size=self._workers_per_env,
+                        seconds_between_code_checks=self._seconds_between_code_checks,
+                    )
+
+        worker = env_pool.checkout()
+        start = time.monotonic()
+        deadline = self._supervisor.watch(pid=worker.pid, name=task.name, timeout_seconds=task.timeout_seconds)
+        try:
+            response = worker.call(request={"fn": task.fn, "fn_args": task.fn_kwargs()})
+        except Exception as e:
+            worker.kill()
+            self._supervisor.release(deadline)
+            if deadline.killed.is_set():
+                # the worker did not get to report what the call used, so only the wall time is known
+                logger.error(f"[{task.name}] timed out after {task.timeout_seconds} seconds.")
+                return data.JobResult.timeout(
+                    job=job,
+                    retries=retries,
+                    resource_usage=data.ResourceUsage(wall_millis=int((time.monotonic() - start) * 1000)),
+                )
+            return data.JobResult.error(job=job, code=-1, message=f"{e!s}\n{worker.stderr_tail()}", retries=retries)
+        finally:
+            self._supervisor.release(deadline)
+            env_pool.checkin(worker=worker, keep=not deadline.killed.is_set() and self._keep(worker=worker))
+
+        usage = data.ResourceUsage(
+            wall_millis=response["millis"],
+            peak_rss_kb=response["peak_rss_kb"],
+            **(response["usage"] or {}),
+        )
+        if deadline.killed.is_set():
+            # the worker reported what the call used when the supervisor's signal stopped it
+            logger.error(f"[{task.name}] timed out after {task.timeout_seconds} seconds.")
+            return data.JobResult.timeout(job=job, retries=retries, resource_usage=usage)
+        if response["ok"]:
+            return data.JobResult.success(
+                job=job,
+                execution_millis=response["millis"],
+                retries=retries,
+                resource_usage=usage,
+            )
+        return data.JobResult.error(job=job, code=-1, message=response["error"], retries=retries, resource_usage=usage)
+
+    def _keep(self, *, worker: _Worker) -> bool:
+        if not worker.alive:
+            return False
+
+        if worker.calls >= self._max_calls_per_worker:
+            logger.debug(f"Recycling conda worker {worker.pid} after {worker.calls} calls.")
+            return False
+
+        if worker.rss_kb is not None and worker.rss_kb > self._max_rss_mb * 1024:
+            logger.info(f"Recycling conda worker {worker.pid}, its RSS was {worker.rss_kb // 1024} MB.")
+            return False
+
+        return True
+
+
+class _EnvPool:
+    def __init__(
+        self,
+        *,
+        python: str,
+        project_dir: pathlib.Path,
+        preload_fn: str,
+        size: int,
+        seconds_between_code_checks: int,
+    ):
+        self._python = python
+        self._project_dir = project_dir
+        self._preload_fn = preload_fn
+        self._size = size
+        self._seconds_between_code_checks = seconds_between_code_checks
+
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._idle: collections.deque[_Worker] = collections.deque()
+        self._starting = 0
+        self._slots = threading.Semaphore(size)
+        self._closed = False
+
+        self._code_version = _code_version(project_dir)
+        self._last_code_check = time.monotonic()
+
+        for _ in range(size):
+            self._start_in_background()
+
+    def checkin(self, *, worker: _Worker, keep: bool) -> None:
+        with self._lock:
+            returned = keep and self._accepts(worker)
+            if returned:
+                self._idle.append(worker)
+                self._changed.notify()
+
+        if not returned:
+            worker.kill()
+            self._start_in_background()
+
+        self._slots.release()
+
+    def checkout(self) -> _Worker:
+        self._slots.acquire()
+        try:
+            self._check_code_version()
+            with self._lock:
+                while True:
+                    while self._idle:
+                        worker = self._idle.popleft()
+                        if worker.alive:
+                            return worker
+                        worker.kill()
+                    if not self._starting:
+                        break
+                    self._changed.wait()
+            # nothing warm or warming up, so pay the startup cost now
+            return self._start()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            while self._idle:
+                self._idle.popleft().kill()
+
+    def _accepts(self, worker: _Worker, /) -> bool:
+        return not self._closed and worker.code_version == self._code_version and len(self._idle) < self._size
+
+    def _check_code_version(self) -> None:
+        if time.monotonic() - self._last_code_check < self._seconds_between_code_checks:
+            return
+
+        code_version = _code_version(self._project_dir)
+        with self._lock:
+            self._last_code_check = time.monotonic()
+            if code_version == self._code_version:
+                return
+
+            logger.info(f"The code in {self._project_dir!s} changed, recycling its conda workers...")
+            self._code_version = code_version
+            stale = list(self._idle)
+            self._idle.clear()
+
+        for worker in stale:
+            worker.kill()
+            self._start_in_background()
+
+    def _start(self) -> _Worker:
+        return _Worker(
+            python=self._python,
+            project_dir=self._project_dir,
+            preload_fn=self._preload_fn,
+            code_version=self._code_version,
+        )
+
+    def _start_in_background(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._starting += 1
+
+        def start() -> None:
+            worker: _Worker | None = None
+            try:
+                worker = self._start()
+            except Exception as e:
+                logger.error(f"Unable to start a conda worker for {self._project_dir!s}: {e!s}")
+
+            with self._lock:
+                self._starting -= 1
+                if worker is not None and self._accepts(worker):
+                    self._idle.append(worker)
+                    worker = None
+                self._changed.notify()
+
+            if worker is not None:
+                worker.kill()
+
+        threading.Thread(target=start, daemon=True).start()
+
+
+class _Worker:
+    def __init__(self, *, python: str, project_dir: pathlib.Path, preload_fn: str, code_version: float):
+        self.code_version = code_version
+        self.calls = 0
+        self.rss_kb: int | None = None
+
+        self._proc = subprocess.Popen(
+            [python, "-u", "-c", _WORKER_SOURCE, str(project_dir), preload_fn],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=project_dir,
+            text=True,
+            bufsize=1,
+            **popen_process_group_kwargs(),  # type: ignore[call-overload]
+        )
+        self._responses: queue.Queue[dict[str, typing.Any] | None] = queue.Queue()
+        self._stderr: collections.deque[str] = collections.deque(maxlen=50)
+
+        threading.Thread(target=self._read_stdout, daemon=True).start()
+        threading.Thread(target=self._read_stderr, daemon=True).start()
+
+        try:
+            ready = self._responses.get(timeout=300)
+        except queue.Empty:
+            ready = None
+        if ready is None or not ready.get("ready"):
+            self.kill()
+            raise Exception(f"The conda worker for {project_dir!s} failed to start:\n{self.stderr_tail()}")
+
+    @property
+    def alive(self) -> bool:
+        return self._proc.poll() is None
+
+    @property
+    def pid(self) -> int:
+        return self._proc.pid
+
+    def call(self, *, request: dict[str, typing.Any]) -> dict[str, typing.Any]:
+        """Waits as long as the worker lives; the supervisor is what enforces the job's timeout."""
+        assert self._proc.stdin is not None
+
+        self.calls += 1
+        self._proc.stdin.write(json.dumps(request) + "\n")
+        self._proc.stdin.flush()
+
+        response = self._responses.get()
+        if response is None:
+            raise Exception(f"The conda worker exited with code {self._proc.wait()}.")
+
+        self.rss_kb = response.get("rss_kb")
+        return response
+
+    def kill(self) -> None:
+        if self.alive:
+            self._proc.kill()
+        self._proc.wait()
+
+    def stderr_tail(self) -> str:
+        return "".join(self._stderr)
+
+    def _read_stderr(self) -> None:
+        assert self._proc.stderr is not None
+        for line in self._proc.stderr:
+            self._stderr.append(line)
+
+    def _read_stdout(self) -> None:
+        assert self._proc.stdout is not None
+        for line in self._proc.stdout:
+            self._responses.put(json.loads(line))
+        self._responses.put(None)
+
+
+def _code_version(project_dir: pathlib.Path, /) -> float:
+    return max((fp.stat().st_mtime for fp in project_dir.rglob("*.py")), default=0.0)
+
+
+@functools.lru_cache
+def _env_python(env: str, /) -> str:
+    conda = os.environ.get("CONDA_EXE") or shutil.which("conda") or "conda"
+    proc = subprocess.run(
+        [conda, "run", "-n", env, "python", "-c", "import sys; print(sys.executable)"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return proc.stdout.strip().splitlines()[-1]
+
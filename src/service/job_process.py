@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import os
+import pathlib
+import signal
+import subprocess
+import sys
+import typing
+
+from src import data
+from src.service.usage import Meter
+
+if typing.TYPE_CHECKING:
+    import multiprocessing.connection
+
+__all__ = ("new_process_group", "run_job")
+
+
+# This is the only ppe module a job process needs, so it is kept to the standard library and src.data; a spawned job
+# process, as the frozen executable starts on Windows, imports this and nothing else.  psycopg2 is imported by the SQL
+# tasks that use it.
+
+
+def new_process_group() -> None:
+    """Called at the top of a job process so that it and everything it starts can be killed as one group."""
+    if sys.platform != "win32":
+        os.setsid()
+
+
+def run_job(
+    job: data.Job,
+    connection_str: str,
+    tool_dir: pathlib.Path,
+    result_conn: multiprocessing.connection.Connection,
+    retries: int,
+    /,
+) -> None:
+    new_process_group()
+
+    if isinstance(job.task, data.CmdLineUtilityTask):
+        _run_cmd_line_utility_task(job=job, tool_dir=tool_dir, result_conn=result_conn, retries=retries)
+    elif isinstance(job.task, data.SQLTask):
+        _run_sql_task(job=job, connection_str=connection_str, result_conn=result_conn, retries=retries)
+    else:
+        raise Exception(f"Unrecognized job task, {job.task.__class__.__name__}.")  # todo create custom exception
+
+
+def _run_cmd_line_utility_task(
+    *,
+    job: data.Job,
+    tool_dir: pathlib.Path,
+    result_conn: multiprocessing.connection.Connection,
+    retries: int,
+) -> None:
+    assert isinstance(job.task, data.CmdLineUtilityTask)
+
+    result = data.JobResult.error(
+        job=job,
+        code=-1,
+        message=f"[{job.task.name}] never ran.",
+        retries=retries,
+    )
+    try:
+        if (fp := (tool_dir / job.task.tool)).exists():
+            tool_path = fp
+        elif (nested_fp := tool_dir / pathlib.Path(job.task.tool).with_suffix("").name / job.task.tool).exists():
+            tool_path = nested_fp
+        else:
+            raise Exception(
+                f"The tool specified, {job.task.tool!r}, was not found in the tools directory.  "
+                f"The following paths were checked: {fp.resolve()!s}, {nested_fp.resolve()!s}"
+            )
+
+        meter = Meter(children_only=True)
+        _wait_for_tool_on_sigterm()
+
+        executable_arg = str(tool_path.resolve())
+        if job.task.tool_args:
+            cmd = [executable_arg] + job.task.tool_args
+        else:
+            cmd = [executable_arg]
+
+        proc_result = subprocess.run(
+            cmd,
+            capture_output=True,
+            cwd=tool_path.parent,
+        )
+
+        usage = meter.usage()
+
+        if proc_result.returncode:
+            result = data.JobResult.error(
+                job=job,
+                code=proc_result.returncode,
+                message=str(proc_result.stderr),
+                retries=retries,
+                resource_usage=usage,
+            )
+        else:
+            result = data.JobResult.success(
+                job=job,
+                execution_millis=usage.wall_millis,
+                retries=retries,
+                resource_usage=usage,
+            )
+    except Exception as e:
+        result = data.JobResult.error(job=job, code=-1, message=str(e), retries=retries)
+    finally:
+        result_conn.send(result)
+
+
+def _wait_for_tool_on_sigterm() -> None:
+    """The supervisor's polite signal goes to the whole process group, so the tool stops on its own; this process
+    waits for it rather than exiting first, so that what a job that timed out used is still reported."""
+    if sys.platform != "win32":
+        # a handler rather than SIG_IGN, which the tool would inherit
+        signal.signal(signal.SIGTERM, lambda signum, frame: None)
+
+
+def _run_sql_task(
+    *,
+    job: data.Job,
+    connection_str: str,
+    result_conn: multiprocessing.connection.Connection,
+    retries: int,
+) -> None:
+    assert isinstance(job.task, data.SQLTask)
+
+    result = data.JobResult.error(
+        job=job,
+        code=-1,
+        message=f"[{job.task.name}] never ran.",
+        retries=retries,
+    )
+    try:
+        # most of the work happens on the server, so this mostly shows the time spent waiting on it
+        meter = Meter()
+
+        import psycopg2
+
+        with psycopg2.connect(connection_str) as con:
+            with con.cursor() as cur:
+                cur.execute(typing.cast(str, job.task.sql))
+
+        usage = meter.usage()
+        result = data.JobResult.success(
+            job=job,
+            execution_millis=usage.wall_millis,
+            retries=retries,
+            resource_usage=usage,
+        )
+    except Exception as e:
+        result = data.JobResult.error(
+            job=job,
+            code=-1,
+            message=str(e),
+            retries=retries,
+        )
+    finally:
+        result_conn.send(result)
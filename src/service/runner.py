@@ -1,18 +1,24 @@
 from __future__ import annotations
 
-import datetime
+import json
 import multiprocessing as mp
+import multiprocessing.connection
 import pathlib
 import queue
-import subprocess
 import threading
 import time
 import typing
 
-import psycopg2
 from loguru import logger
 
 from src import data
+from src.service.dispatch import Dispatcher
+from src.service.interpreter_pool import InterpreterPool
+from src.service.job_process import run_job
+from src.service.sql_target_pool import SqlTargetPool
+from src.service.status import StatusBoard
+from src.service.supervisor import Supervisor
+from src.service.trace import Tracer
 
 __all__ = ("Runner",)
 
@@ -22,16 +28,35 @@ class Runner(threading.Thread):
         self,
         *,
         db: data.Db,
+        dispatcher: Dispatcher,
+        interpreter_pool: InterpreterPool,
+        sql_target_pool: SqlTargetPool,
+        supervisor: Supervisor,
+        status: StatusBoard,
         connection_str: str,
         tool_dir: pathlib.Path,
+        drain: threading.Event,
+        abandon: threading.Event,
         cancel: threading.Event,
+        tracer: Tracer | None = None,
+        name: str | None = None,
     ):
-        super().__init__()
+        """drain stops the runner from claiming new jobs; abandon means the job in hand was killed by a shutdown, so
+        it is cancelled rather than recorded as a failure."""
+        super().__init__(name=name)
 
         self._db = db
+        self._dispatcher = dispatcher
+        self._interpreter_pool = interpreter_pool
+        self._sql_target_pool = sql_target_pool
+        self._supervisor = supervisor
+        self._status = status
         self._connection_str = connection_str
         self._tool_dir = tool_dir
+        self._drain = drain
+        self._abandon = abandon
         self._cancel = cancel
+        self._tracer = tracer or Tracer()
 
         self._e: Exception | None = None
 
@@ -48,22 +73,19 @@ class Runner(threading.Thread):
             raise self._e
 
     def run(self) -> None:
-        while not self._cancel.is_set():
+        while not self._cancel.is_set() and not self._drain.is_set():
             try:
-                job = self._db.get_ready_job()
+                job = self._dispatcher.next_job()
                 if job is not None:
-                    logger.info(f"Starting [{job.task.name}]...")
-
-                    result = _run_job_with_retry(
-                        connection_str=self._connection_str,
-                        tool_dir=self._tool_dir,
-                        job=job,
-                        retries_so_far=0,
-                    )
-
-                    _add_result(db=self._db, result=result)
+                    with logger.contextualize(job_id=job.job_id):
+                        self._run(job=job)
             except queue.Empty:
                 logger.debug("Queue is empty")
+            except data.DbUnavailableError as e:
+                # running jobs carry on; polling resumes once the circuit lets a call through again
+                logger.debug(f"Not claiming jobs: {e!s}")
+                self._sleep(e.retry_after_seconds)
+                continue
             except Exception as e:
                 self._e = e
                 logger.exception(e)
@@ -72,6 +94,78 @@ class Runner(threading.Thread):
 
             time.sleep(1)
 
+    def _run(self, *, job: data.Job) -> None:
+        try:
+            if self._skip_if_unchanged(job=job):
+                return
+
+            logger.info(f"Starting [{job.task.name}]...")
+            self._status.job_started(job=job)
+
+            with self._tracer.span("execute", cat="job", job_id=job.job_id, task=job.task.name):
+                result = _run_job_with_retry(
+                    interpreter_pool=self._interpreter_pool,
+                    sql_target_pool=self._sql_target_pool,
+                    supervisor=self._supervisor,
+                    tracer=self._tracer,
+                    connection_str=self._connection_str,
+                    tool_dir=self._tool_dir,
+                    drain=self._drain,
+                    abandon=self._abandon,
+                    job=job,
+                    retries_so_far=0,
+                )
+        finally:
+            self._dispatcher.job_finished()
+
+        self._status.job_finished(result=result)
+
+        # the job has run, so its result waits out a database outage rather than being thrown away
+        with self._tracer.span("result write", cat="job", job_id=job.job_id, task=job.task.name):
+            while True:
+                try:
+                    if self._abandon.is_set() and result.is_err:
+                        logger.info(f"[{job.task.name}] was stopped by the shutdown.")
+                        self._db.log_job_cancelled(job_id=job.job_id, reason="ppe shut down before the job finished.")
+                    else:
+                        _add_result(db=self._db, result=result)
+                    return
+                except data.DbUnavailableError as e:
+                    if self._cancel.is_set():
+                        raise
+                    logger.warning(f"Unable to record the result of [{job.task.name}] yet: {e!s}")
+                    time.sleep(max(e.retry_after_seconds, 1))
+
+    def _skip_if_unchanged(self, *, job: data.Job) -> bool:
+        task = job.task
+        if task.fingerprint_sql is None:
+            return False
+
+        try:
+            with self._tracer.span("fingerprint", cat="job", job_id=job.job_id, task=task.name):
+                if isinstance(task, data.SQLTask) and task.target is not None:
+                    row = self._sql_target_pool.fetch_fingerprint(target=task.target, sql=task.fingerprint_sql)
+                else:
+                    row = self._db.fetch_fingerprint(sql=task.fingerprint_sql)
+                fingerprint = None if row is None else json.dumps(list(row), default=str)
+                skipped = self._db.skip_job_if_unchanged(job_id=job.job_id, fingerprint=fingerprint)
+        except Exception as e:
+            # the fingerprint only saves work, so a query that fails means the job runs
+            message = f"Unable to check whether the inputs of [{task.name}] changed, running it: {e!s}"
+            logger.warning(message)
+            self._db.log_job_info(job_id=job.job_id, message=message)
+            return False
+
+        if skipped:
+            logger.info(f"[{task.name}] was skipped, its inputs have not changed since its last successful run.")
+        return skipped
+
+    def _sleep(self, seconds: float, /) -> None:
+        # in steps, so a drain or cancel is not held up by a long backoff
+        end = time.monotonic() + max(seconds, 1)
+        while not self._cancel.is_set() and not self._drain.is_set() and (remaining := end - time.monotonic()) > 0:
+            time.sleep(min(remaining, 1))
+
 
 def _add_result(*, db: data.Db, result: data.JobResult) -> None:
     if result.is_err:
@@ -81,6 +175,9 @@ def _add_result(*, db: data.Db, result: data.JobResult) -> None:
             job_id=result.job.job_id,
             return_code=result.return_code or -1,
             error_message=result.error_message or "No error message was provided.",
+            timed_out=result.timed_out,
+            retries=result.retries or 0,
+            resource_usage=result.resource_usage,
         )
     else:
         logger.info(f"[{result.job.task.name}] completed successfully in {result.execution_millis/1000:.0f} seconds.")
@@ -88,40 +185,70 @@ def _add_result(*, db: data.Db, result: data.JobResult) -> None:
         db.log_job_success(
             job_id=result.job.job_id,
             execution_millis=typing.cast(int, result.execution_millis),
+            retries=result.retries or 0,
+            resource_usage=result.resource_usage,
         )
 
 
 def _run_job_with_retry(
     *,
+    interpreter_pool: InterpreterPool,
+    sql_target_pool: SqlTargetPool,
+    supervisor: Supervisor,
+    tracer: Tracer,
     connection_str: str,
     tool_dir: pathlib.Path,
+    drain: threading.Event,
+    abandon: threading.Event,
     job: data.Job,
     retries_so_far: int = 0,
 ) -> data.JobResult:
+    """A job is not retried once ppe is shutting down, so a job the shutdown killed is not started again."""
+    if retries_so_far:
+        tracer.instant("retry", cat="job", job_id=job.job_id, task=job.task.name, retry=retries_so_far)
     try:
-        result = _run_job_in_process(
-            connection_str=connection_str,
-            tool_dir=tool_dir,
-            job=job,
-            retries=retries_so_far,
-        )
+        if isinstance(job.task, data.CondaProjectTask):
+            result = interpreter_pool.run(job=job, retries=retries_so_far)
+        elif isinstance(job.task, data.SQLTask) and job.task.target is not None:
+            result = sql_target_pool.run(job=job, retries=retries_so_far)
+        else:
+            result = _run_job_in_process(
+                supervisor=supervisor,
+                tracer=tracer,
+                connection_str=connection_str,
+                tool_dir=tool_dir,
+                job=job,
+                retries=retries_so_far,
+            )
         if result.is_err:
-            if job.task.retries > retries_so_far:
+            if job.task.retries > retries_so_far and not drain.is_set() and not abandon.is_set():
                 logger.info(f"Retrying [{job.task.name}] ({retries_so_far + 1}/{job.task.retries})...")
                 return _run_job_with_retry(
+                    interpreter_pool=interpreter_pool,
+                    sql_target_pool=sql_target_pool,
+                    supervisor=supervisor,
+                    tracer=tracer,
                     connection_str=connection_str,
                     tool_dir=tool_dir,
+                    drain=drain,
+                    abandon=abandon,
                     job=job,
                     retries_so_far=retries_so_far + 1,
                 )
             return result
         return result
     except Exception as e:
-        if job.task.retries > retries_so_far:
+        if job.task.retries > retries_so_far and not drain.is_set() and not abandon.is_set():
             logger.info(f"Retrying [{job.task.name}] ({retries_so_far + 1}/{job.task.retries})...")
             return _run_job_with_retry(
+                interpreter_pool=interpreter_pool,
+                sql_target_pool=sql_target_pool,
+                supervisor=supervisor,
+                tracer=tracer,
                 connection_str=connection_str,
                 tool_dir=tool_dir,
+                drain=drain,
+                abandon=abandon,
                 job=job,
                 retries_so_far=retries_so_far + 1,
             )
@@ -130,148 +257,63 @@ def _run_job_with_retry(
 
 def _run_job_in_process(
     *,
+    supervisor: Supervisor,
+    tracer: Tracer,
     connection_str: str,
     tool_dir: pathlib.Path,
     job: data.Job,
     retries: int,
 ) -> data.JobResult:
-    result_queue: "mp.Queue[data.JobResult]" = mp.Queue()
-    try:
-        p = mp.Process(target=_run_job, args=(job, connection_str, tool_dir, result_queue, retries))
-        p.start()
-        result = result_queue.get(block=True, timeout=job.task.timeout_seconds)
-        p.join()
-        return result
-    except queue.Empty:
-        logger.error(f"[{job.task.name}] timed out after {job.task.timeout_seconds} seconds.")
-        return data.JobResult.error(
-            job=job,
-            code=-1,
-            message=f"[{job.task.name}] timed out after {job.task.timeout_seconds} seconds.",
-            retries=retries,
-        )
-    except Exception as e:
-        logger.exception(e)
-        return data.JobResult.error(job=job, code=-1, message=str(e), retries=retries)
-    finally:
-        result_queue.close()
-
-
-def _run_job(
-    job: data.Job,
-    connection_str: str,
-    tool_dir: pathlib.Path,
-    result_queue: "mp.Queue[data.JobResult]",
-    retries: int,
-    /,
-) -> None:
-    if isinstance(job.task, data.CmdLineUtilityTask):
-        _run_cmd_line_utility_task(job=job, tool_dir=tool_dir, result_queue=result_queue, retries=retries)
-    elif isinstance(job.task, data.CondaProjectTask):
-        _run_conda_project_task(job=job, tool_dir=tool_dir, result_queue=result_queue, retries=retries)
-    elif isinstance(job.task, data.SQLTask):
-        _run_sql_task(job=job, connection_str=connection_str, result_queue=result_queue, retries=retries)
-    else:
-        raise Exception(f"Unrecognized job task, {job.task.__class__.__name__}.")  # todo create custom exception
-
-
-def _run_cmd_line_utility_task(
-    *,
-    job: data.Job,
-    tool_dir: pathlib.Path,
-    result_queue: "mp.Queue[data.JobResult]",
-    retries: int,
-) -> None:
-    assert isinstance(job.task, data.CmdLineUtilityTask)
-
-    result = data.JobResult.error(
-        job=job,
-        code=-1,
-        message=f"[{job.task.name}] never ran.",
-        retries=retries,
-    )
+    # the supervisor enforces the timeout, so this only waits for the job process to send its result or to exit
+    result_reader, result_writer = mp.Pipe(duplex=False)
     try:
-        if (fp := (tool_dir / job.task.tool)).exists():
-            tool_path = fp
-        elif (nested_fp := tool_dir / pathlib.Path(job.task.tool).with_suffix("").name / job.task.tool).exists():
-            tool_path = nested_fp
-        else:
-            raise Exception(
-                f"The tool specified, {job.task.tool!r}, was not found in the tools directory.  "
-                f"The following paths were checked: {fp.resolve()!s}, {nested_fp.resolve()!s}"
-            )
-
-        start = datetime.datetime.now()
-
-        executable_arg = str(tool_path.resolve())
-        if job.task.tool_args:
-            cmd = [executable_arg] + job.task.tool_args
-        else:
-            cmd = [executable_arg]
-
-        proc_result = subprocess.run(
-            cmd,
-            capture_output=True,
-            timeout=job.task.timeout_seconds,
-            cwd=tool_path.parent,
+        start = time.monotonic()
+        p = mp.Process(target=run_job, args=(job, connection_str, tool_dir, result_writer, retries))
+        with tracer.span("spawn", cat="job", job_id=job.job_id, task=job.task.name):
+            p.start()
+        result_writer.close()
+
+        deadline = supervisor.watch(
+            pid=typing.cast(int, p.pid),
+            name=job.task.name,
+            timeout_seconds=job.task.timeout_seconds,
         )
-
-        execution_millis = int((datetime.datetime.now() - start).total_seconds() * 1000)
-
-        if proc_result.returncode:
-            result = data.JobResult.error(
+        try:
+            mp.connection.wait([result_reader, p.sentinel])
+            result: data.JobResult | None = None
+            if result_reader.poll():
+                try:
+                    result = result_reader.recv()
+                except EOFError:
+                    pass
+            p.join()
+        finally:
+            supervisor.release(deadline)
+
+        if deadline.killed.is_set():
+            # a command line tool's job process outlives the tool to report what it used; otherwise only the wall
+            # time is known
+            logger.error(f"[{job.task.name}] timed out after {job.task.timeout_seconds} seconds.")
+            return data.JobResult.timeout(
                 job=job,
-                code=proc_result.returncode,
-                message=str(proc_result.stderr),
                 retries=retries,
+                resource_usage=(
+                    result.resource_usage
+                    if result is not None and result.resource_usage is not None
+                    else data.ResourceUsage(wall_millis=int((time.monotonic() - start) * 1000))
+                ),
             )
-        else:
-            result = data.JobResult.success(
+        if result is None:
+            return data.JobResult.error(
                 job=job,
-                execution_millis=execution_millis,
+                code=p.exitcode or -1,
+                message=f"[{job.task.name}] exited with code {p.exitcode} without reporting a result.",
                 retries=retries,
             )
-    except subprocess.TimeoutExpired:
-        result = data.JobResult.error(job=job, code=-1, message="Job timed out.", retries=retries)
-    except Exception as e:
-        result = data.JobResult.error(job=job, code=-1, message=str(e), retries=retries)
-    finally:
-        result_queue.put(result)
-
-
-def _run_sql_task(
-    *,
-    job: data.Job,
-    connection_str: str,
-    result_queue: "mp.Queue[data.JobResult]",
-    retries: int,
-) -> None:
-    assert isinstance(job.task, data.SQLTask)
-
-    result = data.JobResult.error(
-        job=job,
-        code=-1,
-        message=f"[{job.task.name}] never ran.",
-        retries=retries,
-    )
-    try:
-        start = datetime.datetime.now()
-
-        with psycopg2.connect(connection_str) as con:
-            with con.cursor() as cur:
-                cur.execute(typing.cast(str, job.task.sql))
-
-        result = data.JobResult.success(
-            job=job,
-            execution_millis=int((datetime.datetime.now() - start).total_seconds() * 1000),
-            retries=retries,
-        )
+        return result
     except Exception as e:
-        result = data.JobResult.error(
-            job=job,
-            code=-1,
-            message=str(e),
-            retries=retries,
-        )
+        logger.exception(e)
+        return data.JobResult.error(job=job, code=-1, message=str(e), retries=retries)
     finally:
-        result_queue.put(result)
+        result_writer.close()
+        result_reader.close()
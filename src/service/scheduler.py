@@ -7,11 +7,19 @@ import time
 import loguru
 
 from src import data
+from src.service.status import StatusBoard
+from src.service.trace import Tracer
 
 __all__ = ("Scheduler",)
 
 
 class Scheduler(threading.Thread):
+    """Keeps ppe.task_queue current, and in a second thread, cleans up old logs and updates task issues.
+
+    The queue is refreshed first, and the maintenance thread only starts once that is done, so after a restart on a big
+    history jobs are dispatched while old logs are still being deleted rather than after.
+    """
+
     def __init__(
         self,
         *,
@@ -19,15 +27,23 @@ class Scheduler(threading.Thread):
         seconds_between_updates: int,
         seconds_between_cleanups: int,
         seconds_between_task_issue_updates: int,
+        seconds_before_batch_abandoned: int,
+        status: StatusBoard,
         cancel: threading.Event,
+        tracer: Tracer | None = None,
     ):
-        super().__init__()
+        super().__init__(name="scheduler")
 
         self._db = db
         self._seconds_between_updates = seconds_between_updates
         self._seconds_between_cleanups = seconds_between_cleanups
         self._seconds_between_task_issue_updates = seconds_between_task_issue_updates
+        self._seconds_before_batch_abandoned = seconds_before_batch_abandoned
+        self._status = status
         self._cancel = cancel
+        self._tracer = tracer or Tracer()
+
+        self._maintenance = threading.Thread(target=self._maintain, name="scheduler-maintenance", daemon=True)
 
         self._e: Exception | None = None
 
@@ -36,6 +52,8 @@ class Scheduler(threading.Thread):
 
     def join(self, timeout: float | None = None) -> None:
         super().join()
+        if self._maintenance.ident is not None:
+            self._maintenance.join()
 
         loguru.logger.info("Scheduler stopped.")
 
@@ -45,31 +63,71 @@ class Scheduler(threading.Thread):
 
     def run(self) -> None:
         try:
-            self._db.delete_old_logs()
-            last_cleanup = datetime.datetime.now()
+            started = time.monotonic()
+            last_queue_update: datetime.datetime | None = None
 
-            self._db.update_task_issues()
-            last_task_issues_update = datetime.datetime.now()
+            while not self._cancel.is_set():
+                try:
+                    if _is_due(last_queue_update, seconds=self._seconds_between_updates):
+                        self._update_queue()
+                        if last_queue_update is None:
+                            loguru.logger.info(f"First queue update took {time.monotonic() - started:.1f} seconds.")
+                            self._maintenance.start()
+                        last_queue_update = datetime.datetime.now()
+                except data.DbUnavailableError as e:
+                    # the update is still due, so it runs once the database answers again
+                    loguru.logger.debug(f"Skipping queue update: {e!s}")
+                    self._cancel.wait(max(e.retry_after_seconds, 1))
+                    continue
 
-            self._db.update_queue()
-            last_queue_update = datetime.datetime.now()
+                time.sleep(1)
+        except Exception as e:
+            self._fail(e)
+
+    def _fail(self, e: Exception, /) -> None:
+        self._e = e
+        loguru.logger.exception(e)
+        self._db.log_batch_error(error_message=str(e))
+        self._cancel.set()
+
+    def _maintain(self) -> None:
+        try:
+            last_cleanup: datetime.datetime | None = None
+            last_task_issues_update: datetime.datetime | None = None
 
             while not self._cancel.is_set():
-                if (datetime.datetime.now() - last_cleanup).total_seconds() > self._seconds_between_cleanups:
-                    self._db.delete_old_logs()
-                    last_cleanup = datetime.datetime.now()
+                try:
+                    if _is_due(last_cleanup, seconds=self._seconds_between_cleanups):
+                        with self._tracer.span("cleanup", cat="scheduler"):
+                            if last_cleanup is not None:
+                                # picks up jobs of a batch that died after this one started
+                                self._db.cancel_abandoned_jobs(
+                                    reason="The batch running the job stopped responding.",
+                                    seconds_before_abandoned=self._seconds_before_batch_abandoned,
+                                )
+                            self._db.delete_old_logs()
+                        last_cleanup = datetime.datetime.now()
+
+                    if _is_due(last_task_issues_update, seconds=self._seconds_between_task_issue_updates):
+                        with self._tracer.span("update_task_issues", cat="scheduler"):
+                            self._db.update_task_issues()
+                        last_task_issues_update = datetime.datetime.now()
+                except data.DbUnavailableError as e:
+                    # whatever was skipped is still due, so it runs once the database answers again
+                    loguru.logger.debug(f"Skipping scheduled maintenance: {e!s}")
+                    self._cancel.wait(max(e.retry_after_seconds, 1))
+                    continue
+
+                self._cancel.wait(1)
+        except Exception as e:
+            self._fail(e)
 
-                if (datetime.datetime.now() - last_task_issues_update).total_seconds() > self._seconds_between_task_issue_updates:
-                    self._db.update_task_issues()
-                    last_task_issues_update = datetime.datetime.now()
+    def _update_queue(self) -> None:
+        with self._tracer.span("update_queue", cat="scheduler"):
+            self._db.heartbeat()
+            self._db.update_queue()
+            self._status.resources_updated(resources=self._db.get_resource_status())
 
-                if (datetime.datetime.now() - last_queue_update).total_seconds() > self._seconds_between_updates:
-                    self._db.update_queue()
-                    last_queue_update = datetime.datetime.now()
 
-                time.sleep(1)
-        except Exception as e:
-            self._e = e
-            loguru.logger.exception(e)
-            self._db.log_batch_error(error_message=str(e))
-            self._cancel.set()
+def _is_due(last: datetime.datetime | None, /, *, seconds: int) -> bool:
+    return last is None or (datetime.datetime.now() - last).total_seconds() > seconds
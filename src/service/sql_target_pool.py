@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import collections
+import threading
+import time
+import typing
+
+import psycopg2
+import psycopg2.extensions
+from loguru import logger
+
+from src import data
+
+__all__ = ("SqlTargetPool",)
+
+
+class SqlTargetPool:
+    """Runs SQLTask jobs that name a target on warm connections to that target, instead of connecting per run.
+
+    Each target gets its own pool the first time a job uses it, holding at most the target's max_connections.  Jobs
+    that find the pool full wait for a connection, and connections left idle for idle_seconds are closed.  The number
+    of jobs running against a target is also capped by the capacity of the ppe.resource with the target's name, see
+    ppe.task_resource_demand.
+
+    The job runs on the runner's thread, so its timeout is enforced by cancelling the statement on the server.
+    """
+
+    def __init__(self, *, targets: dict[str, data.SqlTarget], seconds_between_idle_checks: int = 10):
+        self._targets = targets
+        self._seconds_between_idle_checks = seconds_between_idle_checks
+
+        self._lock = threading.Lock()
+        self._pools: dict[str, _TargetPool] = {}
+        self._running: set[psycopg2.extensions.connection] = set()
+        self._closed = threading.Event()
+        self._reaper: threading.Thread | None = None
+
+    def cancel_all(self) -> None:
+        """Cancels every statement still running, for a shutdown that cannot wait for them any longer."""
+        with self._lock:
+            running = list(self._running)
+        for con in running:
+            try:
+                con.cancel()
+            except psycopg2.Error:
+                pass
+
+    def close(self) -> None:
+        self._closed.set()
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools.clear()
+
+    def run(self, *, job: data.Job, retries: int) -> data.JobResult:
+        task = job.task
+        assert isinstance(task, data.SQLTask) and task.target is not None
+
+        if (target := self._targets.get(task.target)) is None:
+            return data.JobResult.error(
+                job=job,
+                code=-1,
+                message=f"[{task.name}] refers to the SQL target {task.target!r}, which is not in the sql-targets config.",
+                retries=retries,
+            )
+
+        pool = self._pool(target)
+
+        start = time.monotonic()
+        con = pool.checkout(timeout_seconds=task.timeout_seconds)
+        if con is None:
+            logger.error(f"[{task.name}] timed out waiting for a connection to {task.target!r}.")
+            return data.JobResult.timeout(job=job, retries=retries)
+
+        timed_out = threading.Event()
+
+        def cancel() -> None:
+            timed_out.set()
+            con.cancel()
+
+        timer: threading.Timer | None = None
+        if task.timeout_seconds:
+            timer = threading.Timer(max(task.timeout_seconds - (time.monotonic() - start), 0), cancel)
+            timer.daemon = True
+            timer.start()
+
+        with self._lock:
+            self._running.add(con)
+
+        healthy = True
+        try:
+            with con.cursor() as cur:
+                cur.execute(task.sql)
+            con.commit()
+        except Exception as e:
+            healthy = _rollback(con)
+            if timed_out.is_set():
+                logger.error(f"[{task.name}] timed out after {task.timeout_seconds} seconds.")
+                return data.JobResult.timeout(
+                    job=job,
+                    retries=retries,
+                    resource_usage=data.ResourceUsage(wall_millis=int((time.monotonic() - start) * 1000)),
+                )
+            return data.JobResult.error(job=job, code=-1, message=str(e), retries=retries)
+        finally:
+            if timer is not None:
+                # a cancel already on its way must land before the connection goes to the next job
+                timer.cancel()
+                timer.join()
+            with self._lock:
+                self._running.discard(con)
+            pool.checkin(con=con, keep=healthy)
+
+        # the work happens on the target's server, so only the wall time is meaningful here
+        execution_millis = int((time.monotonic() - start) * 1000)
+        return data.JobResult.success(
+            job=job,
+            execution_millis=execution_millis,
+            retries=retries,
+            resource_usage=data.ResourceUsage(wall_millis=execution_millis),
+        )
+
+    def fetch_fingerprint(self, *, target: str, sql: str, timeout_seconds: int = 60) -> tuple[typing.Any, ...] | None:
+        """Runs a task's fingerprint query on the target and returns its first row."""
+        if (sql_target := self._targets.get(target)) is None:
+            raise Exception(f"The SQL target {target!r} is not in the sql-targets config.")
+
+        pool = self._pool(sql_target)
+        con = pool.checkout(timeout_seconds=timeout_seconds)
+        if con is None:
+            raise Exception(f"Timed out waiting for a connection to {target!r}.")
+
+        healthy = True
+        try:
+            with con.cursor() as cur:
+                cur.execute("SET TRANSACTION READ ONLY;")
+                cur.execute(sql)
+                row = cur.fetchone()
+            healthy = _rollback(con)
+            return row
+        except Exception:
+            healthy = _rollback(con)
+            raise
+        finally:
+            pool.checkin(con=con, keep=healthy)
+
+    def _close_idle_forever(self) -> None:
+        while not self._closed.wait(self._seconds_between_idle_checks):
+            with self._lock:
+                pools = list(self._pools.values())
+            for pool in pools:
+                pool.close_idle()
+
+    def _pool(self, target: data.SqlTarget, /) -> _TargetPool:
+        with self._lock:
+            if target.name not in self._pools:
+                self._pools[target.name] = _TargetPool(target=target)
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._close_idle_forever, name="sql-target-reaper", daemon=True)
+                self._reaper.start()
+            return self._pools[target.name]
+
+
+class _TargetPool:
+    def __init__(self, *, target: data.SqlTarget):
+        self._target = target
+
+        self._lock = threading.Lock()
+        # most recently used last, so the connections that have been idle longest are at the front
+        self._idle: collections.deque[tuple[psycopg2.extensions.connection, float]] = collections.deque()
+        self._slots = threading.BoundedSemaphore(target.max_connections)
+        self._closed = False
+
+    def checkin(self, *, con: psycopg2.extensions.connection, keep: bool) -> None:
+        # the next job starts from a clean session, without this job's temp tables, settings or prepared statements
+        keep = keep and _discard_all(con)
+        with self._lock:
+            returned = keep and not self._closed and not con.closed
+            if returned:
+                self._idle.append((con, time.monotonic()))
+
+        if not returned:
+            _close(con)
+
+        self._slots.release()
+
+    def checkout(self, *, timeout_seconds: int | None) -> psycopg2.extensions.connection | None:
+        if not self._slots.acquire(timeout=timeout_seconds or None):
+            return None
+
+        try:
+            with self._lock:
+                while self._idle:
+                    con, last_used = self._idle.pop()
+                    if not con.closed and time.monotonic() - last_used < self._target.idle_seconds:
+                        return con
+                    _close(con)
+
+            logger.debug(f"Opening a connection to SQL target {self._target.name!r}...")
+            return psycopg2.connect(
+                self._target.connection_str,
+                connect_timeout=self._target.connect_timeout_seconds,
+            )
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            while self._idle:
+                _close(self._idle.popleft()[0])
+
+    def close_idle(self) -> None:
+        cutoff = time.monotonic() - self._target.idle_seconds
+        with self._lock:
+            while self._idle and self._idle[0][1] < cutoff:
+                _close(self._idle.popleft()[0])
+
+
+def _close(con: psycopg2.extensions.connection, /) -> None:
+    try:
+        con.close()
+    except psycopg2.Error:
+        pass
+
+
+def _discard_all(con: psycopg2.extensions.connection, /) -> bool:
+    """Returns whether the session was reset, so the connection can be used again."""
+    if con.closed:
+        return False
+    try:
+        # DISCARD ALL cannot run inside a transaction block
+        con.autocommit = True
+        with con.cursor() as cur:
+            cur.execute("DISCARD ALL;")
+        con.autocommit = False
+    except psycopg2.Error:
+        return False
+    return True
+
+
+def _rollback(con: psycopg2.extensions.connection, /) -> bool:
+    """Returns whether the connection can be used again."""
+    try:
+        con.rollback()
+    except psycopg2.Error:
+        return False
+    return not con.closed and typing.cast(int, con.status) == psycopg2.extensions.STATUS_READY
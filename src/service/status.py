@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import collections
+import datetime
+import threading
+import time
+import typing
+
+from src import data
+
+__all__ = ("render", "StatusBoard")
+
+
+class StatusBoard:
+    """An in-memory picture of what ppe is doing: running jobs, the queue, resource reservations and recent results.
+
+    The dispatcher, runners and scheduler update it as they go, so status requests are answered without touching the
+    database, and never see ppe.task_queue or ppe.resource_status halfway through a rebuild.
+    """
+
+    def __init__(self, *, batch_id: int, max_jobs: int, max_recent_results: int = 100):
+        self._batch_id = batch_id
+        self._max_jobs = max_jobs
+
+        self._lock = threading.Lock()
+        self._running: dict[int, tuple[data.Job, datetime.datetime, float]] = {}
+        self._queue: list[data.QueuedTask] = []
+        self._queue_ts: datetime.datetime | None = None
+        self._resources: list[data.ResourceStatus] = []
+        self._resources_ts: datetime.datetime | None = None
+        self._recent_results: collections.deque[dict[str, typing.Any]] = collections.deque(maxlen=max_recent_results)
+
+    def job_finished(self, *, result: data.JobResult) -> None:
+        with self._lock:
+            self._running.pop(result.job.job_id, None)
+            self._recent_results.appendleft({
+                "job_id": result.job.job_id,
+                "task_id": result.job.task.task_id,
+                "task_name": result.job.task.name,
+                "status": result.status,
+                "timed_out": result.timed_out,
+                "execution_millis": result.execution_millis,
+                "retries": result.retries,
+                "error_message": (result.error_message or "")[:500] or None,
+                "finished_ts": _utc_now().isoformat(),
+            })
+
+    def job_started(self, *, job: data.Job) -> None:
+        with self._lock:
+            self._running[job.job_id] = (job, _utc_now(), time.monotonic())
+
+    def queue_updated(self, *, queued_tasks: list[data.QueuedTask]) -> None:
+        with self._lock:
+            self._queue = list(queued_tasks)
+            self._queue_ts = _utc_now()
+
+    def resources_updated(self, *, resources: list[data.ResourceStatus]) -> None:
+        with self._lock:
+            self._resources = list(resources)
+            self._resources_ts = _utc_now()
+
+    def snapshot(self) -> dict[str, typing.Any]:
+        """A JSON-ready copy of the current state."""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "batch_id": self._batch_id,
+                "generated_ts": _utc_now().isoformat(),
+                "max_jobs": self._max_jobs,
+                "running": [
+                    {
+                        "job_id": job.job_id,
+                        "task_id": job.task.task_id,
+                        "task_name": job.task.name,
+                        "started_ts": started_ts.isoformat(),
+                        "elapsed_seconds": round(now - started, 1),
+                        "timeout_seconds": job.task.timeout_seconds,
+                    }
+                    for job, started_ts, started in sorted(self._running.values(), key=lambda r: r[2])
+                ],
+                "queue_ts": _isoformat(self._queue_ts),
+                "queue": [
+                    {
+                        "task_id": t.task_id,
+                        "task_name": t.name,
+                        "ready_ts": _isoformat(t.ready_ts),
+                        "expected_millis": t.expected_millis,
+                        "p95_millis": t.p95_millis,
+                        "window_end_ts": _isoformat(t.window_end_ts),
+                    }
+                    for t in self._queue
+                ],
+                "resources_ts": _isoformat(self._resources_ts),
+                "resources": [
+                    {
+                        "resource_id": r.resource_id,
+                        "name": r.name,
+                        "capacity": r.capacity,
+                        "reserved": r.reserved,
+                        "available": r.available,
+                    }
+                    for r in self._resources
+                ],
+                "recent_results": list(self._recent_results),
+            }
+
+
+def render(snapshot: dict[str, typing.Any], /, *, max_rows: int = 20) -> str:
+    """Formats a snapshot for the terminal."""
+    lines = [
+        f"batch {snapshot['batch_id']} as of {snapshot['generated_ts']}",
+        "",
+        f"running ({len(snapshot['running'])}/{snapshot['max_jobs']}):",
+    ]
+    lines += [
+        f"  {r['task_name']:<40} job {r['job_id']:<8} {r['elapsed_seconds']:>8.0f}s / {r['timeout_seconds'] or '-'}s"
+        for r in snapshot["running"][:max_rows]
+    ]
+
+    lines += ["", f"queue ({len(snapshot['queue'])}, as of {snapshot['queue_ts'] or 'never'}):"]
+    lines += [
+        f"  {t['task_name']:<40} expected {_seconds(t['expected_millis'])}"
+        for t in snapshot["queue"][:max_rows]
+    ]
+
+    lines += ["", f"resources (as of {snapshot['resources_ts'] or 'never'}):"]
+    lines += [
+        f"  {r['name']:<40} {r['reserved']:>4} of {r['capacity']:<4} reserved"
+        for r in snapshot["resources"]
+    ]
+
+    lines += ["", "recent results:"]
+    lines += [
+        f"  {r['task_name']:<40} {'timeout' if r['timed_out'] else r['status']:<8} {_seconds(r['execution_millis'])}"
+        f"  {r['finished_ts']}"
+        for r in snapshot["recent_results"][:max_rows]
+    ]
+    return "\n".join(lines)
+
+
+def _isoformat(ts: datetime.datetime | None, /) -> str | None:
+    return None if ts is None else ts.isoformat()
+
+
+def _seconds(millis: int | None, /) -> str:
+    return "-" if millis is None else f"{millis / 1000:.0f}s"
+
+
+def _utc_now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import dataclasses
+import heapq
+import itertools
+import multiprocessing as mp
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from loguru import logger
+
+from src.service.job_process import new_process_group
+
+__all__ = ("Deadline", "new_process_group", "popen_process_group_kwargs", "Supervisor")
+
+
+@dataclasses.dataclass(eq=False, kw_only=True)
+class Deadline:
+    pid: int
+    name: str
+    timeout_seconds: int
+    expires: float
+    released: bool = False
+    killed: threading.Event = dataclasses.field(default_factory=threading.Event)
+    # held while the job is signalled, so a release waits for a kill in progress and is never followed by one
+    lock: threading.Lock = dataclasses.field(default_factory=threading.Lock)
+
+
+class Supervisor(threading.Thread):
+    """Kills the process tree of every job that outlives its timeout.
+
+    Jobs register the pid of a process that leads its own process group (see new_process_group).  A single thread keeps
+    their deadlines in a heap, so runner threads can wait on their job without a timeout of their own.  An expired job
+    gets a polite signal first and is force-killed grace_seconds later.
+    """
+
+    def __init__(self, *, grace_seconds: int = 10):
+        super().__init__(name="supervisor", daemon=True)
+
+        self._grace_seconds = grace_seconds
+
+        self._changed = threading.Condition()
+        self._heap: list[tuple[float, int, bool, Deadline]] = []
+        self._active: set[Deadline] = set()
+        self._seq = itertools.count()
+        self._stopped = False
+
+    def release(self, deadline: Deadline, /) -> None:
+        """The job's process has exited and been reaped.  Its pid is never signalled after this, since it may already
+        belong to another process, and once this returns deadline.killed says for certain whether the job was killed.
+        """
+        with deadline.lock:
+            deadline.released = True
+        with self._changed:
+            self._active.discard(deadline)
+
+    def kill_all(self) -> None:
+        """Force-kills every job that is still running, for a shutdown that cannot wait for them any longer."""
+        with self._changed:
+            deadlines = list(self._active)
+
+        for deadline in deadlines:
+            with deadline.lock:
+                if deadline.released:
+                    continue
+                logger.warning(f"[{deadline.name}] is still running at shutdown, killing process {deadline.pid}...")
+                if _signal_tree(deadline.pid, force=True):
+                    deadline.killed.set()
+
+    def run(self) -> None:
+        while True:
+            with self._changed:
+                if self._stopped:
+                    return
+
+                now = time.monotonic()
+                expired: list[tuple[bool, Deadline]] = []
+                while self._heap and self._heap[0][0] <= now:
+                    _, _, force, deadline = heapq.heappop(self._heap)
+                    if not deadline.released:
+                        expired.append((force, deadline))
+
+            for force, deadline in expired:
+                with deadline.lock:
+                    if deadline.released:
+                        continue
+
+                    if force:
+                        _signal_tree(deadline.pid, force=True)
+                        continue
+
+                    logger.warning(
+                        f"[{deadline.name}] exceeded its timeout of {deadline.timeout_seconds} seconds, "
+                        f"killing process {deadline.pid} and its children..."
+                    )
+                    # a job that exited right at its deadline was not killed, and has nothing left to force
+                    if _signal_tree(deadline.pid, force=False):
+                        deadline.killed.set()
+                        with self._changed:
+                            heapq.heappush(self._heap, (now + self._grace_seconds, next(self._seq), True, deadline))
+
+            # reap any job processes that have exited
+            mp.active_children()
+
+            with self._changed:
+                if not self._stopped:
+                    wait_seconds = min(self._heap[0][0] - time.monotonic(), 1.0) if self._heap else 1.0
+                    self._changed.wait(timeout=max(wait_seconds, 0))
+
+    def stop(self) -> None:
+        with self._changed:
+            self._stopped = True
+            self._changed.notify()
+
+    def watch(self, *, pid: int, name: str, timeout_seconds: int | None) -> Deadline:
+        deadline = Deadline(
+            pid=pid,
+            name=name,
+            timeout_seconds=timeout_seconds or 0,
+            expires=time.monotonic() + timeout_seconds if timeout_seconds else float("inf"),
+        )
+        with self._changed:
+            self._active.add(deadline)
+            if timeout_seconds:
+                heapq.heappush(self._heap, (deadline.expires, next(self._seq), False, deadline))
+                self._changed.notify()
+        return deadline
+
+
+def popen_process_group_kwargs() -> dict[str, object]:
+    if sys.platform == "win32":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def _signal_tree(pid: int, /, *, force: bool) -> bool:
+    """Whether the signal reached a process that was still running."""
+    if sys.platform == "win32":
+        proc = subprocess.run(
+            ["taskkill", "/PID", str(pid), "/T"] + (["/F"] if force else []),
+            capture_output=True,
+        )
+        return proc.returncode == 0
+
+    sig = signal.SIGKILL if force else signal.SIGTERM
+    try:
+        os.killpg(pid, sig)
+        return True
+    except ProcessLookupError:
+        # the process may not have made itself a group leader yet
+        try:
+            os.kill(pid, sig)
+            return True
+        except ProcessLookupError:
+            return False
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import collections
+import contextlib
+import itertools
+import json
+import os
+import pathlib
+import threading
+import time
+import typing
+
+from loguru import logger
+
+__all__ = ("Tracer",)
+
+
+_NO_SPAN: typing.ContextManager[None] = contextlib.nullcontext()
+
+
+class Tracer:
+    """Records what each thread spent its time on, as Chrome trace events that chrome://tracing and
+    https://ui.perfetto.dev can open.
+
+    The runners, dispatcher and scheduler wrap their claims, job processes, retries, result writes, queue updates and
+    cleanups in spans, tagged with the job_id and task where there is one, so the timeline shows the gaps between jobs,
+    waits on the claim lock and pauses while the queue is rebuilt.  When the tracer is not enabled, span() hands back a
+    shared no-op context manager and nothing is recorded.
+
+    Each export() writes the events recorded since the one before to a file of its own, and start() exports every
+    seconds_between_exports, so a long-running batch leaves a trace as it goes rather than only when it stops.  At most
+    max_events are held between exports; the oldest are dropped and counted.
+    """
+
+    def __init__(self, *, enabled: bool = False, max_events: int = 100_000):
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._events: collections.deque[dict[str, typing.Any]] = collections.deque(maxlen=max_events)
+        self._recorded = 0
+        self._parts = 0
+        # idents and native ids are reused once a thread exits, so each thread gets a tid of its own
+        self._tids = itertools.count(1)
+        self._local = threading.local()
+        self._thread_names: dict[int, str] = {}
+        self._pid = os.getpid()
+        self._start = time.perf_counter()
+
+        self._closed = threading.Event()
+        self._exporter: threading.Thread | None = None
+        self._last_path: pathlib.Path | None = None
+
+    def close(self) -> pathlib.Path | None:
+        """Stops the exports started by start() and exports what is left, returning the file written, if any."""
+        if self._exporter is None:
+            return None
+
+        self._closed.set()
+        self._exporter.join()
+        return self._last_path
+
+    def export(self, *, folder: pathlib.Path, batch_id: int, days_to_keep: int) -> pathlib.Path:
+        """Writes the events recorded since the last export to <folder>/trace-<batch_id>-<part>.json, and removes
+        traces older than days_to_keep."""
+        with self._lock:
+            events = list(self._events)
+            dropped = self._recorded - len(events)
+            thread_names = dict(self._thread_names)
+            self._events.clear()
+            self._recorded = 0
+            # threads that record again in the next part name themselves again
+            self._thread_names.clear()
+            self._parts += 1
+            part = self._parts
+
+        metadata = [
+            {"name": "process_name", "ph": "M", "pid": self._pid, "tid": 0, "args": {"name": f"ppe batch {batch_id}"}},
+            *(
+                {"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": name}}
+                for tid, name in thread_names.items()
+            ),
+        ]
+
+        path = folder / f"trace-{batch_id}-{part}.json"
+        with path.open("w", encoding="utf-8") as fh:
+            json.dump(
+                {
+                    "traceEvents": metadata + events,
+                    "displayTimeUnit": "ms",
+                    "otherData": {"batch_id": batch_id, "part": part, "dropped_events": dropped},
+                },
+                fh,
+                default=str,
+            )
+
+        cutoff = time.time() - days_to_keep * 24 * 60 * 60
+        for fp in folder.glob("trace-*.json"):
+            try:
+                if fp != path and fp.stat().st_mtime < cutoff:
+                    fp.unlink()
+            except OSError:
+                pass
+
+        return path
+
+    def instant(self, name: str, /, *, cat: str, **args: typing.Any) -> None:
+        """Marks a point in time, like a retry, on the current thread's timeline."""
+        if self.enabled:
+            self._add({"name": name, "cat": cat, "ph": "i", "s": "t", "ts": self._micros(time.perf_counter())}, args)
+
+    def span(self, name: str, /, *, cat: str, **args: typing.Any) -> typing.ContextManager[None]:
+        if not self.enabled:
+            return _NO_SPAN
+        return self._span(name, cat, args)
+
+    def start(self, *, folder: pathlib.Path, batch_id: int, days_to_keep: int, seconds_between_exports: float) -> None:
+        """Exports every seconds_between_exports until close()."""
+
+        def export_forever() -> None:
+            while True:
+                closed = self._closed.wait(seconds_between_exports)
+                try:
+                    self._last_path = self.export(folder=folder, batch_id=batch_id, days_to_keep=days_to_keep)
+                except OSError as e:
+                    logger.error(f"Unable to write the trace for batch {batch_id}: {e!s}")
+                if closed:
+                    return
+
+        self._exporter = threading.Thread(target=export_forever, name="trace-exporter", daemon=True)
+        self._exporter.start()
+
+    def _add(self, event: dict[str, typing.Any], args: dict[str, typing.Any], /) -> None:
+        if (tid := getattr(self._local, "tid", None)) is None:
+            tid = self._local.tid = next(self._tids)
+        event["pid"] = self._pid
+        event["tid"] = tid
+        if args:
+            event["args"] = args
+
+        with self._lock:
+            self._events.append(event)
+            self._recorded += 1
+            if tid not in self._thread_names:
+                self._thread_names[tid] = threading.current_thread().name
+
+    def _micros(self, perf_counter: float, /) -> float:
+        return round((perf_counter - self._start) * 1_000_000, 1)
+
+    @contextlib.contextmanager
+    def _span(self, name: str, cat: str, args: dict[str, typing.Any], /) -> typing.Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self._add(
+                {
+                    "name": name,
+                    "cat": cat,
+                    "ph": "X",
+                    "ts": self._micros(start),
+                    "dur": round((end - start) * 1_000_000, 1),
+                },
+                args,
+            )
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import sys
+import time
+import typing
+
+from src import data
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore[assignment]
+
+__all__ = ("Meter",)
+
+
+class Meter:
+    """Measures what the current process, and the children it has waited on, use from the time the meter is created.
+
+    Timing uses the monotonic clock, so it is not thrown off by changes to the system clock.  With children_only, the
+    current process is left out, which suits a job process that only waits on a tool; it also keeps the RSS a forked
+    process inherits from ppe out of the peak.
+    """
+
+    def __init__(self, *, children_only: bool = False) -> None:
+        self._children_only = children_only
+        self._start = time.monotonic()
+        self._self_start = _rusage("self")
+        self._children_start = _rusage("children")
+
+    def elapsed_millis(self) -> int:
+        return int((time.monotonic() - self._start) * 1000)
+
+    def usage(self) -> data.ResourceUsage:
+        wall_millis = self.elapsed_millis()
+
+        self_end = _rusage("self")
+        children_end = _rusage("children")
+        if self_end is None or children_end is None or self._self_start is None or self._children_start is None:
+            return data.ResourceUsage(wall_millis=wall_millis)
+
+        def delta(field: str, /) -> typing.Any:
+            children = getattr(children_end, field) - getattr(self._children_start, field)
+            if self._children_only:
+                return children
+            return children + getattr(self_end, field) - getattr(self._self_start, field)
+
+        peak_rss_kb = _kb(children_end.ru_maxrss)
+        if not self._children_only:
+            peak_rss_kb = max(peak_rss_kb, _kb(self_end.ru_maxrss))
+
+        return data.ResourceUsage(
+            wall_millis=wall_millis,
+            user_cpu_millis=int(delta("ru_utime") * 1000),
+            system_cpu_millis=int(delta("ru_stime") * 1000),
+            # a high-water mark, so the peak of the largest process in the tree rather than a delta
+            peak_rss_kb=peak_rss_kb,
+            block_reads=delta("ru_inblock"),
+            block_writes=delta("ru_oublock"),
+            voluntary_context_switches=delta("ru_nvcsw"),
+            involuntary_context_switches=delta("ru_nivcsw"),
+        )
+
+
+def _kb(maxrss: int, /) -> int:
+    # macOS reports ru_maxrss in bytes, Linux in kilobytes
+    if sys.platform == "darwin":
+        return maxrss // 1024
+    return maxrss
+
+
+def _rusage(who: typing.Literal["self", "children"], /) -> typing.Any:
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN)
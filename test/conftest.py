@@ -3,7 +3,8 @@ import pathlib
 import typing
 
 import pytest
-from psycopg2.pool import ThreadedConnectionPool
+
+from src import adapter
 
 
 @pytest.fixture(scope="function")
@@ -23,8 +24,8 @@ def connection_str_fixture(_config_fixture: dict[str, typing.Hashable]) -> str:
 
 
 @pytest.fixture(scope="function")
-def pool_fixture(_root_dir_fixture: pathlib.Path, connection_str_fixture: str) -> ThreadedConnectionPool:
-    pool = ThreadedConnectionPool(1, 5, dsn=connection_str_fixture)
+def pool_fixture(_root_dir_fixture: pathlib.Path, connection_str_fixture: str) -> adapter.db.SessionPool:
+    pool = adapter.db.SessionPool(1, 5, dsn=connection_str_fixture, name="test")
     with pool.getconn() as con:
         with con.cursor() as cur:
             cur.execute("DROP SCHEMA IF EXISTS ppe CASCADE;")
@@ -0,0 +1,116 @@
+import json
+import pathlib
+
+import psycopg2
+import pytest
+
+from src import adapter
+
+
+def _manifest() -> dict[str, object]:
+    return {
+        "resources": [{"resource_name": "db", "capacity": 3}],
+        "schedules": [
+            {"schedule_name": "every minute", "min_seconds_between_attempts": 60},
+            {"schedule_name": "nightly", "min_seconds_between_attempts": 3600, "start_hour": 1, "end_hour": 4},
+        ],
+        "tasks": [
+            {
+                "task_name": f"task {i}",
+                "tool": "tool.exe",
+                "tool_args": ["--id", str(i)],
+                "retries": 1,
+                "timeout_seconds": 60,
+                "schedules": ["every minute", "nightly"] if i % 2 else ["nightly"],
+                "resources": {"db": 1 + i % 3},
+            }
+            for i in range(50)
+        ],
+    }
+
+
+def _counts(summary: list[adapter.catalog.CatalogImportSummary]) -> dict[str, tuple[int, int, int]]:
+    return {s.entity: (s.inserted, s.updated, s.disabled) for s in summary}
+
+
+def test_catalog_import_is_idempotent_and_round_trips(
+    tmp_path: pathlib.Path,
+    pool_fixture: adapter.db.SessionPool,
+    connection_str_fixture: str,
+):
+    manifest_path = tmp_path / "catalog.json"
+    manifest_path.write_text(json.dumps(_manifest()))
+
+    summary = adapter.catalog.import_catalog(connection_str=connection_str_fixture, path=manifest_path, prune=False)
+    assert _counts(summary) == {
+        "resource": (1, 0, 0),
+        "schedule": (2, 0, 0),
+        "task": (50, 0, 0),
+        "task_schedule": (75, 0, 0),
+        "task_resource": (50, 0, 0),
+    }
+
+    summary = adapter.catalog.import_catalog(connection_str=connection_str_fixture, path=manifest_path, prune=False)
+    assert all(counts == (0, 0, 0) for counts in _counts(summary).values()), _counts(summary)
+
+    for export_path in (tmp_path / "export.json", tmp_path / "export"):
+        adapter.catalog.export_catalog(connection_str=connection_str_fixture, path=export_path)
+        summary = adapter.catalog.import_catalog(connection_str=connection_str_fixture, path=export_path, prune=True)
+        assert all(counts == (0, 0, 0) for counts in _counts(summary).values()), (export_path, _counts(summary))
+
+    exported = json.loads((tmp_path / "export.json").read_text())
+    task_3 = next(t for t in exported["tasks"] if t["task_name"] == "task 3")
+    assert task_3["tool_args"] == ["--id", "3"]
+    assert task_3["schedules"] == ["every minute", "nightly"]
+    assert task_3["resources"] == {"db": 1}
+
+
+def test_catalog_import_rejects_invalid_manifest(
+    tmp_path: pathlib.Path,
+    pool_fixture: adapter.db.SessionPool,
+    connection_str_fixture: str,
+):
+    manifest = _manifest()
+    manifest["tasks"][0]["schedules"] = ["hourly"]  # type: ignore[index]
+    manifest["tasks"][1]["resources"] = {"db": 4}  # type: ignore[index]
+    manifest_path = tmp_path / "catalog.json"
+    manifest_path.write_text(json.dumps(manifest))
+
+    with pytest.raises(psycopg2.Error) as e:
+        adapter.catalog.import_catalog(connection_str=connection_str_fixture, path=manifest_path, prune=False)
+    assert "unknown schedule 'hourly'" in str(e.value)
+
+    del manifest["tasks"][0]["schedules"]  # type: ignore[index]
+    manifest_path.write_text(json.dumps(manifest))
+    with pytest.raises(psycopg2.Error) as e:
+        adapter.catalog.import_catalog(connection_str=connection_str_fixture, path=manifest_path, prune=False)
+    assert "needs 4 units of resource 'db', which only has 3" in str(e.value)
+
+    with pool_fixture.getconn() as con:
+        with con.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM ppe.task;")
+            assert cur.fetchone() == (0,), "Expected the failed import to leave the catalog untouched."
+        pool_fixture.putconn(con)
+
+
+def test_load_schedule_plan(
+    tmp_path: pathlib.Path,
+    pool_fixture: adapter.db.SessionPool,
+    connection_str_fixture: str,
+):
+    manifest_path = tmp_path / "catalog.json"
+    manifest_path.write_text(json.dumps(_manifest()))
+    adapter.catalog.import_catalog(connection_str=connection_str_fixture, path=manifest_path, prune=False)
+
+    plan = adapter.catalog.load_schedule_plan(connection_str=connection_str_fixture)
+    assert [(r.name, r.capacity) for r in plan.resources] == [("db", 3)]
+    assert {s.name: s.min_seconds_between_attempts for s in plan.schedules} == {"every minute": 60, "nightly": 3600}
+    assert len(plan.tasks) == 50
+
+    resource_id = plan.resources[0].resource_id
+    schedule_ids = {s.name: s.schedule_id for s in plan.schedules}
+    task_3 = next(t for t in plan.tasks if t.name == "task 3")
+    assert sorted(task_3.schedule_ids) == sorted([schedule_ids["every minute"], schedule_ids["nightly"]])
+    assert task_3.resource_units == ((resource_id, 1),)
+    assert task_3.expected_millis is None
+    assert task_3.latest_attempt_ts is None
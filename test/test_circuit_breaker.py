@@ -0,0 +1,75 @@
+import time
+
+import psycopg2
+import psycopg2.pool
+import pytest
+
+from src import data
+from src.adapter import circuit_breaker
+
+
+def _fail(breaker: circuit_breaker.CircuitBreaker) -> None:
+    with pytest.raises(data.DbUnavailableError):
+        with breaker.call():
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+
+def test_circuit_opens_after_repeated_failures_and_fails_fast():
+    breaker = circuit_breaker.CircuitBreaker(failure_threshold=2, base_seconds=60)
+    _fail(breaker)
+    assert not breaker.is_open
+    _fail(breaker)
+    assert breaker.is_open
+
+    with pytest.raises(data.DbUnavailableError) as e:
+        with breaker.call():
+            pytest.fail("An open circuit should not let calls through.")
+    assert 30 <= e.value.retry_after_seconds <= 60
+
+
+def test_a_single_probe_closes_the_circuit():
+    breaker = circuit_breaker.CircuitBreaker(failure_threshold=1, base_seconds=0.05)
+    _fail(breaker)
+    time.sleep(0.1)
+
+    with breaker.call():
+        # only the probe gets through while it is in flight
+        with pytest.raises(data.DbUnavailableError):
+            with breaker.call():
+                pass
+    assert not breaker.is_open
+
+    # errors from the server itself show that the database is up
+    with pytest.raises(psycopg2.errors.DivisionByZero):
+        with breaker.call():
+            raise psycopg2.errors.DivisionByZero()
+    assert not breaker.is_open
+
+
+class _QueryCanceled(psycopg2.OperationalError):
+    pgcode = "57014"
+
+
+class _AdminShutdown(psycopg2.OperationalError):
+    pgcode = "57P01"
+
+
+def test_only_connection_errors_count_as_failures():
+    breaker = circuit_breaker.CircuitBreaker(failure_threshold=2, base_seconds=60)
+
+    # a cancelled statement is an answer from the server
+    for _ in range(3):
+        with pytest.raises(_QueryCanceled):
+            with breaker.call():
+                raise _QueryCanceled("canceling statement due to statement timeout")
+    assert not breaker.is_open
+
+    _fail(breaker)
+    # waiting for a pooled connection neither counts nor resets the count
+    with pytest.raises(psycopg2.pool.PoolError):
+        with breaker.call():
+            raise psycopg2.pool.PoolError("all connections were in use")
+    with pytest.raises(data.DbUnavailableError):
+        with breaker.call():
+            raise _AdminShutdown("terminating connection due to administrator command")
+    assert breaker.is_open
@@ -1,9 +1,14 @@
-from psycopg2.pool import ThreadedConnectionPool
+import datetime
+import threading
 
-from src import adapter
+import psycopg2
+import psycopg2.pool
+import pytest
 
+from src import adapter, data
 
-def test_cancel_running_jobs(pool_fixture: ThreadedConnectionPool):
+
+def test_cancel_running_jobs(pool_fixture: adapter.db.SessionPool):
     with pool_fixture.getconn() as con:
         with con.cursor() as cur:
             cur.execute("""
@@ -16,7 +21,7 @@ def test_cancel_running_jobs(pool_fixture: ThreadedConnectionPool):
             ppe_jobs = cur.fetchone()[0]
             assert ppe_jobs == 2, f"Expected 2 jobs in ppe.job, but there were {ppe_jobs}."
 
-    db = adapter.db.open_db(batch_id=1, pool=pool_fixture, days_logs_to_keep=3)
+    db = adapter.db.open_db(batch_id=1, pools=adapter.db.Pools.shared(pool_fixture), days_logs_to_keep=3)
     db.cancel_running_jobs(reason="Testing")
     with pool_fixture.getconn() as con:
         with con.cursor() as cur:
@@ -25,7 +30,30 @@ def test_cancel_running_jobs(pool_fixture: ThreadedConnectionPool):
             assert cancelled_jobs == 2, f"Expected 2 job in ppe.job_cancel after cancel_running_jobs, but there were {cancelled_jobs}."
 
 
-def test_get_ready_job(pool_fixture: ThreadedConnectionPool):
+def test_cancel_abandoned_jobs_spares_live_batches(pool_fixture: adapter.db.SessionPool):
+    with pool_fixture.getconn() as con:
+        with con.cursor() as cur:
+            cur.execute("""
+                INSERT INTO ppe.batch (batch_id, heartbeat_ts) OVERRIDING SYSTEM VALUE VALUES (1, now());
+                INSERT INTO ppe.batch (batch_id, heartbeat_ts) OVERRIDING SYSTEM VALUE VALUES (2, now() - INTERVAL '1 hour');
+                INSERT INTO ppe.batch (batch_id, heartbeat_ts, end_ts) OVERRIDING SYSTEM VALUE VALUES (3, now(), now());
+                INSERT INTO ppe.batch (batch_id) OVERRIDING SYSTEM VALUE VALUES (4);
+                INSERT INTO ppe.task (task_id, task_name, task_sql, retries, timeout_seconds) OVERRIDING SYSTEM VALUE VALUES (1, 'test_task', 'SELECT 1', 1, 60);
+                INSERT INTO ppe.job (job_id, batch_id, task_id) OVERRIDING SYSTEM VALUE VALUES (1, 1, 1);
+                INSERT INTO ppe.job (job_id, batch_id, task_id) OVERRIDING SYSTEM VALUE VALUES (2, 2, 1);
+                INSERT INTO ppe.job (job_id, batch_id, task_id) OVERRIDING SYSTEM VALUE VALUES (3, 3, 1);
+            """)
+
+    db = adapter.db.open_db(batch_id=4, pools=adapter.db.Pools.shared(pool_fixture), days_logs_to_keep=3)
+    db.cancel_abandoned_jobs(reason="Testing", seconds_before_abandoned=300)
+    with pool_fixture.getconn() as con:
+        with con.cursor() as cur:
+            cur.execute("SELECT job_id FROM ppe.job_cancel ORDER BY job_id;")
+            cancelled_job_ids = [row[0] for row in cur.fetchall()]
+            assert cancelled_job_ids == [2, 3], f"Expected only the jobs of stale or ended batches to be cancelled, but got {cancelled_job_ids}."
+
+
+def test_get_ready_job(pool_fixture: adapter.db.SessionPool):
     with pool_fixture.getconn() as con:
         with con.cursor() as cur:
             cur.execute("""
@@ -38,12 +66,12 @@ def test_get_ready_job(pool_fixture: ThreadedConnectionPool):
             queued_tasks = cur.fetchone()[0]
             assert queued_tasks == 1, f"Expected 2 tasks in ppe.task_queue, but there were {queued_tasks}."
 
-    db = adapter.db.open_db(batch_id=1, pool=pool_fixture, days_logs_to_keep=3)
+    db = adapter.db.open_db(batch_id=1, pools=adapter.db.Pools.shared(pool_fixture), days_logs_to_keep=3)
     ready_job = db.get_ready_job()
     assert ready_job.task.name == "test_task"
 
 
-def test_update_queue(pool_fixture: ThreadedConnectionPool):
+def test_update_queue(pool_fixture: adapter.db.SessionPool):
     with pool_fixture.getconn() as con:
         with con.cursor() as cur:
             cur.execute("""
@@ -58,10 +86,343 @@ def test_update_queue(pool_fixture: ThreadedConnectionPool):
             tasks = cur.fetchone()[0]
             assert tasks == 1, f"Expected 1 task in ppe.task, but there were {tasks}."
 
-    db = adapter.db.open_db(batch_id=1, pool=pool_fixture, days_logs_to_keep=3)
+    db = adapter.db.open_db(batch_id=1, pools=adapter.db.Pools.shared(pool_fixture), days_logs_to_keep=3)
     db.update_queue()
     with pool_fixture.getconn() as con:
         with con.cursor() as cur:
             cur.execute("SELECT COUNT(*) FROM ppe.task_queue;")
             queued_tasks = cur.fetchone()[0]
             assert queued_tasks == 1, f"Expected 1 job in ppe.task_queue, but there were {queued_tasks}."
+
+
+def test_sql_target_counts_against_resource_of_the_same_name(pool_fixture: adapter.db.SessionPool):
+    with pool_fixture.getconn() as con:
+        with con.cursor() as cur:
+            cur.execute("""
+                INSERT INTO ppe.batch (batch_id) OVERRIDING SYSTEM VALUE VALUES (1);
+                INSERT INTO ppe.task (task_id, task_name, task_sql, sql_target, retries, timeout_seconds) OVERRIDING SYSTEM VALUE VALUES (1, 'load_a', 'SELECT 1', 'warehouse', 0, 600);
+                INSERT INTO ppe.task (task_id, task_name, task_sql, sql_target, retries, timeout_seconds) OVERRIDING SYSTEM VALUE VALUES (2, 'load_b', 'SELECT 1', 'warehouse', 0, 600);
+                INSERT INTO ppe.resource (resource_id, resource_name, capacity) OVERRIDING SYSTEM VALUE VALUES (1, 'warehouse', 1);
+                INSERT INTO ppe.schedule (schedule_id, schedule_name, min_seconds_between_attempts) OVERRIDING SYSTEM VALUE VALUES (1, 'every 10 seconds', 10);
+                INSERT INTO ppe.task_schedule (task_id, schedule_id) VALUES (1, 1), (2, 1);
+                INSERT INTO ppe.job (job_id, batch_id, task_id) OVERRIDING SYSTEM VALUE VALUES (1, 1, 1);
+            """)
+        con.commit()
+        pool_fixture.putconn(con)
+
+    db = adapter.db.open_db(batch_id=1, pools=adapter.db.Pools.shared(pool_fixture), days_logs_to_keep=3)
+    db.update_queue()
+
+    [warehouse] = db.get_resource_status()
+    assert (warehouse.reserved, warehouse.available) == (1, 0)
+    assert db.get_queued_tasks() == [], "load_b should wait for the warehouse connection load_a holds."
+
+
+def test_task_stats_flag_repeated_timeouts(pool_fixture: adapter.db.SessionPool):
+    with pool_fixture.getconn() as con:
+        with con.cursor() as cur:
+            cur.execute("""
+                INSERT INTO ppe.batch (batch_id) OVERRIDING SYSTEM VALUE VALUES (1);
+                INSERT INTO ppe.task (task_id, task_name, task_sql, retries, timeout_seconds) OVERRIDING SYSTEM VALUE VALUES (1, 'test_task', 'SELECT 1', 1, 60);
+                INSERT INTO ppe.job (job_id, batch_id, task_id) OVERRIDING SYSTEM VALUE VALUES (1, 1, 1), (2, 1, 1), (3, 1, 1), (4, 1, 1);
+            """)
+
+    db = adapter.db.open_db(batch_id=1, pools=adapter.db.Pools.shared(pool_fixture), days_logs_to_keep=3)
+    db.log_job_success(job_id=1, execution_millis=1000)
+    for job_id in (2, 3, 4):
+        db.log_job_error(job_id=job_id, return_code=-1, error_message="Job timed out.", timed_out=True)
+
+    with pool_fixture.getconn() as con:
+        with con.cursor() as cur:
+            cur.execute("SELECT runs, successes, timeouts, consecutive_timeouts, consecutive_failures, p50_millis FROM ppe.task_stats WHERE task_id = 1;")
+            assert cur.fetchone() == (4, 1, 3, 3, 0, 1000)
+            cur.execute("SELECT task_issue_type_id FROM ppe.task_issue WHERE task_id = 1 ORDER BY task_issue_type_id;")
+            issues = [row[0] for row in cur.fetchall()]
+            assert issues == [2], f"Expected only the timeout issue to be flagged, but got {issues}."
+
+            cur.execute("UPDATE ppe.task_issue_type SET threshold = 4 WHERE task_issue_type_id = 2;")
+            cur.execute("SELECT task_issue_type_id FROM ppe.task_issue WHERE task_id = 1 ORDER BY task_issue_type_id;")
+            assert cur.fetchall() == [], "Raising the threshold should clear the timeout issue."
+
+            cur.execute("UPDATE ppe.task SET timeout_seconds = 1 WHERE task_id = 1;")
+            cur.execute("SELECT task_issue_type_id FROM ppe.task_issue WHERE task_id = 1 ORDER BY task_issue_type_id;")
+            assert cur.fetchall() == [(6,)], "Lowering the timeout should flag the task as slow."
+
+
+def test_task_stats_clear_issues_on_success(pool_fixture: adapter.db.SessionPool):
+    with pool_fixture.getconn() as con:
+        with con.cursor() as cur:
+            cur.execute("""
+                INSERT INTO ppe.batch (batch_id) OVERRIDING SYSTEM VALUE VALUES (1);
+                INSERT INTO ppe.task (task_id, task_name, task_sql, retries, timeout_seconds) OVERRIDING SYSTEM VALUE VALUES (1, 'test_task', 'SELECT 1', 1, 60);
+                INSERT INTO ppe.job (job_id, batch_id, task_id) OVERRIDING SYSTEM VALUE VALUES (1, 1, 1), (2, 1, 1), (3, 1, 1), (4, 1, 1);
+            """)
+
+    db = adapter.db.open_db(batch_id=1, pools=adapter.db.Pools.shared(pool_fixture), days_logs_to_keep=3)
+    for job_id in (1, 2, 3):
+        db.log_job_error(job_id=job_id, return_code=1, error_message="boom", timed_out=False)
+    db.log_job_success(job_id=4, execution_millis=55_000)
+
+    with pool_fixture.getconn() as con:
+        with con.cursor() as cur:
+            cur.execute("SELECT task_issue_type_id FROM ppe.task_issue WHERE task_id = 1 ORDER BY task_issue_type_id;")
+            issues = [row[0] for row in cur.fetchall()]
+            assert issues == [6], f"Expected only the slow task issue to remain, but got {issues}."
+
+
+def test_claim_job(pool_fixture: adapter.db.SessionPool):
+    with pool_fixture.getconn() as con:
+        with con.cursor() as cur:
+            cur.execute("""
+                INSERT INTO ppe.batch (batch_id) OVERRIDING SYSTEM VALUE VALUES (1);
+                INSERT INTO ppe.task (task_id, task_name, task_sql, retries, timeout_seconds, enabled) OVERRIDING SYSTEM VALUE VALUES (1, 'test_task', 'SELECT 1', 1, 60, TRUE);
+                INSERT INTO ppe.schedule (schedule_id, schedule_name, min_seconds_between_attempts) OVERRIDING SYSTEM VALUE VALUES (1, 'every 10 seconds', 10);
+                INSERT INTO ppe.task_schedule (task_id, schedule_id) VALUES (1, 1);
+            """)
+
+    db = adapter.db.open_db(batch_id=1, pools=adapter.db.Pools.shared(pool_fixture), days_logs_to_keep=3)
+    db.update_queue()
+    queued_tasks = db.get_queued_tasks()
+    assert [t.name for t in queued_tasks] == ["test_task"]
+
+    job = db.claim_job(task_id=1)
+    assert job is not None and job.task.name == "test_task"
+    assert db.claim_job(task_id=1) is None, "A task should only be claimed once."
+
+
+def test_session_pool_replaces_terminated_connection(connection_str_fixture: str):
+    pool = adapter.db.SessionPool(1, 1, dsn=connection_str_fixture, name="test", idle_seconds_before_check=0)
+    try:
+        con = pool.getconn()
+        backend_pid = con.get_backend_pid()
+        pool.putconn(con)
+
+        with psycopg2.connect(connection_str_fixture) as admin_con:
+            with admin_con.cursor() as cur:
+                cur.execute("SELECT pg_terminate_backend(%(pid)s);", {"pid": backend_pid})
+
+        con = pool.getconn()
+        assert con.get_backend_pid() != backend_pid, "Expected the terminated connection to be replaced."
+        with con.cursor() as cur:
+            cur.execute("SHOW lock_timeout;")
+            assert cur.fetchone()[0] == "1min"
+        pool.putconn(con)
+    finally:
+        pool.closeall()
+
+
+def test_session_pool_waits_for_a_free_connection(connection_str_fixture: str):
+    pool = adapter.db.SessionPool(1, 1, dsn=connection_str_fixture, name="test", wait_seconds=0.5)
+    try:
+        con = pool.getconn()
+        with pytest.raises(psycopg2.pool.PoolError):
+            pool.getconn()
+
+        threading.Timer(0.1, pool.putconn, args=(con,)).start()
+        con = pool.getconn()
+        pool.putconn(con)
+    finally:
+        pool.closeall()
+
+
+def test_claim_task_turns_down_a_stale_queue_row(pool_fixture: adapter.db.SessionPool):
+    with pool_fixture.getconn() as con:
+        with con.cursor() as cur:
+            cur.execute("""
+                INSERT INTO ppe.batch (batch_id) OVERRIDING SYSTEM VALUE VALUES (1);
+                INSERT INTO ppe.task (task_id, task_name, task_sql, retries, timeout_seconds, enabled) OVERRIDING SYSTEM VALUE VALUES (1, 'test_task', 'SELECT 1', 1, 60, TRUE);
+                INSERT INTO ppe.schedule (schedule_id, schedule_name, min_seconds_between_attempts) OVERRIDING SYSTEM VALUE VALUES (1, 'every 10 seconds', 10);
+                INSERT INTO ppe.task_schedule (task_id, schedule_id) VALUES (1, 1);
+            """)
+
+    db = adapter.db.open_db(batch_id=1, pools=adapter.db.Pools.shared(pool_fixture), days_logs_to_keep=3)
+    db.update_queue()
+
+    # a claim that commits while the queue is being rebuilt, from a snapshot taken before it
+    with pool_fixture.getconn() as con:
+        with con.cursor() as cur:
+            cur.execute("INSERT INTO ppe.job (batch_id, task_id) VALUES (1, 1);")
+
+    assert db.claim_job(task_id=1) is None, "A task that already has a newer job should not be claimed again."
+
+
+def test_resource_usage_feeds_task_profile(pool_fixture: adapter.db.SessionPool):
+    with pool_fixture.getconn() as con:
+        with con.cursor() as cur:
+            cur.execute("""
+                INSERT INTO ppe.batch (batch_id) OVERRIDING SYSTEM VALUE VALUES (1);
+                INSERT INTO ppe.task (task_id, task_name, task_sql, retries, timeout_seconds) OVERRIDING SYSTEM VALUE VALUES (1, 'test_task', 'SELECT 1', 1, 60);
+                INSERT INTO ppe.job (job_id, batch_id, task_id) OVERRIDING SYSTEM VALUE VALUES (1, 1, 1), (2, 1, 1);
+            """)
+
+    db = adapter.db.open_db(batch_id=1, pools=adapter.db.Pools.shared(pool_fixture), days_logs_to_keep=3)
+    db.log_job_success(
+        job_id=1,
+        execution_millis=1000,
+        resource_usage=data.ResourceUsage(
+            wall_millis=1000,
+            user_cpu_millis=1500,
+            system_cpu_millis=500,
+            peak_rss_kb=2048,
+            block_reads=10,
+            block_writes=20,
+            voluntary_context_switches=3,
+            involuntary_context_switches=4,
+        ),
+    )
+    db.log_job_error(
+        job_id=2,
+        return_code=1,
+        error_message="boom",
+        timed_out=False,
+        resource_usage=data.ResourceUsage(wall_millis=500),
+    )
+
+    with pool_fixture.getconn() as con:
+        with con.cursor() as cur:
+            cur.execute("SELECT job_id, wall_millis, peak_rss_kb FROM ppe.job_resource_usage ORDER BY job_id;")
+            assert cur.fetchall() == [(1, 1000, 2048), (2, 500, None)]
+            cur.execute("""
+                SELECT samples, ewma_cpu_cores, max_peak_rss_kb, ewma_block_ios, ewma_context_switches
+                FROM ppe.task_resource_profile
+                WHERE task_id = 1;
+            """)
+            assert cur.fetchone() == (2, 2.0, 2048, 30, 7)
+
+
+def test_task_rollups_survive_log_cleanup(pool_fixture: adapter.db.SessionPool):
+    with pool_fixture.getconn() as con:
+        with con.cursor() as cur:
+            cur.execute("""
+                INSERT INTO ppe.batch (batch_id) OVERRIDING SYSTEM VALUE VALUES (1), (2);
+                INSERT INTO ppe.task (task_id, task_name, task_sql, retries, timeout_seconds) OVERRIDING SYSTEM VALUE VALUES (1, 'test_task', 'SELECT 1', 1, 60);
+                INSERT INTO ppe.job (job_id, batch_id, task_id) OVERRIDING SYSTEM VALUE VALUES (1, 1, 1), (2, 1, 1), (3, 1, 1), (4, 1, 1), (5, 1, 1);
+            """)
+
+    db = adapter.db.open_db(batch_id=1, pools=adapter.db.Pools.shared(pool_fixture), days_logs_to_keep=3)
+    db.log_job_success(job_id=1, execution_millis=1_000)
+    db.log_job_success(job_id=2, execution_millis=3_000, retries=1)
+    db.log_job_error(job_id=3, return_code=1, error_message="boom", timed_out=False, retries=1)
+    db.log_job_error(job_id=4, return_code=-1, error_message="Job timed out.", timed_out=True)
+    db.cancel_running_jobs(reason="test")
+
+    with pool_fixture.getconn() as con:
+        with con.cursor() as cur:
+            # age the raw history past retention, then clean it up from a later batch
+            cur.execute("UPDATE ppe.job SET ts = now() - INTERVAL '10 days'; UPDATE ppe.batch SET ts = now() - INTERVAL '10 days' WHERE batch_id = 1;")
+        con.commit()
+        pool_fixture.putconn(con)
+
+    adapter.db.open_db(batch_id=2, pools=adapter.db.Pools.shared(pool_fixture), days_logs_to_keep=3).delete_old_logs()
+
+    with pool_fixture.getconn() as con:
+        with con.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM ppe.job;")
+            assert cur.fetchone() == (0,)
+            for table in ("ppe.task_rollup_hourly", "ppe.task_rollup_daily"):
+                cur.execute(f"""
+                    SELECT successes, failures, timeouts, cancels, retries, runtime_sum_millis, runtime_min_millis, runtime_max_millis
+                    FROM {table}
+                    WHERE task_id = 1;
+                """)
+                assert cur.fetchall() == [(2, 2, 1, 1, 2, 4_000, 1_000, 3_000)], table
+            cur.execute("SELECT p50_runtime_millis, p95_runtime_millis FROM ppe.task_history_daily WHERE task_name = 'test_task';")
+            p50, p95 = cur.fetchone()
+            assert 512 <= p50 <= 2_048 and 2_048 <= p95 <= 4_096, (p50, p95)
+
+
+def test_skip_job_if_unchanged(pool_fixture: adapter.db.SessionPool):
+    with pool_fixture.getconn() as con:
+        with con.cursor() as cur:
+            cur.execute("""
+                INSERT INTO ppe.batch (batch_id) OVERRIDING SYSTEM VALUE VALUES (1);
+                INSERT INTO ppe.task (task_id, task_name, task_sql, fingerprint_sql, retries, timeout_seconds) OVERRIDING SYSTEM VALUE VALUES (1, 'test_task', 'SELECT 1', 'SELECT 42', 0, 60);
+                INSERT INTO ppe.job (job_id, batch_id, task_id) OVERRIDING SYSTEM VALUE VALUES (1, 1, 1), (2, 1, 1), (3, 1, 1), (4, 1, 1);
+            """)
+        con.commit()
+        pool_fixture.putconn(con)
+
+    db = adapter.db.open_db(batch_id=1, pools=adapter.db.Pools.shared(pool_fixture), days_logs_to_keep=3)
+    assert db.fetch_fingerprint(sql="SELECT 42, 'x'") == (42, "x")
+
+    assert not db.skip_job_if_unchanged(job_id=1, fingerprint="a"), "There is no earlier run to compare with."
+    db.log_job_success(job_id=1, execution_millis=1000)
+
+    assert db.skip_job_if_unchanged(job_id=2, fingerprint="a")
+    assert db.skip_job_if_unchanged(job_id=3, fingerprint="a"), "A skipped job should carry the fingerprint forward."
+    assert not db.skip_job_if_unchanged(job_id=4, fingerprint="b")
+
+    with pool_fixture.getconn() as con:
+        with con.cursor() as cur:
+            cur.execute("SELECT job_id FROM ppe.job_skip ORDER BY job_id;")
+            assert [row[0] for row in cur.fetchall()] == [2, 3]
+            cur.execute("SELECT SUM(skips) FROM ppe.task_rollup_daily;")
+            assert cur.fetchone()[0] == 2
+        pool_fixture.putconn(con)
+
+
+def test_job_results_are_recorded_once(pool_fixture: adapter.db.SessionPool):
+    with pool_fixture.getconn() as con:
+        with con.cursor() as cur:
+            cur.execute("""
+                INSERT INTO ppe.batch (batch_id) OVERRIDING SYSTEM VALUE VALUES (1);
+                INSERT INTO ppe.task (task_id, task_name, task_sql, retries, timeout_seconds) OVERRIDING SYSTEM VALUE VALUES (1, 'test_task', 'SELECT 1', 1, 60);
+                INSERT INTO ppe.job (job_id, batch_id, task_id) OVERRIDING SYSTEM VALUE VALUES (1, 1, 1), (2, 1, 1);
+            """)
+        con.commit()
+        pool_fixture.putconn(con)
+
+    db = adapter.db.open_db(batch_id=1, pools=adapter.db.Pools.shared(pool_fixture), days_logs_to_keep=3)
+    for _ in range(2):
+        db.log_job_success(job_id=1, execution_millis=1_000, resource_usage=data.ResourceUsage(wall_millis=1_000))
+        db.log_job_error(job_id=2, return_code=1, error_message="boom", timed_out=False)
+    db.log_job_cancelled(job_id=1, reason="A result replayed after the job was recorded should change nothing.")
+
+    with pool_fixture.getconn() as con:
+        with con.cursor() as cur:
+            cur.execute("""
+                SELECT
+                    (SELECT COUNT(*) FROM ppe.job_success)
+                ,   (SELECT COUNT(*) FROM ppe.job_failure)
+                ,   (SELECT COUNT(*) FROM ppe.job_cancel)
+                ,   (SELECT COUNT(*) FROM ppe.job_resource_usage)
+            """)
+            assert cur.fetchone() == (1, 1, 0, 1)
+            cur.execute("SELECT successes, failures, cancels FROM ppe.task_rollup_daily WHERE task_id = 1;")
+            assert cur.fetchall() == [(1, 1, 0)]
+
+
+def test_fetch_fingerprint_is_read_only(pool_fixture: adapter.db.SessionPool):
+    db = adapter.db.open_db(batch_id=1, pools=adapter.db.Pools.shared(pool_fixture), days_logs_to_keep=3)
+
+    assert db.fetch_fingerprint(sql="SELECT COUNT(*) FROM ppe.task;") == (0,)
+
+    with pytest.raises(psycopg2.errors.ReadOnlySqlTransaction):
+        db.fetch_fingerprint(sql="INSERT INTO ppe.resource (resource_name, capacity) VALUES ('sneaky', 1) RETURNING 1;")
+
+
+def test_late_results_are_recorded_at_the_time_they_finished(pool_fixture: adapter.db.SessionPool):
+    with pool_fixture.getconn() as con:
+        with con.cursor() as cur:
+            cur.execute("""
+                INSERT INTO ppe.batch (batch_id) OVERRIDING SYSTEM VALUE VALUES (1);
+                INSERT INTO ppe.task (task_id, task_name, task_sql, retries, timeout_seconds) OVERRIDING SYSTEM VALUE VALUES (1, 'test_task', 'SELECT 1', 1, 60);
+                INSERT INTO ppe.job (job_id, batch_id, task_id) OVERRIDING SYSTEM VALUE VALUES (1, 1, 1), (2, 1, 1);
+            """)
+        con.commit()
+        pool_fixture.putconn(con)
+
+    finished = datetime.datetime(2026, 1, 1, 12, 30, tzinfo=datetime.timezone.utc)
+    db = adapter.db.open_db(batch_id=1, pools=adapter.db.Pools.shared(pool_fixture), days_logs_to_keep=3)
+    db.log_job_success(job_id=1, execution_millis=1_000, ts=finished)
+    db.log_job_error(job_id=2, return_code=1, error_message="boom", timed_out=False, ts=finished)
+
+    with pool_fixture.getconn() as con:
+        with con.cursor() as cur:
+            cur.execute("""
+                SELECT ts FROM ppe.job_success
+                UNION ALL SELECT ts FROM ppe.job_failure
+                UNION ALL SELECT last_success_ts FROM ppe.task_stats
+                UNION ALL SELECT period_ts FROM ppe.task_rollup_hourly;
+            """)
+            assert {row[0] for row in cur.fetchall()} == {finished, finished.replace(minute=0)}
@@ -0,0 +1,125 @@
+import dataclasses
+import datetime
+import heapq
+import json
+import pathlib
+import statistics
+import typing
+
+from src import data
+from src.service import dispatch
+
+_EPOCH = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+
+_Ranker = typing.Callable[[list[data.QueuedTask], int, datetime.datetime], list[data.QueuedTask]]
+
+
+@dataclasses.dataclass(frozen=True)
+class _SimResult:
+    completed: int
+    mean_wait_seconds: float
+
+
+def _simulate(*, workload: dict[str, typing.Any], ranker: _Ranker) -> _SimResult:
+    """Replay the workload against a fixed number of runners, with each task becoming ready again
+    min_seconds_between_attempts after its previous run finishes, the way ppe.update_queue does."""
+    runners: int = workload["runners"]
+    horizon: int = workload["horizon_seconds"]
+    tasks = {t["task_id"]: t for t in workload["tasks"]}
+
+    ready_at = {task_id: 0 for task_id in tasks}
+    latest_attempt: dict[int, int] = {}
+    runs = {task_id: 0 for task_id in tasks}
+    running: list[tuple[int, int]] = []  # (finish second, task_id)
+    waits: list[int] = []
+    completed = 0
+    now = 0
+    while now < horizon:
+        while running and running[0][0] <= now:
+            _, task_id = heapq.heappop(running)
+            completed += 1
+            ready_at[task_id] = now + tasks[task_id]["min_seconds_between_attempts"]
+
+        queued = sorted(
+            (task_id for task_id, ts in ready_at.items() if ts is not None and ts <= now),
+            key=lambda task_id: (task_id not in latest_attempt, latest_attempt.get(task_id, 0), ready_at[task_id]),
+        )
+        candidates = [
+            _candidate(task=tasks[task_id], latest_attempt=latest_attempt.get(task_id), ready_at=ready_at[task_id])
+            for task_id in queued
+        ]
+        for candidate in ranker(candidates, runners - len(running), _EPOCH + datetime.timedelta(seconds=now)):
+            if len(running) >= runners:
+                break
+            task = tasks[candidate.task_id]
+            waits.append(now - typing.cast(int, ready_at[candidate.task_id]))
+            ready_at[candidate.task_id] = None  # type: ignore
+            latest_attempt[candidate.task_id] = now
+            runtimes = task["runtimes_seconds"]
+            heapq.heappush(running, (now + runtimes[runs[candidate.task_id] % len(runtimes)], candidate.task_id))
+            runs[candidate.task_id] += 1
+
+        next_events = [t for t in ready_at.values() if t is not None and t > now]
+        if running:
+            next_events.append(running[0][0])
+        now = min(next_events, default=horizon)
+
+    return _SimResult(completed=completed, mean_wait_seconds=statistics.mean(waits))
+
+
+def _candidate(*, task: dict[str, typing.Any], latest_attempt: int | None, ready_at: int) -> data.QueuedTask:
+    runtimes = sorted(task["runtimes_seconds"])
+    return data.QueuedTask(
+        task_id=task["task_id"],
+        name=task["name"],
+        latest_attempt_ts=None if latest_attempt is None else _EPOCH + datetime.timedelta(seconds=latest_attempt),
+        ready_ts=_EPOCH + datetime.timedelta(seconds=ready_at),
+        expected_millis=int(statistics.median(runtimes) * 1000),
+        p95_millis=runtimes[int(len(runtimes) * 0.95)] * 1000,
+        window_start_ts=None,
+        window_end_ts=None,
+        running_peer_millis=None,
+    )
+
+
+def test_runtime_aware_dispatch_beats_fifo_on_synthetic_workload():
+    """dispatch-workload.json is synthetic: its runtimes are drawn from seeded per-task distributions, shaped like a
+    mix of short extracts and long transforms, not captured from a production batch."""
+    with (pathlib.Path(__file__).parent / "dispatch-workload.json").open("r") as fh:
+        workload = json.load(fh)
+
+    fifo = _simulate(workload=workload, ranker=lambda candidates, free_runners, now: candidates)
+    ranked = _simulate(
+        workload=workload,
+        ranker=lambda candidates, free_runners, now: dispatch.rank(
+            candidates=candidates,
+            free_runners=free_runners,
+            now=now,
+            policy=dispatch.DispatchPolicy(),
+        ),
+    )
+
+    assert ranked.completed > fifo.completed * 2, (ranked, fifo)
+    assert ranked.mean_wait_seconds < fifo.mean_wait_seconds * 0.8, (
+        f"Expected ranking to cut the mean wait by at least 20%, but it went from {fifo.mean_wait_seconds:.0f}s "
+        f"to {ranked.mean_wait_seconds:.0f}s."
+    )
+
+
+def test_rank_defers_long_job_near_end_of_window():
+    now = _EPOCH + datetime.timedelta(minutes=50)
+    candidate = data.QueuedTask(
+        task_id=1,
+        name="test_task",
+        latest_attempt_ts=None,
+        ready_ts=None,
+        expected_millis=15 * 60 * 1000,
+        p95_millis=20 * 60 * 1000,
+        window_start_ts=_EPOCH + datetime.timedelta(minutes=1),
+        window_end_ts=_EPOCH + datetime.timedelta(minutes=60),
+        running_peer_millis=None,
+    )
+
+    ranked = dispatch.rank(candidates=[candidate], free_runners=1, now=now, policy=dispatch.DispatchPolicy())
+
+    assert ranked == []
@@ -0,0 +1,145 @@
+import datetime
+
+import pytest
+
+from src import data
+from src.service import forecast
+
+_UTC = datetime.timezone.utc
+
+
+def _schedule(*, schedule_id: int, start_hour: int, end_hour: int, min_seconds_between_attempts: int) -> data.Schedule:
+    return data.Schedule(
+        schedule_id=schedule_id,
+        name=f"schedule {schedule_id}",
+        start_ts=datetime.datetime(2000, 1, 1, tzinfo=_UTC),
+        end_ts=datetime.datetime(9999, 12, 31, tzinfo=_UTC),
+        start_month=1,
+        end_month=12,
+        start_month_day=1,
+        end_month_day=31,
+        start_week_day=1,
+        end_week_day=7,
+        start_hour=start_hour,
+        end_hour=end_hour,
+        start_minute=0,
+        end_minute=59,
+        min_seconds_between_attempts=min_seconds_between_attempts,
+    )
+
+
+def test_forecast_flags_windows_over_capacity():
+    plan = data.SchedulePlan(
+        resources=[data.Resource(resource_id=1, name="warehouse", capacity=2)],
+        schedules=[
+            _schedule(schedule_id=1, start_hour=2, end_hour=2, min_seconds_between_attempts=3600),
+            _schedule(schedule_id=2, start_hour=0, end_hour=23, min_seconds_between_attempts=6 * 3600),
+        ],
+        tasks=[
+            # three 30 minute tasks taking the warehouse at 02:00
+            *(
+                data.ScheduledTask(
+                    task_id=task_id,
+                    name=f"nightly {task_id}",
+                    schedule_ids=(1,),
+                    resource_units=((1, 1),),
+                    expected_millis=30 * 60 * 1000,
+                )
+                for task_id in (1, 2, 3)
+            ),
+            # a task without history, every 6 hours, that ran an hour before the forecast starts
+            data.ScheduledTask(
+                task_id=4,
+                name="hourly",
+                schedule_ids=(2,),
+                resource_units=(),
+                latest_attempt_ts=datetime.datetime(2024, 3, 3, 23, 0, tzinfo=_UTC),
+            ),
+        ],
+    )
+
+    f = forecast.forecast(
+        plan=plan,
+        runners=3,
+        start_ts=datetime.datetime(2024, 3, 4, 0, 0, 30, tzinfo=_UTC),
+        days=1,
+    )
+
+    assert f.start_ts == datetime.datetime(2024, 3, 4, tzinfo=_UTC)
+    assert f.tasks_without_history == 1
+
+    warehouse = f.load["warehouse"]
+    assert len(warehouse) == 24 * 60
+    assert warehouse[:120].max() == 0
+    assert (warehouse[120:150] == 3).all()
+    assert warehouse[150:].max() == 0
+
+    runners = f.runner_load
+    assert [m for m in range(len(runners)) if runners[m] and m not in range(120, 150)] == [301, 662, 1023, 1384]
+    assert runners[:150].max() == 3
+
+    assert f.overloads == [
+        forecast.Overload(
+            name="warehouse",
+            capacity=2,
+            start_ts=datetime.datetime(2024, 3, 4, 2, 0, tzinfo=_UTC),
+            end_ts=datetime.datetime(2024, 3, 4, 2, 30, tzinfo=_UTC),
+            peak=3,
+        )
+    ]
+    assert "warehouse" in forecast.render(f)
+
+
+def test_forecast_keeps_a_resource_named_runners_apart_from_the_runners():
+    plan = data.SchedulePlan(
+        resources=[data.Resource(resource_id=1, name="runners", capacity=5)],
+        schedules=[_schedule(schedule_id=1, start_hour=2, end_hour=2, min_seconds_between_attempts=3600)],
+        tasks=[
+            data.ScheduledTask(
+                task_id=1,
+                name="nightly",
+                schedule_ids=(1,),
+                resource_units=((1, 4),),
+                expected_millis=30 * 60 * 1000,
+            )
+        ],
+    )
+
+    f = forecast.forecast(plan=plan, runners=1, start_ts=datetime.datetime(2024, 3, 4, tzinfo=_UTC), days=1)
+
+    assert f.capacity == {"runners": 5}
+    assert f.load["runners"].max() == 4
+    assert f.runners == 1 and f.runner_load.max() == 1
+    assert f.overloads == []
+    assert f.to_json()["runners"]["peak"] == 1
+
+
+def test_forecast_reads_the_schedules_in_the_plans_time_zone():
+    plan = data.SchedulePlan(
+        resources=[],
+        schedules=[_schedule(schedule_id=1, start_hour=2, end_hour=2, min_seconds_between_attempts=3600)],
+        tasks=[
+            data.ScheduledTask(
+                task_id=1,
+                name="nightly",
+                schedule_ids=(1,),
+                resource_units=(),
+                expected_millis=30 * 60 * 1000,
+            )
+        ],
+        time_zone="Europe/Berlin",
+    )
+
+    # the clocks go forward at 02:00 on 2024-03-31, so Berlin has no 02:00 that night
+    f = forecast.forecast(plan=plan, runners=1, start_ts=datetime.datetime(2024, 3, 30, tzinfo=_UTC), days=3)
+
+    started = [m for m in range(1, len(f.runner_load)) if f.runner_load[m] and not f.runner_load[m - 1]]
+    # 02:00 in Berlin is 01:00 UTC in winter and 00:00 UTC in summer
+    assert started == [60, 2 * 24 * 60]
+
+
+def test_forecast_rejects_an_unknown_time_zone():
+    plan = data.SchedulePlan(resources=[], schedules=[], tasks=[], time_zone="Mars/Olympus_Mons")
+
+    with pytest.raises(ValueError, match="Mars/Olympus_Mons"):
+        forecast.forecast(plan=plan, runners=1, start_ts=datetime.datetime(2024, 3, 4, tzinfo=_UTC), days=1)
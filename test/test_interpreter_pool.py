@@ -0,0 +1,187 @@
+import json
+import pathlib
+import sys
+import textwrap
+import typing
+
+import pytest
+
+from src import data
+from src.service import interpreter_pool, supervisor
+
+
+@pytest.fixture(scope="function")
+def project_root_fixture(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> pathlib.Path:
+    # use the current interpreter instead of looking the env up with conda
+    monkeypatch.setattr(interpreter_pool, "_env_python", lambda env: sys.executable)
+
+    (tmp_path / "demo" / "src").mkdir(parents=True)
+    (tmp_path / "demo" / "src" / "__init__.py").write_text("")
+    (tmp_path / "demo" / "src" / "main.py").write_text(textwrap.dedent("""
+        import os
+
+        def main(out: str) -> None:
+            with open(out, "a") as fh:
+                fh.write(f"{os.getpid()}\\n")
+
+        def fail() -> None:
+            raise ValueError("boom")
+
+        def echo(out: str, **kwargs) -> None:
+            import json
+            with open(out, "w") as fh:
+                json.dump(kwargs, fh)
+
+        def allocate(mb: int) -> None:
+            buffer = b"x" * (mb << 20)
+            del buffer
+
+        def hang() -> None:
+            import time
+            time.sleep(60)
+    """))
+    return tmp_path
+
+
+@pytest.fixture(scope="function")
+def supervisor_fixture() -> typing.Generator[supervisor.Supervisor, None, None]:
+    sv = supervisor.Supervisor(grace_seconds=1)
+    sv.start()
+    yield sv
+    sv.stop()
+
+
+def _job(*, job_id: int, fn: str, fn_args: dict[str, typing.Any], timeout_seconds: int = 60) -> data.Job:
+    task = data.CondaProjectTask(
+        task_id=1,
+        name="demo",
+        timeout_seconds=timeout_seconds,
+        retries=0,
+        env="demo-env",
+        project_name="demo",
+        fn=fn,
+        fn_args=data.freeze_fn_args(fn_args),
+    )
+    return data.Job(job_id=job_id, batch_id=1, task=task)
+
+
+def test_interpreter_pool_reuses_warm_worker(
+    project_root_fixture: pathlib.Path,
+    supervisor_fixture: supervisor.Supervisor,
+):
+    out = project_root_fixture / "out.txt"
+    pool = interpreter_pool.InterpreterPool(
+        supervisor=supervisor_fixture,
+        project_root=project_root_fixture,
+        workers_per_env=1,
+        max_rss_mb=10_000,
+        max_calls_per_worker=10,
+    )
+    try:
+        for job_id in (1, 2):
+            result = pool.run(job=_job(job_id=job_id, fn="src.main", fn_args={"out": str(out)}), retries=0)
+            assert not result.is_err, result.error_message
+            assert result.resource_usage is not None and result.resource_usage.wall_millis >= 0
+
+        failed = pool.run(job=_job(job_id=3, fn="src.main.fail", fn_args={}), retries=0)
+        assert failed.is_err and "ValueError: boom" in (failed.error_message or "")
+    finally:
+        pool.close()
+
+    pids = out.read_text().split()
+    assert len(pids) == 2 and pids[0] == pids[1], f"Expected both runs to use the same worker, but got {pids}."
+
+
+def test_interpreter_pool_times_out_through_supervisor(
+    project_root_fixture: pathlib.Path,
+    supervisor_fixture: supervisor.Supervisor,
+):
+    pool = interpreter_pool.InterpreterPool(
+        supervisor=supervisor_fixture,
+        project_root=project_root_fixture,
+        workers_per_env=1,
+        max_rss_mb=10_000,
+        max_calls_per_worker=10,
+    )
+    try:
+        result = pool.run(job=_job(job_id=1, fn="src.main.hang", fn_args={}, timeout_seconds=1), retries=0)
+        assert result.timed_out
+        assert result.resource_usage is not None and result.resource_usage.wall_millis >= 900
+
+        # the killed worker is replaced
+        result = pool.run(job=_job(job_id=2, fn="src.main.fail", fn_args={}), retries=0)
+        assert result.is_err and "ValueError: boom" in (result.error_message or "")
+    finally:
+        pool.close()
+
+
+def test_interpreter_pool_passes_nested_fn_args(
+    project_root_fixture: pathlib.Path,
+    supervisor_fixture: supervisor.Supervisor,
+):
+    out = project_root_fixture / "out.json"
+    fn_args = {"out": str(out), "tables": ["a", "b"], "options": {"mode": "full", "limits": {"rows": 10}}}
+    pool = interpreter_pool.InterpreterPool(
+        supervisor=supervisor_fixture,
+        project_root=project_root_fixture,
+        workers_per_env=1,
+        max_rss_mb=10_000,
+        max_calls_per_worker=10,
+    )
+    try:
+        job = _job(job_id=1, fn="src.main.echo", fn_args=fn_args)
+        hash(job.task)  # nested fn_args keep the task hashable
+        result = pool.run(job=job, retries=0)
+        assert not result.is_err, result.error_message
+    finally:
+        pool.close()
+
+    assert json.loads(out.read_text()) == {k: v for k, v in fn_args.items() if k != "out"}
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="the per-call peak RSS needs /proc/self/clear_refs")
+def test_interpreter_pool_reports_peak_rss_per_call(
+    project_root_fixture: pathlib.Path,
+    supervisor_fixture: supervisor.Supervisor,
+):
+    out = project_root_fixture / "out.txt"
+    pool = interpreter_pool.InterpreterPool(
+        supervisor=supervisor_fixture,
+        project_root=project_root_fixture,
+        workers_per_env=1,
+        max_rss_mb=10_000,
+        max_calls_per_worker=10,
+    )
+    try:
+        big = pool.run(job=_job(job_id=1, fn="src.main.allocate", fn_args={"mb": 200}), retries=0)
+        small = pool.run(job=_job(job_id=2, fn="src.main", fn_args={"out": str(out)}), retries=0)
+    finally:
+        pool.close()
+
+    assert big.resource_usage is not None and small.resource_usage is not None
+    assert big.resource_usage.peak_rss_kb is not None and small.resource_usage.peak_rss_kb is not None
+    # the same worker ran both, but the small call is not charged with the big one's peak
+    assert big.resource_usage.peak_rss_kb - small.resource_usage.peak_rss_kb > 150 * 1024
+
+
+def test_interpreter_pool_recycles_worker_over_max_rss(
+    project_root_fixture: pathlib.Path,
+    supervisor_fixture: supervisor.Supervisor,
+):
+    out = project_root_fixture / "out.txt"
+    pool = interpreter_pool.InterpreterPool(
+        supervisor=supervisor_fixture,
+        project_root=project_root_fixture,
+        workers_per_env=1,
+        max_rss_mb=1,
+        max_calls_per_worker=10,
+    )
+    try:
+        for job_id in (1, 2):
+            result = pool.run(job=_job(job_id=job_id, fn="src.main", fn_args={"out": str(out)}), retries=0)
+            assert not result.is_err, result.error_message
+    finally:
+        pool.close()
+
+    pids = out.read_text().split()
+    assert len(pids) == 2 and pids[0] != pids[1], f"Expected the worker to be replaced, but got {pids}."
@@ -0,0 +1,140 @@
+import datetime
+import pathlib
+import typing
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.pool
+
+from src import data
+from src.adapter import journal
+
+
+class _FlakyDb:
+    """Records the journaled writes it is given, after failing the first `outages` of them with `error`."""
+
+    def __init__(self, *, outages: int, error: Exception | None = None) -> None:
+        self.outages = outages
+        self.error = error or data.DbUnavailableError("down", retry_after_seconds=0)
+        self.writes: list[tuple[str, dict[str, typing.Any]]] = []
+
+    def __getattr__(self, name: str) -> typing.Callable[..., None]:
+        def write(**kwargs: typing.Any) -> None:
+            if self.outages:
+                self.outages -= 1
+                raise self.error
+            self.writes.append((name, kwargs))
+
+        return write
+
+
+def _journaled_db(*, db: _FlakyDb, folder: pathlib.Path, batch_id: int = 1) -> journal.JournaledDb:
+    return journal.JournaledDb(
+        db=typing.cast(data.Db, db),
+        batch_id=batch_id,
+        journal=journal.Journal(folder=folder),
+        open_batch_db=lambda _: typing.cast(data.Db, db),
+    )
+
+
+def test_journaled_writes_are_replayed_in_order_after_an_outage(tmp_path: pathlib.Path):
+    db = _FlakyDb(outages=1)
+    jdb = _journaled_db(db=db, folder=tmp_path)
+    jdb.start()
+    try:
+        jdb.log_job_success(job_id=1, execution_millis=10, resource_usage=data.ResourceUsage(wall_millis=10))
+        jdb.log_job_error(job_id=2, return_code=1, error_message="boom", timed_out=False)
+        jdb.log_batch_info(message="done")
+    finally:
+        jdb.close()
+
+    assert [(op, args.get("job_id")) for op, args in db.writes] == [
+        ("log_job_success", 1),
+        ("log_job_error", 2),
+        ("log_batch_info", None),
+    ]
+    assert db.writes[0][1]["resource_usage"] == data.ResourceUsage(wall_millis=10)
+    assert (tmp_path / "journal.jsonl").read_text() == "", "Replayed entries should be truncated from the journal."
+
+
+def test_journal_keeps_unreplayed_writes_for_the_next_start(tmp_path: pathlib.Path):
+    down = _FlakyDb(outages=1_000)
+    jdb = _journaled_db(db=down, folder=tmp_path, batch_id=1)
+    jdb.log_job_success(job_id=1, execution_millis=10)
+    jdb.log_job_cancelled(job_id=2, reason="stopped")
+    jdb.close()
+    assert down.writes == []
+
+    # ppe stopped partway through writing an entry
+    with (tmp_path / "journal.jsonl").open("a") as fh:
+        fh.write('{"seq": 3, "batch_')
+
+    up = _FlakyDb(outages=0)
+    jdb = _journaled_db(db=up, folder=tmp_path, batch_id=2)
+    jdb.replay()
+    jdb.close()
+
+    assert [(op, args["job_id"]) for op, args in up.writes] == [("log_job_success", 1), ("log_job_cancelled", 2)]
+    assert journal.Journal(folder=tmp_path).pending(timeout_seconds=0) == []
+
+
+def test_replayed_writes_keep_the_time_they_were_journaled(tmp_path: pathlib.Path):
+    finished = datetime.datetime(2026, 1, 1, 12, 30, tzinfo=datetime.timezone.utc)
+    down = _FlakyDb(outages=1_000)
+    jdb = _journaled_db(db=down, folder=tmp_path)
+    jdb.log_job_success(job_id=1, execution_millis=10, ts=finished)
+    jdb.log_job_info(job_id=1, message="done")
+    jdb.close()
+
+    up = _FlakyDb(outages=0)
+    jdb = _journaled_db(db=up, folder=tmp_path, batch_id=2)
+    before_replay = datetime.datetime.now(datetime.timezone.utc)
+    jdb.replay()
+    jdb.close()
+
+    assert up.writes[0][1]["ts"] == finished
+    assert up.writes[1][1]["ts"] < before_replay
+
+
+def test_only_writes_the_database_rejects_are_dropped(tmp_path: pathlib.Path):
+    rejected = _FlakyDb(outages=1, error=psycopg2.IntegrityError("duplicate key"))
+    jdb = _journaled_db(db=rejected, folder=tmp_path)
+    jdb.log_job_info(job_id=1, message="first")
+    jdb.log_job_info(job_id=2, message="second")
+    jdb.replay()
+    jdb.close()
+    assert [args["job_id"] for _, args in rejected.writes] == [2]
+
+    # a pool that is exhausted says nothing about the write, so it is kept for the next start
+    exhausted = _FlakyDb(outages=1_000, error=psycopg2.pool.PoolError("all connections were in use"))
+    jdb = _journaled_db(db=exhausted, folder=tmp_path)
+    jdb.log_job_info(job_id=3, message="third")
+    jdb.start()
+    jdb.close(timeout_seconds=0.5)
+    assert exhausted.writes == []
+    assert [e.args["job_id"] for e in journal.Journal(folder=tmp_path).pending(timeout_seconds=0)] == [3]
+
+
+def test_a_write_the_database_refuses_does_not_hold_up_the_ones_behind_it(tmp_path: pathlib.Path):
+    # an ASSERT in a procedure fails with an InternalError, which is as final as any other answer from the server
+    refused = _FlakyDb(outages=1, error=psycopg2.errors.AssertFailure("p_message cannot be blank."))
+    jdb = _journaled_db(db=refused, folder=tmp_path)
+    jdb.start()
+    try:
+        jdb.log_batch_info(message="started")
+        jdb.log_job_success(job_id=1, execution_millis=10)
+    finally:
+        jdb.close(timeout_seconds=5)
+
+    assert [op for op, _ in refused.writes] == ["log_job_success"]
+    assert journal.Journal(folder=tmp_path).pending(timeout_seconds=0) == []
+
+
+def test_a_blank_batch_error_is_journaled_with_a_message(tmp_path: pathlib.Path):
+    db = _FlakyDb(outages=0)
+    jdb = _journaled_db(db=db, folder=tmp_path)
+    jdb.log_batch_error(error_message="")
+    jdb.replay()
+    jdb.close()
+
+    assert db.writes[0][1]["error_message"] == "No error message was provided."
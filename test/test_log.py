@@ -0,0 +1,72 @@
+import gzip
+import io
+import json
+import pathlib
+
+import loguru
+
+from src.adapter import log
+
+
+def _log_to(pipeline: log.LogPipeline, messages: list[str]) -> None:
+    handler_id = loguru.logger.add(pipeline.sink, level="INFO")
+    try:
+        with loguru.logger.contextualize(job_id=7):
+            for message in messages:
+                loguru.logger.info(message)
+    finally:
+        loguru.logger.remove(handler_id)
+
+
+def test_log_pipeline_writes_json_and_suppresses_repeats(tmp_path: pathlib.Path):
+    pipeline = log.LogPipeline(folder=tmp_path, console=io.StringIO(), max_repeats=3, repeat_window_seconds=3600)
+    pipeline.start()
+    _log_to(pipeline, ["retrying"] * 50)
+    pipeline.close()
+
+    records = [json.loads(line) for line in (tmp_path / "ppe.jsonl").read_text().splitlines()]
+    assert [r["message"] for r in records[:3]] == ["retrying"] * 3
+    assert all(r["job_id"] == 7 for r in records[:3])
+
+    # the window has not ended, so the count of what was suppressed is written on close
+    assert len(records) == 4
+    assert records[3]["level"] == "INFO" and records[3]["line"] == records[0]["line"]
+    assert records[3]["message"] == "retrying (repeated 47 more times, suppressed)"
+
+
+def test_log_pipeline_keeps_different_messages_from_one_line(tmp_path: pathlib.Path):
+    pipeline = log.LogPipeline(folder=tmp_path, console=None, max_repeats=3, repeat_window_seconds=3600)
+    pipeline.start()
+    # logged from one line, like the result of each task
+    _log_to(pipeline, [f"[task {i}] failed" for i in range(50)])
+    pipeline.close()
+
+    records = [json.loads(line) for line in (tmp_path / "ppe.jsonl").read_text().splitlines()]
+    assert [r["message"] for r in records] == [f"[task {i}] failed" for i in range(50)]
+
+
+def test_log_pipeline_counts_dropped_records_on_close(tmp_path: pathlib.Path):
+    pipeline = log.LogPipeline(folder=tmp_path, console=None, max_queued_records=1, max_repeats=100)
+    # the writer is not running yet, so everything after the first record finds the queue full
+    _log_to(pipeline, [f"message {i}" for i in range(5)])
+    pipeline.start()
+    pipeline.close()
+
+    records = [json.loads(line) for line in (tmp_path / "ppe.jsonl").read_text().splitlines()]
+    assert [r["message"] for r in records] == [
+        "message 0",
+        "4 log records were dropped because the log queue was full.",
+    ]
+
+
+def test_log_pipeline_rotates_and_compresses(tmp_path: pathlib.Path):
+    pipeline = log.LogPipeline(folder=tmp_path, console=None, batch_size=1, rotation_bytes=1)
+    pipeline.start()
+    _log_to(pipeline, [f"message {i}" for i in range(3)])
+    pipeline.close()
+
+    archives = sorted(tmp_path.glob("ppe.*.jsonl.gz"))
+    assert len(archives) == 2
+    archived = [json.loads(gzip.decompress(fp.read_bytes()))["message"] for fp in archives]
+    assert archived == ["message 0", "message 1"]
+    assert json.loads((tmp_path / "ppe.jsonl").read_text())["message"] == "message 2"
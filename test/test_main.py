@@ -0,0 +1,37 @@
+import pathlib
+import subprocess
+import sys
+import textwrap
+
+_PROJECT_ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+def test_spawned_job_process_imports_only_what_it_needs():
+    # the parent runs with src.main as its main module, as `python -m src.main` does, so the spawned child imports
+    # src/main.py again as __mp_main__ before it runs the target, and reports what that left loaded
+    code = textwrap.dedent("""
+        import importlib.util
+        import multiprocessing
+        import sys
+
+        sys.modules["__main__"].__spec__ = importlib.util.find_spec("src.main")
+
+        if __name__ == "__main__":
+            p = multiprocessing.get_context("spawn").Process(
+                target=exec,
+                args=("import sys; print(sorted(m for m in ('loguru', 'psycopg2', 'numpy') if m in sys.modules))",),
+            )
+            p.start()
+            p.join()
+            sys.exit(p.exitcode)
+    """)
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=_PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,98 @@
+import pathlib
+import threading
+import typing
+
+from src import data
+from src.service import runner, status
+
+
+class _InterpreterPool:
+    """Fails every run, setting stop the first time, the way a shutdown kills the job in hand."""
+
+    def __init__(self, *, stop: list[threading.Event]):
+        self.runs = 0
+        self._stop = stop
+
+    def run(self, *, job: data.Job, retries: int) -> data.JobResult:
+        self.runs += 1
+        for event in self._stop:
+            event.set()
+        return data.JobResult.error(job=job, code=-15, message="killed", retries=retries)
+
+
+class _Dispatcher:
+    def job_finished(self) -> None:
+        pass
+
+
+class _Db:
+    def __init__(self) -> None:
+        self.cancelled: list[int] = []
+        self.errors: list[int] = []
+
+    def log_job_cancelled(self, *, job_id: int, reason: str) -> None:
+        self.cancelled.append(job_id)
+
+    def log_job_error(self, *, job_id: int, **kwargs: typing.Any) -> None:
+        self.errors.append(job_id)
+
+
+def _job(*, retries: int) -> data.Job:
+    task = data.CondaProjectTask(
+        task_id=1,
+        name="demo",
+        timeout_seconds=60,
+        retries=retries,
+        env="demo-env",
+        project_name="demo",
+        fn="src.main",
+        fn_args=data.freeze_fn_args({}),
+    )
+    return data.Job(job_id=1, batch_id=1, task=task)
+
+
+def _runner(*, db: _Db, pool: _InterpreterPool, drain: threading.Event, abandon: threading.Event) -> runner.Runner:
+    return runner.Runner(
+        db=typing.cast(data.Db, db),
+        dispatcher=typing.cast(typing.Any, _Dispatcher()),
+        interpreter_pool=typing.cast(typing.Any, pool),
+        sql_target_pool=typing.cast(typing.Any, None),
+        supervisor=typing.cast(typing.Any, None),
+        status=status.StatusBoard(batch_id=1, max_jobs=1),
+        connection_str="",
+        tool_dir=pathlib.Path("."),
+        drain=drain,
+        abandon=abandon,
+        cancel=threading.Event(),
+    )
+
+
+def test_job_killed_by_shutdown_is_cancelled_without_retrying():
+    drain, abandon = threading.Event(), threading.Event()
+    db, pool = _Db(), _InterpreterPool(stop=[drain, abandon])
+
+    _runner(db=db, pool=pool, drain=drain, abandon=abandon)._run(job=_job(retries=3))
+
+    assert pool.runs == 1
+    assert db.cancelled == [1] and db.errors == []
+
+
+def test_failed_job_is_not_retried_while_draining():
+    drain, abandon = threading.Event(), threading.Event()
+    db, pool = _Db(), _InterpreterPool(stop=[drain])
+
+    _runner(db=db, pool=pool, drain=drain, abandon=abandon)._run(job=_job(retries=3))
+
+    # the job failed on its own, so it is recorded as a failure
+    assert pool.runs == 1
+    assert db.cancelled == [] and db.errors == [1]
+
+
+def test_failed_job_is_retried_otherwise():
+    drain, abandon = threading.Event(), threading.Event()
+    db, pool = _Db(), _InterpreterPool(stop=[])
+
+    _runner(db=db, pool=pool, drain=drain, abandon=abandon)._run(job=_job(retries=3))
+
+    assert pool.runs == 4
+    assert db.errors == [1]
@@ -0,0 +1,53 @@
+import threading
+import time
+import typing
+
+from src import data
+from src.service import scheduler, status
+
+
+class _SlowCleanupDb:
+    def __init__(self) -> None:
+        self.calls: list[str] = []
+        self.release_cleanup = threading.Event()
+
+    def __getattr__(self, name: str) -> typing.Callable[..., typing.Any]:
+        def record(**_: typing.Any) -> typing.Any:
+            self.calls.append(name)
+            return []
+
+        return record
+
+    def delete_old_logs(self) -> None:
+        self.calls.append("delete_old_logs")
+        self.release_cleanup.wait(timeout=10)
+
+
+def test_scheduler_updates_queue_while_cleanup_runs():
+    db = _SlowCleanupDb()
+    cancel = threading.Event()
+    s = scheduler.Scheduler(
+        db=typing.cast(data.Db, db),
+        seconds_between_updates=0,
+        seconds_between_cleanups=3600,
+        seconds_between_task_issue_updates=3600,
+        seconds_before_batch_abandoned=60,
+        status=status.StatusBoard(batch_id=1, max_jobs=1),
+        cancel=cancel,
+    )
+    s.start()
+    try:
+        deadline = time.monotonic() + 5
+        while db.calls.count("update_queue") < 2 and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+        assert db.calls[:2] == ["heartbeat", "update_queue"]
+        assert "delete_old_logs" in db.calls
+        assert "update_task_issues" not in db.calls
+        assert db.calls.count("update_queue") >= 2
+    finally:
+        db.release_cleanup.set()
+        cancel.set()
+        s.join()
+
+    assert "update_task_issues" in db.calls
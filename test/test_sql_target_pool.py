@@ -0,0 +1,73 @@
+import typing
+
+import pytest
+
+from src import data
+from src.service import sql_target_pool
+
+
+@pytest.fixture(scope="function")
+def target_pool_fixture(connection_str_fixture: str) -> typing.Generator[sql_target_pool.SqlTargetPool, None, None]:
+    pool = sql_target_pool.SqlTargetPool(
+        targets={
+            "test": data.SqlTarget(
+                name="test",
+                connection_str=connection_str_fixture,
+                max_connections=1,
+                idle_seconds=60,
+                connect_timeout_seconds=5,
+            ),
+        },
+    )
+    yield pool
+    pool.close()
+
+
+def _job(*, job_id: int, sql: str, target: str = "test", timeout_seconds: int = 60) -> data.Job:
+    task = data.SQLTask(task_id=1, name="demo", timeout_seconds=timeout_seconds, retries=0, sql=sql, target=target)
+    return data.Job(job_id=job_id, batch_id=1, task=task)
+
+
+def test_sql_target_jobs_reuse_a_warm_connection(target_pool_fixture: sql_target_pool.SqlTargetPool):
+    result = target_pool_fixture.run(
+        job=_job(job_id=1, sql="DROP TABLE IF EXISTS sql_target_backend; CREATE TABLE sql_target_backend (pid INT);"),
+        retries=0,
+    )
+    assert not result.is_err, result.error_message
+
+    sql = "INSERT INTO sql_target_backend SELECT pg_backend_pid(); CREATE TEMP TABLE scratch (id INT);"
+    for job_id in (2, 3):
+        # the temp table from the first job is discarded with the session state, so the second can create it again
+        result = target_pool_fixture.run(job=_job(job_id=job_id, sql=sql), retries=0)
+        assert not result.is_err, result.error_message
+
+    # both jobs ran on the same backend
+    result = target_pool_fixture.run(
+        job=_job(
+            job_id=4,
+            sql="""
+                DO $$ BEGIN
+                    ASSERT (SELECT COUNT(*) FROM sql_target_backend) = 2;
+                    ASSERT (SELECT COUNT(DISTINCT pid) FROM sql_target_backend) = 1;
+                END $$;
+                DROP TABLE sql_target_backend;
+            """,
+        ),
+        retries=0,
+    )
+    assert not result.is_err, result.error_message
+
+
+def test_sql_target_job_is_cancelled_at_its_timeout(target_pool_fixture: sql_target_pool.SqlTargetPool):
+    result = target_pool_fixture.run(job=_job(job_id=1, sql="SELECT pg_sleep(30);", timeout_seconds=1), retries=0)
+    assert result.timed_out
+
+    # the connection is still usable after the cancel
+    result = target_pool_fixture.run(job=_job(job_id=2, sql="SELECT 1;"), retries=0)
+    assert not result.is_err, result.error_message
+
+
+def test_unknown_sql_target_is_an_error(target_pool_fixture: sql_target_pool.SqlTargetPool):
+    result = target_pool_fixture.run(job=_job(job_id=1, sql="SELECT 1;", target="missing"), retries=0)
+    assert result.is_err
+    assert "missing" in (result.error_message or "")
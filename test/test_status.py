@@ -0,0 +1,45 @@
+import datetime
+
+from src import adapter, data
+from src.service import status
+
+
+def _job(*, job_id: int, name: str) -> data.Job:
+    task = data.SQLTask(task_id=job_id, name=name, timeout_seconds=60, retries=0, sql="SELECT 1")
+    return data.Job(job_id=job_id, batch_id=1, task=task)
+
+
+def test_status_server_serves_board_snapshot():
+    board = status.StatusBoard(batch_id=1, max_jobs=2)
+    board.job_started(job=_job(job_id=1, name="running task"))
+    board.job_started(job=_job(job_id=2, name="finished task"))
+    board.job_finished(result=data.JobResult.success(job=_job(job_id=2, name="finished task"), execution_millis=1500, retries=0))
+    board.queue_updated(queued_tasks=[
+        data.QueuedTask(
+            task_id=3,
+            name="queued task",
+            latest_attempt_ts=None,
+            ready_ts=datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc),
+            expected_millis=2000,
+            p95_millis=None,
+            window_start_ts=None,
+            window_end_ts=None,
+            running_peer_millis=None,
+        ),
+    ])
+    board.resources_updated(resources=[data.ResourceStatus(resource_id=1, name="db", capacity=3, reserved=1, available=2)])
+
+    server = adapter.status_server.StatusServer(port=0, snapshot=board.snapshot)
+    server.start()
+    try:
+        snapshot = adapter.status_server.fetch_status(port=server.port)
+    finally:
+        server.close()
+
+    assert [r["task_name"] for r in snapshot["running"]] == ["running task"]
+    assert [t["task_name"] for t in snapshot["queue"]] == ["queued task"]
+    assert snapshot["resources"][0]["reserved"] == 1
+    assert snapshot["recent_results"][0]["execution_millis"] == 1500
+
+    rendered = status.render(snapshot)
+    assert "running (1/2)" in rendered and "queued task" in rendered
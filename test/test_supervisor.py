@@ -0,0 +1,114 @@
+import os
+import pathlib
+import subprocess
+import sys
+import time
+import typing
+
+import pytest
+
+from src.service import supervisor
+
+
+@pytest.fixture(scope="function")
+def supervisor_fixture() -> typing.Generator[supervisor.Supervisor, None, None]:
+    sv = supervisor.Supervisor(grace_seconds=1)
+    sv.start()
+    yield sv
+    sv.stop()
+
+
+def _alive(pid: int, /) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="checks for the grandchild with POSIX signals")
+def test_supervisor_kills_process_tree(tmp_path: pathlib.Path, supervisor_fixture: supervisor.Supervisor):
+    grandchild_pid_file = tmp_path / "grandchild.pid"
+    # the child ignores SIGTERM, so only the forced stage can stop it
+    proc = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import signal, subprocess, sys, time\n"
+            "signal.signal(signal.SIGTERM, signal.SIG_IGN)\n"
+            "p = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])\n"
+            f"open({str(grandchild_pid_file)!r}, 'w').write(str(p.pid))\n"
+            "time.sleep(60)\n",
+        ],
+        **supervisor.popen_process_group_kwargs(),  # type: ignore[call-overload]
+    )
+    while not grandchild_pid_file.exists() or not grandchild_pid_file.read_text():
+        time.sleep(0.05)
+    grandchild_pid = int(grandchild_pid_file.read_text())
+
+    start = time.monotonic()
+    deadline = supervisor_fixture.watch(pid=proc.pid, name="sleepy", timeout_seconds=1)
+    proc.wait(timeout=10)
+    supervisor_fixture.release(deadline)
+
+    assert deadline.killed.is_set()
+    assert time.monotonic() - start >= 2, "Expected the child to outlast the polite signal."
+
+    for _ in range(100):
+        if not _alive(grandchild_pid):
+            break
+        time.sleep(0.05)
+    assert not _alive(grandchild_pid), "Expected the grandchild to be killed along with its parent."
+
+
+def test_supervisor_ignores_released_deadline(supervisor_fixture: supervisor.Supervisor):
+    proc = subprocess.Popen(
+        [sys.executable, "-c", "import time; time.sleep(3)"],
+        **supervisor.popen_process_group_kwargs(),  # type: ignore[call-overload]
+    )
+    deadline = supervisor_fixture.watch(pid=proc.pid, name="quick", timeout_seconds=1)
+    supervisor_fixture.release(deadline)
+
+    assert proc.wait(timeout=10) == 0
+    assert not deadline.killed.is_set()
+
+
+def test_supervisor_does_not_signal_after_release(
+    monkeypatch: pytest.MonkeyPatch,
+    supervisor_fixture: supervisor.Supervisor,
+):
+    signals: list[tuple[int, bool]] = []
+
+    def signal_tree(pid: int, /, *, force: bool) -> bool:
+        signals.append((pid, force))
+        return True
+
+    monkeypatch.setattr(supervisor, "_signal_tree", signal_tree)
+
+    deadline = supervisor_fixture.watch(pid=12345, name="exits on sigterm", timeout_seconds=1)
+    while not deadline.killed.is_set():
+        time.sleep(0.05)
+    supervisor_fixture.release(deadline)
+
+    time.sleep(1.5)
+    assert signals == [(12345, False)], "Expected no forced kill once the job was released, its pid may be reused."
+
+
+def test_supervisor_does_not_report_a_job_that_exited_at_its_deadline_as_killed(
+    monkeypatch: pytest.MonkeyPatch,
+    supervisor_fixture: supervisor.Supervisor,
+):
+    signals: list[tuple[int, bool]] = []
+
+    def signal_tree(pid: int, /, *, force: bool) -> bool:
+        signals.append((pid, force))
+        return False
+
+    monkeypatch.setattr(supervisor, "_signal_tree", signal_tree)
+
+    deadline = supervisor_fixture.watch(pid=12345, name="just in time", timeout_seconds=1)
+    time.sleep(2.5)
+    supervisor_fixture.release(deadline)
+
+    assert not deadline.killed.is_set()
+    assert signals == [(12345, False)]
@@ -0,0 +1,81 @@
+import json
+import pathlib
+import threading
+import time
+
+from src.service import trace
+
+
+def test_tracer_exports_chrome_trace_events(tmp_path: pathlib.Path):
+    tracer = trace.Tracer(enabled=True, max_events=2)
+
+    def run() -> None:
+        with tracer.span("execute", cat="job", job_id=1, task="a"):
+            tracer.instant("retry", cat="job", job_id=1, task="a", retry=1)
+        with tracer.span("result write", cat="job", job_id=1, task="a"):
+            pass
+
+    runner = threading.Thread(target=run, name="runner-1")
+    runner.start()
+    runner.join()
+
+    path = tracer.export(folder=tmp_path, batch_id=7, days_to_keep=1)
+
+    assert path == tmp_path / "trace-7-1.json"
+    trace_json = json.loads(path.read_text())
+    events = [e for e in trace_json["traceEvents"] if e["ph"] != "M"]
+    assert [(e["name"], e["ph"]) for e in events] == [("execute", "X"), ("result write", "X")]
+    assert events[0]["args"] == {"job_id": 1, "task": "a"}
+    assert events[0]["dur"] >= 0
+    assert {"name": "thread_name", "ph": "M", "pid": events[0]["pid"], "tid": events[0]["tid"], "args": {"name": "runner-1"}} in trace_json["traceEvents"]
+    assert trace_json["otherData"] == {"batch_id": 7, "part": 1, "dropped_events": 1}
+
+    # the next part only has what was recorded since
+    with tracer.span("update_queue", cat="scheduler"):
+        pass
+    trace_json = json.loads(tracer.export(folder=tmp_path, batch_id=7, days_to_keep=1).read_text())
+    assert [e["name"] for e in trace_json["traceEvents"] if e["ph"] != "M"] == ["update_queue"]
+    assert trace_json["otherData"] == {"batch_id": 7, "part": 2, "dropped_events": 0}
+
+
+def test_tracer_tells_threads_apart_when_their_ids_are_reused(tmp_path: pathlib.Path):
+    tracer = trace.Tracer(enabled=True)
+    for name in ("runner-1", "runner-2", "runner-3"):
+        thread = threading.Thread(target=lambda: tracer.instant("retry", cat="job"), name=name)
+        thread.start()
+        thread.join()
+
+    events = json.loads(tracer.export(folder=tmp_path, batch_id=1, days_to_keep=1).read_text())["traceEvents"]
+    names = {e["tid"]: e["args"]["name"] for e in events if e["name"] == "thread_name"}
+    assert [names[e["tid"]] for e in events if e["ph"] == "i"] == ["runner-1", "runner-2", "runner-3"]
+
+
+def test_tracer_exports_on_an_interval(tmp_path: pathlib.Path):
+    tracer = trace.Tracer(enabled=True)
+    tracer.start(folder=tmp_path, batch_id=3, days_to_keep=1, seconds_between_exports=0.1)
+    with tracer.span("execute", cat="job"):
+        pass
+    time.sleep(0.5)
+    with tracer.span("result write", cat="job"):
+        pass
+    last = tracer.close()
+
+    parts = sorted(tmp_path.glob("trace-3-*.json"), key=lambda fp: int(fp.stem.rsplit("-", 1)[1]))
+    assert len(parts) >= 3 and parts[-1] == last
+    names = [
+        e["name"]
+        for fp in parts
+        for e in json.loads(fp.read_text())["traceEvents"]
+        if e["ph"] != "M"
+    ]
+    assert names == ["execute", "result write"]
+
+
+def test_disabled_tracer_records_nothing(tmp_path: pathlib.Path):
+    tracer = trace.Tracer()
+    with tracer.span("execute", cat="job", job_id=1):
+        tracer.instant("retry", cat="job")
+
+    assert tracer.span("a", cat="b") is tracer.span("c", cat="d")
+    events = json.loads(tracer.export(folder=tmp_path, batch_id=1, days_to_keep=1).read_text())["traceEvents"]
+    assert [e["ph"] for e in events] == ["M"]
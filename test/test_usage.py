@@ -0,0 +1,20 @@
+import subprocess
+import sys
+
+import pytest
+
+from src.service import usage
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="getrusage is not available on Windows")
+def test_meter_counts_children_it_waited_on():
+    meter = usage.Meter(children_only=True)
+    subprocess.run(
+        [sys.executable, "-c", "import time\nend = time.process_time() + 0.3\nwhile time.process_time() < end: pass"],
+        check=True,
+    )
+    result = meter.usage()
+
+    assert result.wall_millis >= 300
+    assert (result.user_cpu_millis or 0) + (result.system_cpu_millis or 0) >= 250
+    assert result.peak_rss_kb is not None and result.peak_rss_kb > 0